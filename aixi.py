@@ -63,6 +63,7 @@ from pyaixi.agent import Agent
 from pyaixi.agents import *
 from pyaixi.environment import Environment
 from pyaixi.environments import *
+from pyaixi.prediction import ctw_mmap_context_tree, ctw_tree_file
 
 def interaction_loop(agent = None, environment = None, options = {}):
     """ The main agent/environment interaction loop.
@@ -462,6 +463,17 @@ def main(argv):
     else:
         interaction_loop(agent = agent, environment = environment, options = options)
     # end def
+
+    # Save the agent's context tree if asked to, so that a later run can start from it with 'ct-load-file'.
+    context_tree = getattr(agent, 'context_tree', None)
+    if context_tree is not None and options.get('ct-save-file', None) is not None:
+        ctw_tree_file.save_tree(context_tree, str(options['ct-save-file']))
+    # end if
+
+    # Write out a context tree kept in a node file, so that a later run can carry on from it.
+    if isinstance(context_tree, ctw_mmap_context_tree.CTWMmapContextTree):
+        context_tree.close()
+    # end if
 # end def
 
 def usage():
@@ -0,0 +1,1060 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A script for timing and comparing the context tree implementations used by the MC-AIXI-CTW agent.
+
+Usage: python ctw_benchmark.py [-b | --benchmark <benchmark name>]
+                               [-n | --symbols <number of symbols to update each tree with>]
+                               [-r | --runs <number of runs to take the best time of>]
+                               [-s | --random-seed <random seed>]
+                               [-t | --ct-depths <comma separated list of context tree depths>]
+
+The available benchmarks are:
+
+ - `adaptive-depth`: the time per symbol, log loss and depth of the contexts of each tenth of the updates of a
+   context tree of a fixed depth and of context trees with an adaptive depth, with several thresholds.
+ - `backends`: the time per symbol of updates and reverts with each context tree implementation.
+ - `compaction`: the time per symbol of search-like runs of updates undone by reverting them, with the
+   nodes left without visits removed straight away, and left as ghosts to be compacted once per cycle.
+ - `factored`: the log loss per percept, time per cycle and nodes of predicting and learning the percepts of
+   several environments, acting at random, with a single context tree and with a factored model of one
+   context tree per percept bit.
+ - `frozen`: the time per simulated symbol of search-like simulations after the learning period with the mutable
+   context trees and with a frozen context tree, keeping simulated updates as deltas or not updating it, and the
+   time taken to freeze the tree.
+ - `hashed`: the log loss, collided lookups and evictions of the hashed context tree with tables of several sizes.
+ - `history`: the time per symbol of search-like runs of updates and reverts after a long history, and the
+   memory used by the history, with the history kept in a list, a `CTWHistory` ring buffer and a
+   `BitPackedHistory`.
+ - `kt-table`: the time per symbol of updates and reverts with and without the cached log KT multipliers.
+ - `mmap`: the time per symbol of updates with the array-backed context tree and the one kept in a memory-mapped
+   node file, the size of the file, and the time taken to close it and reopen it.
+ - `node-pool`: the nodes allocated and reused, and the time per symbol, of search-like runs of updates
+   undone by reverting and by rolling back, with and without the pool of released nodes.
+ - `precision`: how far the predictions of the array-backed context tree storing its nodes in single precision
+   drift from those of the double precision one as the number of updates grows, and the memory of each.
+   (Use e.g. `-n 1000000` to check the drift over a million updates.)
+ - `prediction-cache`: the time per prediction, and the hits, misses and evictions of the prediction cache,
+   of search-like simulations predicting every two-symbol outcome at each step, with caches of several sizes.
+ - `pruning`: the log loss of context trees kept to node budgets of several sizes, with each pruning policy.
+ - `stream`: the throughput of training each context tree implementation with `update_stream()` from a
+   generator and from a file of packed bits.
+ - `symbol`: the log loss per percept and the time per cycle of predicting and learning the percepts of
+   several environments, acting at random, with the binary context tree and with the context tree over whole
+   actions and percepts with each of its priors, at depths covering the same number of bits.
+ - `tree-file`: the time taken to save a trained context tree to a tree file and to load it with each context
+   tree implementation that can, compared with pickling it, and the size of the file.
+ - `vectorized`: the time per symbol of updates with the array-backed context tree, updating the nodes of
+   each context one at a time and with NumPy array operations over the whole context path.
+ - `rollback`: the time per symbol of undoing short runs of updates by reverting them, and by rolling
+   back to a checkpoint.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import getopt
+import io
+import math
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+# Insert the current directory into the system search path, so that this package can be
+# imported when this script is run directly from a release archive.
+PROJECT_ROOT = os.path.realpath(os.curdir)
+sys.path.insert(0, PROJECT_ROOT)
+
+from pyaixi import util
+from pyaixi.agents.mc_aixi_ctw import context_tree_backends
+from pyaixi.prediction import ctw_array_context_tree, ctw_context_tree, ctw_factored_context_tree, ctw_frozen_context_tree
+from pyaixi.prediction import ctw_hashed_context_tree, ctw_history
+from pyaixi.prediction import ctw_mmap_context_tree, ctw_suffix_context_tree, ctw_symbol_context_tree, ctw_tree_file
+from pyaixi.environments import coin_flip, kuhn_poker, RPS, tiger
+
+def generate_interactions(environment, cycle_count):
+    """ Returns a list of the (action symbols, percept symbols) pairs of the given number of cycles of
+        acting at random in the given environment, encoded as `MC_AIXI_CTW_Agent` encodes them.
+
+        - `environment`: the environment to act in.
+        - `cycle_count`: the number of cycles.
+    """
+
+    interactions = []
+    for cycle in range(cycle_count):
+        action = random.choice(environment.valid_actions)
+        environment.perform_action(action)
+        percept = util.encode(environment.reward, environment.reward_bits()) + \
+                  util.encode(environment.observation, environment.observation_bits())
+        interactions.append((util.encode(action, environment.action_bits()), percept))
+    # end for
+
+    return interactions
+# end def
+
+def generate_symbols(symbol_count):
+    """ Returns a list of symbols from a simple source with some context structure:
+        each symbol repeats the symbol two steps before it with probability 0.8.
+
+        - `symbol_count`: the number of symbols to generate.
+    """
+
+    symbol_list = [0, 1]
+    for i in range(2, symbol_count):
+        if random.random() < 0.8:
+            symbol_list.append(symbol_list[i - 2])
+        else:
+            symbol_list.append(1 - symbol_list[i - 2])
+        # end if
+    # end for
+
+    return symbol_list[:symbol_count]
+# end def
+
+def benchmark_adaptive_depth(options):
+    """ Prints the time per symbol and the log loss per symbol of predicting each benchmark symbol and then
+        updating the tree with it, and the mean depth of the contexts updated, over each tenth of the symbols,
+        for a context tree of each given depth, with a fixed depth and with adaptive depths of several
+        thresholds. Each line also has the deepest context updated so far, and the size of the tree.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    report_interval = max(1, symbol_count // 10)
+
+    print("depth, threshold, updates, time (us/symbol), log loss (bits/symbol), mean context depth, " +
+          "effective depth, nodes")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+
+        for threshold in (None, 2, ctw_context_tree.adaptive_depth_threshold, 32):
+            tree = ctw_context_tree.CTWContextTree(depth)
+            tree.set_adaptive_depth(threshold)
+
+            start = 0
+            while start < symbol_count:
+                symbols = symbol_list[start:start + report_interval]
+                depth_counts = list(tree.context_depth_counts)
+
+                begin = time.time()
+                bits = log_loss(tree, symbols)
+                interval_time = (time.time() - begin) / len(symbols)
+
+                # the depths of the contexts of the updates in this interval
+                counts = [count - previous for count, previous in zip(tree.context_depth_counts, depth_counts)]
+                updates = sum(counts)
+                mean_depth = sum([d * count for d, count in enumerate(counts)]) / updates if updates > 0 else 0.0
+
+                start += len(symbols)
+                print("%d, %s, %d, %.2f, %.4f, %.2f, %d, %d" %
+                      (depth, "fixed" if threshold is None else str(threshold), start, interval_time * 1e6,
+                       bits / len(symbols), mean_depth, tree.effective_depth, tree.size()))
+            # end while
+        # end for
+    # end for
+# end def
+
+def benchmark_backends(options):
+    """ Prints the time per symbol of updating a context tree and reverting those updates, for each
+        of the context tree implementations the agent can use, at each of the given depths.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+
+    print("depth, backend, update (us/symbol), revert (us/symbol)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+
+        for backend in sorted(context_tree_backends.keys()):
+            # Take the best of several runs.
+            update_time = revert_time = float('inf')
+            for run in range(options["runs"]):
+                tree = context_tree_backends[backend](depth)
+
+                start = time.time()
+                tree.update(symbol_list)
+                update_time = min(update_time, (time.time() - start) / symbol_count)
+
+                start = time.time()
+                tree.revert(symbol_count)
+                revert_time = min(revert_time, (time.time() - start) / symbol_count)
+            # end for
+
+            print("%d, %s, %.2f, %.2f" % (depth, backend, update_time * 1e6, revert_time * 1e6))
+        # end for
+    # end for
+# end def
+
+def log_loss(tree, symbol_list):
+    """ Returns the number of bits needed to encode the given symbols with the predictions of the given
+        context tree, which is updated with them.
+
+        - `tree`: the context tree.
+        - `symbol_list`: the symbols to predict and update the tree with.
+    """
+
+    bits = 0.0
+    for symbol in symbol_list:
+        bits -= math.log(tree.predict(symbol), 2)
+        tree.update([symbol])
+    # end for
+
+    return bits
+# end def
+
+def benchmark_compaction(options):
+    """ Prints the time per symbol of runs of 100 updates each reverted straight away, as in the search
+        simulations, with the nodes left without visits removed immediately and with deferred pruning,
+        compacting the tree after every 100 runs (a cycle), at each of the given depths. Also prints
+        the most ghost nodes left in the tree before a compaction, and the time of the compactions.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    run_length = 100
+    cycle_length = 100
+
+    print("depth, pruning, nodes, max ghost nodes, update and revert (us/symbol), compaction (us/symbol)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+        runs = [symbol_list[i:i + run_length] for i in range(0, symbol_count, run_length)]
+        history = generate_symbols(symbol_count)
+
+        for deferred in (False, True):
+            tree = ctw_context_tree.CTWContextTree(depth)
+            tree.update(history)
+            tree.set_deferred_pruning(deferred)
+
+            max_ghost_nodes = 0
+            elapsed = compaction_time = 0.0
+            for i, run_symbols in enumerate(runs):
+                start = time.time()
+                tree.update(run_symbols)
+                tree.revert(len(run_symbols))
+                elapsed += time.time() - start
+
+                if (i + 1) % cycle_length == 0 or i == len(runs) - 1:
+                    max_ghost_nodes = max(max_ghost_nodes, tree.ghost_nodes)
+                    start = time.time()
+                    tree.compact()
+                    compaction_time += time.time() - start
+                # end if
+            # end for
+
+            print("%d, %s, %d, %d, %.2f, %.2f" % (depth, "deferred" if deferred else "immediate", tree.size(),
+                                                  max_ghost_nodes, elapsed / symbol_count * 1e6,
+                                                  compaction_time / symbol_count * 1e6))
+        # end for
+    # end for
+# end def
+
+def benchmark_factored(options):
+    """ Prints the log loss per percept, the time per cycle and the number of nodes of predicting each percept
+        of a random run in several environments and then learning it, with a single context tree and with
+        a factored model of one context tree per percept bit, at each of the given depths.
+        Each run has as many cycles as fit in the benchmark symbols.
+
+        - `options`: the benchmark options.
+    """
+
+    environment_classes = (coin_flip.CoinFlip, kuhn_poker.KuhnPoker, RPS.RPS, tiger.Tiger)
+
+    print("environment, depth, model, log loss (bits/percept), time (us/cycle), nodes")
+    for environment_class in environment_classes:
+        for depth in options["ct-depths"]:
+            random.seed(options["random-seed"])
+            environment = environment_class(options = {})
+            cycle_bits = environment.action_bits() + environment.percept_bits()
+            interactions = generate_interactions(environment, max(1, options["symbols"] // cycle_bits))
+
+            for name, tree in (("single", ctw_context_tree.CTWContextTree(depth)),
+                               ("factored", ctw_factored_context_tree.CTWFactoredContextTree(
+                                   depth, environment.percept_bits()))):
+                bits = 0.0
+                start = time.time()
+                for action, percept in interactions:
+                    tree.update_history(action)
+                    bits -= math.log(tree.predict(percept), 2)
+                    tree.update(percept)
+                # end for
+                cycle_time = (time.time() - start) / len(interactions)
+
+                print("%s, %d, %s, %.4f, %.2f, %d" % (environment_class.__name__, depth, name,
+                                                      bits / len(interactions), cycle_time * 1e6, tree.size()))
+            # end for
+        # end for
+    # end for
+# end def
+
+def benchmark_frozen(options):
+    """ Prints the time per simulated symbol of search-like simulations with the 'object' and 'array' context
+        trees, and with a frozen copy of the 'object' one, keeping the simulated updates as deltas ('deltas')
+        or not updating it ('fixed'), at each of the given depths, with the hit rate of the frozen tree's
+        predictions and the time taken to freeze it.
+
+        Each tree is trained on the benchmark symbols. Then, for each of 10 cycles, 50 simulations of 8
+        steps, each adding two random action symbols to the history and sampling and updating the tree
+        with two percept symbols, are rolled back to a checkpoint taken at the start of the cycle.
+        The cycle ends by adding two more benchmark symbols to the history, as after the learning period.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    cycle_count = 10
+    simulation_count = 50
+    horizon = 8
+
+    print("depth, tree, time (us/symbol), hit rate, freeze time (ms)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count + 2 * cycle_count)
+
+        for name in ("object", "array", "deltas", "fixed"):
+            tree_class = ctw_array_context_tree.CTWArrayContextTree if name == "array" else ctw_context_tree.CTWContextTree
+            tree = tree_class(depth)
+            tree.update(symbol_list[:symbol_count])
+
+            freeze_time = 0.0
+            if name in ("deltas", "fixed"):
+                start = time.time()
+                tree = ctw_frozen_context_tree.CTWFrozenContextTree(tree, learning = (name == "deltas"))
+                freeze_time = time.time() - start
+            # end if
+
+            random.seed(options["random-seed"])
+            start = time.time()
+            for cycle in range(cycle_count):
+                token = tree.checkpoint()
+                for simulation in range(simulation_count):
+                    for step in range(horizon):
+                        tree.update_history([random.randint(0, 1), random.randint(0, 1)])
+                        tree.generate_random_symbols_and_update(2)
+                    # end for
+                    tree.rollback(token)
+                # end for
+                tree.release_checkpoint(token)
+
+                tree.update_history(symbol_list[symbol_count + 2 * cycle:symbol_count + 2 * cycle + 2])
+            # end for
+            elapsed = time.time() - start
+
+            simulated_symbols = cycle_count * simulation_count * horizon * 2
+            if name in ("deltas", "fixed"):
+                hit_rate = "%.3f" % (tree.cache_hits / max(1, tree.cache_hits + tree.cache_misses))
+            else:
+                hit_rate = "-"
+            # end if
+            print("%d, %s, %.2f, %s, %.1f" % (depth, name, elapsed / simulated_symbols * 1e6, hit_rate, freeze_time * 1e3))
+        # end for
+    # end for
+# end def
+
+def benchmark_hashed(options):
+    """ Prints the log loss per symbol, number of nodes, collided lookups and evictions of the hashed context tree
+        with tables of several sizes, and each collision policy, at each of the given depths.
+        The first line for each depth is for an unbounded `CTWContextTree`.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+
+    print("depth, policy, memory (KB), log loss (bits/symbol), nodes, collided lookups, evictions")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+
+        tree = ctw_context_tree.CTWContextTree(depth)
+        bits = log_loss(tree, symbol_list)
+        print("%d, unbounded, -, %.4f, %d, 0, 0" % (depth, bits / symbol_count, tree.size()))
+
+        for policy in ctw_hashed_context_tree.collision_policies:
+            for memory_kb in (16, 64, 256, 1024):
+                tree = ctw_hashed_context_tree.CTWHashedContextTree(depth, memory_kb * 1024, policy)
+                bits = log_loss(tree, symbol_list)
+                print("%d, %s, %d, %.4f, %d, %d, %d" % (depth, policy, memory_kb, bits / symbol_count,
+                                                        tree.size(), tree.collided_lookups, tree.evictions))
+            # end for
+        # end for
+    # end for
+# end def
+
+def benchmark_history(options):
+    """ Prints the time per symbol of runs of 100 updates each reverted straight away, as in the search
+        simulations, after a history of the given number of symbols, and the memory used by the history,
+        with the history kept in a list, a `CTWHistory` ring buffer and a `BitPackedHistory`, at each of
+        the given depths.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    run_length = 100
+
+    print("depth, history, memory (KB), update and revert (us/symbol)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+        runs = [symbol_list[i:i + run_length] for i in range(0, symbol_count, run_length)]
+        history = generate_symbols(symbol_count)
+
+        for store in ("list", "ring", "packed"):
+            tree = ctw_context_tree.CTWContextTree(depth)
+            if store == "ring":
+                tree.set_history(ctw_history.CTWHistory(depth + run_length))
+            elif store == "packed":
+                tree.set_history(ctw_history.BitPackedHistory(depth))
+            # end if
+            tree.update(history)
+
+            if store == "ring":
+                memory = sys.getsizeof(tree.history.symbols)
+            elif store == "packed":
+                memory = sys.getsizeof(tree.history.bits)
+            else:
+                memory = sys.getsizeof(tree.history) + sum([sys.getsizeof(symbol) for symbol in set(tree.history)])
+            # end if
+
+            # Take the best of several runs.
+            elapsed = float('inf')
+            for run in range(options["runs"]):
+                start = time.time()
+                for run_symbols in runs:
+                    tree.update(run_symbols)
+                    tree.revert(len(run_symbols))
+                # end for
+                elapsed = min(elapsed, time.time() - start)
+            # end for
+
+            print("%d, %s, %.1f, %.2f" % (depth, store, memory / 1024, elapsed / symbol_count * 1e6))
+        # end for
+    # end for
+# end def
+
+def benchmark_kt_table(options):
+    """ Prints the time per symbol of updating a context tree and reverting those updates, with and
+        without the cache of log KT multipliers, at each of the given depths.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    default_limit = ctw_context_tree.log_kt_table_limit
+
+    print("depth, table, update (us/symbol), revert (us/symbol)")
+    for depth in options["ct-depths"]:
+        timings = {}
+        for table in (False, True):
+            ctw_context_tree.set_log_kt_table_limit(default_limit if table else 0)
+
+            random.seed(options["random-seed"])
+            symbol_list = generate_symbols(symbol_count)
+
+            # Take the best of several runs. The first run also fills the table.
+            update_time = revert_time = float('inf')
+            for run in range(options["runs"]):
+                tree = ctw_context_tree.CTWContextTree(depth)
+
+                start = time.time()
+                tree.update(symbol_list)
+                update_time = min(update_time, (time.time() - start) / symbol_count)
+
+                start = time.time()
+                tree.revert(symbol_count)
+                revert_time = min(revert_time, (time.time() - start) / symbol_count)
+            # end for
+
+            timings[table] = (update_time, revert_time)
+            print("%d, %s, %.2f, %.2f" % (depth, str(table), update_time * 1e6, revert_time * 1e6))
+        # end for
+
+        print("%d, speedup, %.2fx, %.2fx" % (depth, timings[False][0] / timings[True][0],
+                                               timings[False][1] / timings[True][1]))
+    # end for
+
+    ctw_context_tree.set_log_kt_table_limit(default_limit)
+# end def
+
+def benchmark_mmap(options):
+    """ Prints the time per symbol of updating the array-backed context tree and a context tree kept in a
+        memory-mapped node file, at each of the given depths, together with the size of the node file and
+        the time taken to close the file and reopen the tree from it.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+
+    print("depth, update array (us/symbol), update mmap (us/symbol), file size (bytes), close (ms), reopen (ms)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+
+        tree = ctw_array_context_tree.CTWArrayContextTree(depth)
+        start = time.time()
+        tree.update(symbol_list)
+        array_time = (time.time() - start) / symbol_count
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "tree.ctw")
+        tree = ctw_mmap_context_tree.CTWMmapContextTree(depth, path)
+        start = time.time()
+        tree.update(symbol_list)
+        mmap_time = (time.time() - start) / symbol_count
+
+        start = time.time()
+        tree.close()
+        close_time = time.time() - start
+        file_size = os.path.getsize(path)
+
+        start = time.time()
+        tree = ctw_mmap_context_tree.CTWMmapContextTree(depth, path)
+        reopen_time = time.time() - start
+        tree.close()
+
+        os.remove(path)
+        os.rmdir(directory)
+
+        print("%d, %.2f, %.2f, %d, %.2f, %.2f" % (depth, array_time * 1e6, mmap_time * 1e6, file_size,
+                                                  close_time * 1e3, reopen_time * 1e3))
+    # end for
+# end def
+
+def benchmark_node_pool(options):
+    """ Prints the number of nodes allocated and reused, and the time per symbol, of runs of 100 updates
+        each undone straight away, as in the search simulations, by reverting them and by rolling back
+        to a checkpoint, with and without the pool of released nodes, at each of the given depths.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    run_length = 100
+
+    print("depth, undo, pool, allocated nodes, reused nodes, time (us/symbol)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+        runs = [symbol_list[i:i + run_length] for i in range(0, symbol_count, run_length)]
+        history = generate_symbols(symbol_count)
+
+        for undo in ("revert", "rollback"):
+            for pool in (False, True):
+                tree = ctw_context_tree.CTWContextTree(depth)
+                if not pool:
+                    tree.node_pool_limit = 0
+                # end if
+                tree.update(history)
+                allocated_nodes = tree.allocated_nodes
+
+                start = time.time()
+                for run_symbols in runs:
+                    if undo == "revert":
+                        tree.update(run_symbols)
+                        tree.revert(len(run_symbols))
+                    else:
+                        token = tree.checkpoint()
+                        tree.update(run_symbols)
+                        tree.rollback(token)
+                        tree.release_checkpoint(token)
+                    # end if
+                # end for
+                elapsed = time.time() - start
+
+                print("%d, %s, %s, %d, %d, %.2f" % (depth, undo, str(pool), tree.allocated_nodes - allocated_nodes,
+                                                    tree.reused_nodes, elapsed / symbol_count * 1e6))
+            # end for
+        # end for
+    # end for
+# end def
+
+def benchmark_precision(options):
+    """ Prints the largest and mean absolute difference between the probability of a one predicted by the
+        array-backed context tree in double precision and in each other precision, over each tenth of the
+        updates with the benchmark symbols, at each of the given depths. Each line also has the log loss
+        per symbol of that tenth with each tree, and the memory of their node arrays at the end of it.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    report_interval = max(1, symbol_count // 10)
+
+    print("depth, precision, updates, max drift, mean drift, log loss double (bits/symbol), " +
+          "log loss (bits/symbol), node memory double (bytes), node memory (bytes)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+
+        for precision in sorted(ctw_array_context_tree.precisions.keys()):
+            if precision == 'double':
+                continue
+            # end if
+
+            reference = ctw_array_context_tree.CTWArrayContextTree(depth)
+            tree = ctw_array_context_tree.CTWArrayContextTree(depth, precision)
+            max_drift = total_drift = reference_bits = bits = 0.0
+            for count, symbol in enumerate(symbol_list, 1):
+                reference_probability = reference.predict([1])
+                probability = tree.predict([1])
+                drift = abs(probability - reference_probability)
+                max_drift = max(max_drift, drift)
+                total_drift += drift
+                reference_bits -= math.log(reference_probability if symbol == 1 else 1.0 - reference_probability, 2)
+                bits -= math.log(probability if symbol == 1 else 1.0 - probability, 2)
+
+                reference.update([symbol])
+                tree.update([symbol])
+
+                if count % report_interval == 0 or count == symbol_count:
+                    interval = count % report_interval or report_interval
+                    memory = [sum([column.itemsize * len(column) for column in
+                                   t.symbol_count + t.child + [t.log_kt, t.log_probability]])
+                              for t in (reference, tree)]
+                    print("%d, %s, %d, %.3g, %.3g, %.4f, %.4f, %d, %d" %
+                          (depth, precision, count, max_drift, total_drift / interval, reference_bits / interval,
+                           bits / interval, memory[0], memory[1]))
+                    max_drift = total_drift = reference_bits = bits = 0.0
+                # end if
+            # end for
+        # end for
+    # end for
+# end def
+
+def benchmark_prediction_cache(options):
+    """ Prints the time per prediction and the hits, misses and evictions of the prediction cache, for
+        search-like runs at each of the given depths, without a cache and with caches of several sizes.
+
+        The tree is trained on the benchmark symbols. Then, for each of 20 cycles, 50 simulations are each
+        rolled back to a checkpoint taken at the start of the cycle. At each of the 8 steps of a simulation,
+        every two-symbol outcome is predicted, as when the agent finds the probability of each percept, then
+        the tree is updated with two random symbols. The cycle ends by updating the tree with two more
+        benchmark symbols. Only the predictions are timed.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    cycle_count = 20
+    simulation_count = 50
+    horizon = 8
+    outcomes = [util.encode(value, 2) for value in range(4)]
+
+    print("depth, cache size, time (us/prediction), hit rate, hits, misses, evictions")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count + 2 * cycle_count)
+
+        for cache_size in (None, 16, 256, ctw_context_tree.prediction_cache_size):
+            tree = ctw_context_tree.CTWContextTree(depth)
+            tree.update(symbol_list[:symbol_count])
+            tree.set_prediction_cache(cache_size)
+
+            random.seed(options["random-seed"])
+            elapsed = 0.0
+            predictions = 0
+            for cycle in range(cycle_count):
+                token = tree.checkpoint()
+                for simulation in range(simulation_count):
+                    for step in range(horizon):
+                        start = time.time()
+                        for outcome in outcomes:
+                            tree.predict(outcome)
+                        # end for
+                        elapsed += time.time() - start
+                        predictions += len(outcomes)
+
+                        tree.update([random.randint(0, 1), random.randint(0, 1)])
+                    # end for
+                    tree.rollback(token)
+                # end for
+                tree.release_checkpoint(token)
+
+                tree.update(symbol_list[symbol_count + 2 * cycle:symbol_count + 2 * cycle + 2])
+            # end for
+
+            if cache_size is None:
+                print("%d, none, %.2f, -, -, -, -" % (depth, elapsed / predictions * 1e6))
+            else:
+                print("%d, %d, %.2f, %.3f, %d, %d, %d" % (depth, cache_size, elapsed / predictions * 1e6,
+                                                         tree.cache_hits / predictions, tree.cache_hits,
+                                                         tree.cache_misses, tree.cache_evictions))
+            # end if
+        # end for
+    # end for
+# end def
+
+def benchmark_pruning(options):
+    """ Prints the log loss per symbol, number of nodes and number of nodes pruned, for context trees kept to
+        node budgets of several sizes with each pruning policy, at each of the given depths. The first line
+        for each depth is for an unbounded tree.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+
+    print("depth, policy, max nodes, log loss (bits/symbol), nodes, pruned nodes")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+
+        tree = ctw_context_tree.CTWContextTree(depth)
+        bits = log_loss(tree, symbol_list)
+        unbounded_size = tree.size()
+        print("%d, unbounded, -, %.4f, %d, 0" % (depth, bits / symbol_count, unbounded_size))
+
+        for policy in ctw_context_tree.pruning_policies:
+            for fraction in (0.5, 0.25, 0.1):
+                max_nodes = max(int(unbounded_size * fraction), 2 * (depth + 1))
+                tree = ctw_context_tree.CTWContextTree(depth)
+                tree.set_node_budget(max_nodes, policy = policy)
+                bits = log_loss(tree, symbol_list)
+                print("%d, %s, %d, %.4f, %d, %d" % (depth, policy, max_nodes, bits / symbol_count,
+                                                    tree.size(), tree.pruned_nodes))
+            # end for
+        # end for
+    # end for
+# end def
+
+def benchmark_rollback(options):
+    """ Prints the time per symbol of undoing runs of 100 updates, as done after each search simulation,
+        by reverting the updates and by rolling back to a checkpoint, at each of the given depths.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+    run_length = 100
+
+    print("depth, revert (us/symbol), rollback (us/symbol), speedup")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+        runs = [symbol_list[i:i + run_length] for i in range(0, symbol_count, run_length)]
+
+        tree = ctw_context_tree.CTWContextTree(depth)
+        tree.update(generate_symbols(symbol_count))
+
+        # Take the best of several runs, timing only the undo step.
+        revert_time = rollback_time = float('inf')
+        for run in range(options["runs"]):
+            elapsed = 0.0
+            for run_symbols in runs:
+                tree.update(run_symbols)
+                start = time.time()
+                tree.revert(len(run_symbols))
+                elapsed += time.time() - start
+            # end for
+            revert_time = min(revert_time, elapsed / symbol_count)
+
+            elapsed = 0.0
+            token = tree.checkpoint()
+            for run_symbols in runs:
+                tree.update(run_symbols)
+                start = time.time()
+                tree.rollback(token)
+                elapsed += time.time() - start
+            # end for
+            tree.release_checkpoint(token)
+            rollback_time = min(rollback_time, elapsed / symbol_count)
+        # end for
+
+        print("%d, %.2f, %.2f, %.2fx" % (depth, revert_time * 1e6, rollback_time * 1e6, revert_time / rollback_time))
+    # end for
+# end def
+
+def benchmark_stream(options):
+    """ Prints the throughput, in symbols per second, of training a context tree with `update_stream()`
+        from a generator of symbols and from a file of packed bits, with each of the context tree
+        implementations the agent can use, at each of the given depths.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+
+    print("depth, backend, source, throughput (symbols/s)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+        packed = bytearray([sum([symbol << bit for bit, symbol in enumerate(symbol_list[i:i + 8])])
+                            for i in range(0, symbol_count, 8)])
+
+        for backend in sorted(context_tree_backends.keys()):
+            # the context tree over whole symbols isn't trained from streams of bits
+            if backend == 'symbol':
+                continue
+            # end if
+
+            for source in ("generator", "file"):
+                # Keep the throughput reported after the last chunk.
+                throughput = [0.0]
+                def progress(count, rate):
+                    throughput[0] = rate
+                # end def
+
+                tree = context_tree_backends[backend](depth)
+                if source == "generator":
+                    tree.update_stream((symbol for symbol in symbol_list), progress = progress)
+                else:
+                    tree.update_stream(io.BytesIO(bytes(packed)), progress = progress)
+                # end if
+
+                print("%d, %s, %s, %.0f" % (depth, backend, source, throughput[0]))
+            # end for
+        # end for
+    # end for
+# end def
+
+def benchmark_symbol(options):
+    """ Prints the log loss per percept and the time per cycle of predicting each percept of a random run in
+        several environments and then learning it, with the binary context tree at each of the given depths,
+        and the context tree over whole actions and percepts, with each of its priors, at the depth in symbols
+        covering as many bits.
+        Each run has as many cycles as fit in the benchmark symbols.
+
+        - `options`: the benchmark options.
+    """
+
+    environment_classes = (coin_flip.CoinFlip, kuhn_poker.KuhnPoker, RPS.RPS, tiger.Tiger)
+
+    print("environment, depth (bits), depth (symbols), tree, log loss (bits/percept), time (us/cycle), nodes")
+    for environment_class in environment_classes:
+        for depth in options["ct-depths"]:
+            random.seed(options["random-seed"])
+            environment = environment_class(options = {})
+            cycle_bits = environment.action_bits() + environment.percept_bits()
+            interactions = generate_interactions(environment, max(1, options["symbols"] // cycle_bits))
+            symbol_depth = max(2, (2 * depth + cycle_bits - 1) // cycle_bits)
+
+            trees = [("binary", ctw_context_tree.CTWContextTree(depth))]
+            for prior in ctw_symbol_context_tree.symbol_priors:
+                trees.append(("symbol " + prior, ctw_symbol_context_tree.CTWSymbolContextTree(
+                    symbol_depth, environment.percept_bits(), prior)))
+            # end for
+
+            for name, tree in trees:
+                bits = 0.0
+                start = time.time()
+                for action, percept in interactions:
+                    tree.update_history(action)
+                    bits -= math.log(tree.predict(percept), 2)
+                    tree.update(percept)
+                # end for
+                cycle_time = (time.time() - start) / len(interactions)
+
+                print("%s, %d, %d, %s, %.4f, %.2f, %d" % (environment_class.__name__, depth, symbol_depth, name,
+                                                          bits / len(interactions), cycle_time * 1e6, tree.size()))
+            # end for
+        # end for
+    # end for
+# end def
+
+def benchmark_tree_file(options):
+    """ Prints the time taken to save a context tree trained on the benchmark symbols to a tree file, and to
+        load it into each of the context tree implementations that can be loaded from one, at each of the given
+        depths, together with the size of the file and the time taken to pickle and unpickle the tree.
+
+        - `options`: the benchmark options.
+    """
+
+    symbol_count = options["symbols"]
+
+    print("depth, nodes, format, file size (bytes), save (ms), load object (ms), load suffix (ms), " +
+          "load array (ms), map mmap (ms)")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+
+        tree = ctw_context_tree.CTWContextTree(depth)
+        tree.update(symbol_list)
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "tree.ctw")
+
+        start = time.time()
+        ctw_tree_file.save_tree(tree, path)
+        save_time = time.time() - start
+
+        load_times = []
+        for tree_class in (ctw_context_tree.CTWContextTree, ctw_suffix_context_tree.CTWSuffixContextTree,
+                           ctw_array_context_tree.CTWArrayContextTree):
+            start = time.time()
+            ctw_tree_file.load_tree(path, tree_class)
+            load_times.append(time.time() - start)
+        # end for
+
+        start = time.time()
+        mapped_tree = ctw_mmap_context_tree.CTWMmapContextTree(depth, path, copy_on_write = True)
+        load_times.append(time.time() - start)
+        mapped_tree.close()
+
+        print("%d, %d, tree file, %d, %.2f, %s" % (depth, tree.tree_size, os.path.getsize(path), save_time * 1e3,
+                                                   ", ".join(["%.2f" % (t * 1e3) for t in load_times])))
+        os.remove(path)
+        os.rmdir(directory)
+
+        # Pickling follows the nodes recursively, so allow for the depth of the tree.
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 100 * (depth + 1)))
+        start = time.time()
+        data = pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+        save_time = time.time() - start
+        start = time.time()
+        pickle.loads(data)
+        load_time = time.time() - start
+
+        print("%d, %d, pickle, %d, %.2f, %.2f, -, -, -" % (depth, tree.tree_size, len(data), save_time * 1e3,
+                                                           load_time * 1e3))
+    # end for
+# end def
+
+def benchmark_vectorized(options):
+    """ Prints the time per symbol of updating the array-backed context tree one node at a time and with
+        the vectorized update, at each of the given depths, and the largest difference between the
+        probabilities they predict afterwards.
+
+        - `options`: the benchmark options.
+    """
+
+    if ctw_array_context_tree.numpy is None:
+        print("The vectorized update needs NumPy, which isn't installed.")
+        return
+    # end if
+
+    symbol_count = options["symbols"]
+
+    print("depth, update nodes (us/symbol), update vectorized (us/symbol), speedup, max difference")
+    for depth in options["ct-depths"]:
+        random.seed(options["random-seed"])
+        symbol_list = generate_symbols(symbol_count)
+
+        # Take the best of several runs.
+        times = [float('inf'), float('inf')]
+        for run in range(options["runs"]):
+            trees = []
+            for vectorized in (False, True):
+                tree = ctw_array_context_tree.CTWArrayContextTree(depth)
+                tree.set_vectorized(vectorized)
+                start = time.time()
+                tree.update(symbol_list)
+                times[vectorized] = min(times[vectorized], (time.time() - start) / symbol_count)
+                trees.append(tree)
+            # end for
+        # end for
+
+        difference = max([abs(trees[0].predict(symbols) - trees[1].predict(symbols))
+                          for symbols in ([0], [1], [0, 1], [1, 1, 0])])
+        print("%d, %.2f, %.2f, %.2f, %.3g" % (depth, times[0] * 1e6, times[1] * 1e6, times[0] / times[1], difference))
+    # end for
+# end def
+
+# The benchmarks that can be run, indexed by name.
+benchmarks = {
+    "adaptive-depth": benchmark_adaptive_depth,
+    "backends": benchmark_backends,
+    "compaction": benchmark_compaction,
+    "factored": benchmark_factored,
+    "frozen": benchmark_frozen,
+    "hashed": benchmark_hashed,
+    "history": benchmark_history,
+    "kt-table": benchmark_kt_table,
+    "mmap": benchmark_mmap,
+    "node-pool": benchmark_node_pool,
+    "precision": benchmark_precision,
+    "prediction-cache": benchmark_prediction_cache,
+    "pruning": benchmark_pruning,
+    "rollback": benchmark_rollback,
+    "stream": benchmark_stream,
+    "symbol": benchmark_symbol,
+    "tree-file": benchmark_tree_file,
+    "vectorized": benchmark_vectorized,
+}
+
+def main(argv):
+    """ Entry point of the program. Parses the options and runs the chosen benchmark.
+
+        If invalid arguments or options are given, it prints usage help information
+        to the standard output and exits.
+    """
+
+    # Define some default configuration values.
+    options = {}
+    options["benchmark"]   = "kt-table"
+    options["ct-depths"]   = [4, 16, 30]
+    options["random-seed"] = 0
+    options["runs"]        = 3
+    options["symbols"]     = 20000
+
+    try:
+        opts, args = getopt.gnu_getopt(argv, 'b:n:r:s:t:',
+                                       ['benchmark=', 'symbols=', 'runs=', 'random-seed=', 'ct-depths='])
+
+        for opt, arg in opts:
+            if opt in ('-b', '--benchmark'):
+                options["benchmark"] = str(arg)
+                continue
+            # end if
+            if opt in ('-n', '--symbols'):
+                options["symbols"] = int(arg)
+                continue
+            # end if
+            if opt in ('-r', '--runs'):
+                options["runs"] = int(arg)
+                continue
+            # end if
+            if opt in ('-s', '--random-seed'):
+                options["random-seed"] = int(arg)
+                continue
+            # end if
+            if opt in ('-t', '--ct-depths'):
+                options["ct-depths"] = [int(depth) for depth in arg.split(',')]
+                continue
+            # end if
+        # end for
+    except (getopt.GetoptError, ValueError) as e:
+        # We got an incorrect option. Show the usage and exit.
+        usage()
+    # end try
+
+    if options["benchmark"] not in benchmarks:
+        print("Unknown benchmark '%s'." % options["benchmark"])
+        usage()
+    # end if
+
+    benchmarks[options["benchmark"]](options)
+# end def
+
+def usage():
+    """ Prints usage information.
+    """
+
+    message = "Usage: python ctw_benchmark.py [-b | --benchmark <benchmark name>]" + os.linesep + \
+              "                               [-n | --symbols <number of symbols to update each tree with>]" + os.linesep + \
+              "                               [-r | --runs <number of runs to take the best time of>]" + os.linesep + \
+              "                               [-s | --random-seed <random seed>]" + os.linesep + \
+              "                               [-t | --ct-depths <comma separated list of context tree depths>]" + os.linesep + \
+              os.linesep + \
+              "Benchmarks: " + ", ".join(sorted(benchmarks.keys())) + os.linesep
+
+    sys.stderr.write(message)
+    sys.exit(2)
+# end def
+
+
+# Start the main function if this file has been executed, and not just imported.
+if __name__ == "__main__":
+    main(sys.argv[1:])
+# end def
@@ -24,11 +24,24 @@ from six.moves import xrange
 from pyaixi import agent, prediction, search, util
 
 from pyaixi.agent import update_enum, action_update, percept_update
-from pyaixi.prediction import ctw_context_tree
+from pyaixi.prediction import ctw_array_context_tree, ctw_beta_context_tree, ctw_context_tree, ctw_factored_context_tree
+from pyaixi.prediction import ctw_frozen_context_tree, ctw_hashed_context_tree, ctw_history, ctw_mmap_context_tree
+from pyaixi.prediction import ctw_suffix_context_tree
+from pyaixi.prediction import ctw_symbol_context_tree, ctw_tree_file
 from pyaixi.search import monte_carlo_search_tree
 
 from pyaixi.search.monte_carlo_search_tree import nodetype_enum, chance_node, decision_node, MonteCarloSearchNode
 
+# The context tree implementations that can be chosen with the 'ct-backend' option.
+context_tree_backends = {
+    'object': ctw_context_tree.CTWContextTree,
+    'array': ctw_array_context_tree.CTWArrayContextTree,
+    'beta': ctw_beta_context_tree.CTWBetaContextTree,
+    'hashed': ctw_hashed_context_tree.CTWHashedContextTree,
+    'mmap': ctw_mmap_context_tree.CTWMmapContextTree,
+    'suffix': ctw_suffix_context_tree.CTWSuffixContextTree,
+    'symbol': ctw_symbol_context_tree.CTWSymbolContextTree,
+}
 
 
 class MC_AIXI_CTW_Undo:
@@ -37,8 +50,11 @@ class MC_AIXI_CTW_Undo:
 
     # Instance methods.
 
-    def __init__(self, agent):
+    def __init__(self, agent, checkpoint=None):
         """ Store values from the given agent that can be used to revert that agent to a previous state.
+
+             - `checkpoint`: a token from the agent's `context_tree.checkpoint()`, used to roll back
+                             the context tree in one step, or None to revert its updates one by one.
         """
 
         # Copy the main attributes of the given agent into this class.
@@ -46,6 +62,7 @@ class MC_AIXI_CTW_Undo:
         self.total_reward = agent.total_reward
         self.history_size = agent.history_size()
         self.last_update = agent.last_update
+        self.checkpoint = checkpoint
     # end def
 
 
@@ -62,6 +79,7 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         It uses this internal model to to predict the probability of future outcomes:
 
          - `get_predicted_action_probability()`
+         - `percept_distribution()`
          - `percept_probability()`
 
         as well as to generate actions and precepts according to the model distribution:
@@ -121,6 +139,109 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             The following options are optional:
              - `learning-period`: the number of cycles the agent should learn for.
                                   Defaults to '0', which is indefinite learning.
+             - `ct-adaptive-threshold`: for the 'object' context tree, the number of symbols a context must see
+                                       before the longer contexts below it are used, so that the depth of the
+                                       tree grows with the data, up to `ct-depth`. Defaults to none, which
+                                       always uses contexts of `ct-depth` symbols.
+                                       (See `CTWContextTree.set_adaptive_depth()`.)
+             - `ct-backend`: the context tree implementation to use, one of the keys of
+                             `context_tree_backends`. Defaults to 'object', which stores
+                             one Python object per node. 'array' stores the nodes in flat
+                             typed arrays, using much less memory for deep trees.
+                             'beta' stores probability ratios rather than log probabilities
+                             in each node, avoiding a `math.log` and `math.exp` per node.
+                             'suffix' finds the nodes of each context in a hash map keyed by the
+                             recent history, rather than following child links from the root.
+                             'hashed' keeps the nodes in a hash table of a fixed size, so memory use
+                             stays bounded for deep trees, at some cost in accuracy once it is full.
+                             'mmap' stores the nodes in a memory-mapped file, so the tree can grow
+                             larger than memory and be reopened by later runs.
+                             'symbol' predicts whole percepts rather than bits, with contexts made of
+                             whole actions and percepts, so it walks one context path per percept.
+             - `ct-collision-policy`: for the 'hashed' context tree, what happens when a context finds
+                                      no free slot in the table: 'replace' (the default) evicts the least
+                                      visited node nearby, 'share' shares the statistics of another node.
+             - `ct-compaction`: when nodes left without visits by reverts are removed from an 'object' or
+                                'suffix' context tree. Defaults to 'immediate', which removes them straight
+                                away. 'cycle' leaves them in the tree and removes them once per cycle, after
+                                the search. 'threshold' removes them once there are more than
+                                `ct-max-ghost-nodes` of them.
+             - `ct-freeze`: whether searches after the learning period run against a frozen copy of the context
+                            tree, compiled into flat arrays when the learning period ends, with the predictions
+                            of each context kept. (See `ctw_frozen_context_tree`.) Defaults to 'none', which
+                            searches with the context tree itself. 'deltas' keeps the updates of each simulation
+                            as deltas over the frozen tree, which predicts exactly as the context tree would.
+                            'fixed' doesn't update the frozen tree during simulations either, as the agent
+                            doesn't update its model after the learning period, so every prediction is kept.
+                            Needs a 'learning-period', and a single 'object', 'array', 'mmap' or 'suffix'
+                            context tree with a fixed depth.
+             - `ct-history`: how the context tree keeps its history. Defaults to 'list', which keeps every
+                             symbol in a list. 'packed' keeps every symbol in a `BitPackedHistory`,
+                             using about 1/64 of the memory. 'ring' keeps only the most recent symbols,
+                             in a `CTWHistory` ring buffer of `ct-history-capacity` symbols.
+             - `ct-history-archive`: for the 'ring' history, the path of a file to write older symbols to.
+                                     Defaults to none, which discards them.
+             - `ct-history-capacity`: the number of symbols the 'ring' history keeps. Defaults to the
+                                      context tree depth plus the symbols of one more cycle than the
+                                      agent horizon, the fewest a search needs.
+             - `ct-kt-table-mb`: the memory limit, in megabytes, of the cache of log KT multipliers
+                                 shared by all context trees. Defaults to 16. 0 disables the cache.
+             - `ct-load-file`: the path of a context tree saved by an earlier run (see `ct-save-file`), which
+                               the agent starts from instead of an empty tree. Its depth must be `ct-depth`.
+                               An 'mmap' context tree maps the file without reading it, and never changes it.
+                               Not supported by the 'beta', 'hashed' and 'symbol' context trees.
+                               Defaults to none.
+             - `ct-max-bytes`: the estimated memory, in bytes, the nodes of an 'object' or 'suffix' context
+                               tree may use before subtrees are pruned. Defaults to no limit.
+             - `ct-max-ghost-nodes`: the number of nodes left without visits above which they are removed,
+                                     for the 'threshold' compaction. Defaults to 100000.
+             - `ct-max-nodes`: the number of nodes an 'object' or 'suffix' context tree may have before
+                               subtrees are pruned. Defaults to no limit.
+             - `ct-memory-mb`: the size, in megabytes, of the table of the 'hashed' context tree.
+                               Defaults to 64.
+             - `ct-model`: how the percepts are modelled. Defaults to 'single', which predicts every percept bit
+                           with the same context tree. 'factored' predicts each bit of the percepts with a
+                           context tree of its own, conditioned on the history and the earlier bits of the
+                           percept. (See `ctw_factored_context_tree`.) Only the 'object', 'array', 'beta'
+                           and 'suffix' context trees can be factored.
+             - `ct-mmap-file`: for the 'mmap' context tree, the path of the node file. If it holds a tree
+                               saved by an earlier run, the agent carries on from that tree. Defaults to
+                               none, which keeps the nodes in a temporary file.
+             - `ct-mmap-hot-nodes`: for the 'mmap' context tree, the number of nodes nearest the root to
+                                    read ahead from the node file. Defaults to 16384.
+             - `ct-symbol-depth`: the depth of the 'symbol' context tree, in actions and percepts. Defaults to
+                                  the number of whole actions and percepts in `ct-depth` bits, at least one
+                                  cycle's worth.
+             - `ct-symbol-prior`: the prior of the estimators of the 'symbol' context tree: 'kt' (the default),
+                                  'sparse', which learns faster when few of the possible percepts occur, or
+                                  a pseudo-count. (See `ctw_symbol_context_tree.symbol_priors`.)
+             - `ct-update`: how an 'array' or 'mmap' context tree updates the nodes of a context. Defaults to
+                            'nodes', which updates them one at a time. 'vectorized' updates the whole context
+                            path with a few NumPy array operations, which is faster for deep trees.
+             - `ct-save-file`: the path `aixi.py` saves the agent's context tree to at the end of a run,
+                               in the format of `ctw_tree_file`. Not supported by the 'beta', 'hashed' and
+                               'symbol' context trees. Defaults to none, which doesn't save it.
+             - `ct-precision`: the precision the 'array' context tree stores its node statistics in, one of the
+                               keys of `ctw_array_context_tree.precisions`. Defaults to 'double'. 'single'
+                               stores 4-byte counts and floats, halving the memory of each node.
+             - `ct-prediction-cache`: the number of recent predictions the context tree keeps, so that repeated
+                                      predictions of the same tree don't walk it again. Not supported by the
+                                      'symbol' context tree. Defaults to none, which caches no predictions.
+                                      (See `CTWContextTree.set_prediction_cache()`.)
+             - `ct-pruning-policy`: which subtrees are pruned to keep to `ct-max-nodes` or `ct-max-bytes`.
+                                    Defaults to 'lru', which prunes the least recently visited contexts.
+                                    'visits' prunes the contexts visited fewer than `ct-pruning-threshold`
+                                    times (doubling the threshold as needed).
+             - `ct-pruning-threshold`: the number of visits for the 'visits' pruning policy. Defaults to 2.
+             - `percept-sampling`: how percepts are sampled from the context tree.
+                                   Defaults to 'bitwise', which draws a random number per percept bit.
+                                   'single-draw' draws each whole percept with one random number.
+             - `search-undo`: how the context tree is restored after each search simulation.
+                              Defaults to 'checkpoint', which rolls back to a checkpoint of the tree taken
+                              before the search, in time proportional to the number of nodes changed.
+                              'revert' reverts each simulated update in turn, recalculating probabilities.
+                              'overlay' runs each simulation against a `CTWContextTreeOverlay`, which keeps
+                              the simulated changes apart from the tree, so nothing needs to be undone.
         """
 
         # Set up the base agent options, which handles getting and setting the learning period, amongst other basic values.
@@ -132,9 +253,126 @@ class MC_AIXI_CTW_Agent(agent.Agent):
             "The required 'ct-depth' context tree depth option is missing from the given options."
         self.depth = int(options['ct-depth'])
 
+        # The agent's context tree implementation.
+        # Retrieved from the given options under 'ct-backend'. Defaults to 'object'.
+        self.context_tree_backend = str(options.get('ct-backend', 'object'))
+        assert self.context_tree_backend in context_tree_backends, \
+            "The given 'ct-backend' option '%s' is not one of %s." % \
+            (self.context_tree_backend, str(sorted(context_tree_backends.keys())))
+
+        # The memory limit of the shared cache of log KT multipliers.
+        # Retrieved from the given options under 'ct-kt-table-mb'. Left unchanged if not given.
+        if 'ct-kt-table-mb' in options:
+            ctw_context_tree.set_log_kt_table_limit(int(float(options['ct-kt-table-mb']) * 1024 * 1024))
+        # end if
+
+        # The precision the node statistics of an 'array' context tree are stored in.
+        # Retrieved from the given options under 'ct-precision'. Defaults to 'double'.
+        precision = str(options.get('ct-precision', 'double'))
+        assert precision in ctw_array_context_tree.precisions, \
+            "The given 'ct-precision' option '%s' is not one of %s." % \
+            (precision, str(sorted(ctw_array_context_tree.precisions.keys())))
+        assert precision == 'double' or self.context_tree_backend == 'array', \
+            "Only the 'array' context tree can store its node statistics in '%s' precision." % precision
+        tree_arguments = {'precision': precision} if self.context_tree_backend == 'array' else {}
+
+        # A trained context tree to start from, saved by an earlier run.
+        # Retrieved from the given options under 'ct-load-file'. Defaults to none.
+        load_file = options.get('ct-load-file', None)
+        assert load_file is None or self.context_tree_backend not in ('beta', 'hashed', 'symbol'), \
+            "The '%s' context tree can't be loaded from a file." % self.context_tree_backend
+        assert options.get('ct-save-file', None) is None or self.context_tree_backend not in ('beta', 'hashed', 'symbol'), \
+            "The '%s' context tree can't be saved to a file." % self.context_tree_backend
+
+        # How the percepts are modelled: by a single context tree, or by one for each percept bit.
+        # Retrieved from the given options under 'ct-model'. Defaults to 'single'.
+        self.context_tree_model = str(options.get('ct-model', 'single'))
+        assert self.context_tree_model in ('single', 'factored'), \
+            "The given 'ct-model' option '%s' is not 'single' or 'factored'." % self.context_tree_model
+        if self.context_tree_model == 'factored':
+            assert self.context_tree_backend in ('object', 'array', 'beta', 'suffix'), \
+                "The '%s' context tree can't be factored." % self.context_tree_backend
+            assert load_file is None and options.get('ct-save-file', None) is None, \
+                "A factored context tree model can't be loaded from or saved to a file."
+        # end if
+
         # (CTW) Context tree representing the agent's model of the environment.
-        # Created for this instance.
-        self.context_tree = ctw_context_tree.CTWContextTree(self.depth)
+        # Created for this instance, or loaded from `load_file`.
+        if self.context_tree_model == 'factored':
+            self.context_tree = ctw_factored_context_tree.CTWFactoredContextTree(
+                self.depth, self.environment.percept_bits(), context_tree_backends[self.context_tree_backend],
+                **tree_arguments)
+        elif self.context_tree_backend == 'hashed':
+            # The size and collision policy of the table.
+            # Retrieved from the given options under 'ct-memory-mb' and 'ct-collision-policy'.
+            memory_bytes = int(float(options.get('ct-memory-mb', 64)) * 1024 * 1024)
+            collision_policy = str(options.get('ct-collision-policy', 'replace'))
+            self.context_tree = ctw_hashed_context_tree.CTWHashedContextTree(self.depth, memory_bytes, collision_policy)
+        elif self.context_tree_backend == 'mmap':
+            # The node file, and the number of nodes to read ahead from it.
+            # Retrieved from the given options under 'ct-mmap-file' and 'ct-mmap-hot-nodes'.
+            mmap_file = options.get('ct-mmap-file', None)
+            hot_nodes = int(options.get('ct-mmap-hot-nodes', ctw_mmap_context_tree.hot_nodes))
+            if load_file is not None:
+                self.context_tree = ctw_mmap_context_tree.CTWMmapContextTree(self.depth, str(load_file), hot_nodes,
+                                                                             copy_on_write = True)
+            else:
+                self.context_tree = ctw_mmap_context_tree.CTWMmapContextTree(self.depth, mmap_file, hot_nodes)
+            # end if
+        elif self.context_tree_backend == 'symbol':
+            # The depth of the tree, in whole actions and percepts, and the prior of its estimators.
+            # Retrieved from the given options under 'ct-symbol-depth' and 'ct-symbol-prior'.
+            # Default to the symbols in `depth` bits, and 'kt'.
+            cycle_bits = self.environment.action_bits() + self.environment.percept_bits()
+            symbol_depth = int(options.get('ct-symbol-depth', max(2, (2 * self.depth + cycle_bits - 1) // cycle_bits)))
+            symbol_prior = str(options.get('ct-symbol-prior', 'kt'))
+            if symbol_prior not in ctw_symbol_context_tree.symbol_priors:
+                symbol_prior = float(symbol_prior)
+            # end if
+            self.context_tree = ctw_symbol_context_tree.CTWSymbolContextTree(symbol_depth,
+                                                                             self.environment.percept_bits(),
+                                                                             symbol_prior)
+        elif load_file is not None:
+            self.context_tree = ctw_tree_file.load_tree(str(load_file), context_tree_backends[self.context_tree_backend],
+                                                        **tree_arguments)
+            assert self.context_tree.depth == self.depth, \
+                "The context tree loaded has depth %d, rather than %d." % (self.context_tree.depth, self.depth)
+        else:
+            self.context_tree = context_tree_backends[self.context_tree_backend](self.depth, **tree_arguments)
+        # end if
+
+        # The number of symbols a context must see before the contexts below it are used.
+        # Retrieved from the given options under 'ct-adaptive-threshold'. Defaults to none, for a fixed depth.
+        if 'ct-adaptive-threshold' in options:
+            assert self.context_tree_backend == 'object' and self.context_tree_model == 'single', \
+                "Only a single 'object' context tree can have an adaptive depth."
+            self.context_tree.set_adaptive_depth(int(options['ct-adaptive-threshold']))
+        # end if
+
+        # Whether searches after the learning period use a frozen copy of the context tree, and the copy,
+        # which is compiled at the first search after the learning period.
+        # Retrieved from the given options under 'ct-freeze'. Defaults to 'none'.
+        self.freeze = str(options.get('ct-freeze', 'none'))
+        assert self.freeze in ('none', 'deltas', 'fixed'), \
+            "The given 'ct-freeze' option '%s' is not 'none', 'deltas' or 'fixed'." % self.freeze
+        if self.freeze != 'none':
+            assert self.learning_period > 0, "The 'ct-freeze' option needs a 'learning-period'."
+            assert self.context_tree_backend in ('object', 'array', 'mmap', 'suffix') and \
+                   self.context_tree_model == 'single' and 'ct-adaptive-threshold' not in options, \
+                "Only a single 'object', 'array', 'mmap' or 'suffix' context tree with a fixed depth can be frozen."
+        # end if
+        self.frozen_context_tree = None
+
+        # How the context tree updates the nodes of a context.
+        # Retrieved from the given options under 'ct-update'. Defaults to 'nodes'.
+        context_tree_update = str(options.get('ct-update', 'nodes'))
+        assert context_tree_update in ('nodes', 'vectorized'), \
+            "The given 'ct-update' option '%s' is not 'nodes' or 'vectorized'." % context_tree_update
+        if context_tree_update == 'vectorized':
+            assert self.context_tree_backend in ('array', 'mmap'), \
+                "Only the 'array' and 'mmap' context trees have a vectorized update."
+            self.context_tree.set_vectorized(True)
+        # end if
 
         # The length of the agent's planning horizon.
         # Retrieved from the given options under 'agent-horizon'. Mandatory.
@@ -147,8 +385,85 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         assert 'mc-simulations' in options, \
             "The required 'mc-simulations' Monte Carlo simulations count option is missing from the given options."
         self.mc_simulations = int(options['mc-simulations'])
+
+        # Whether to sample each percept from the context tree with a single random number.
+        # Retrieved from the given options under 'percept-sampling'. Defaults to 'bitwise'.
+        percept_sampling = str(options.get('percept-sampling', 'bitwise'))
+        assert percept_sampling in ('bitwise', 'single-draw'), \
+            "The given 'percept-sampling' option '%s' is not 'bitwise' or 'single-draw'." % percept_sampling
+        self.percept_single_draw = (percept_sampling == 'single-draw')
+
+        # How the context tree is restored after each search simulation.
+        # Retrieved from the given options under 'search-undo'. Defaults to 'checkpoint'.
+        self.search_undo = str(options.get('search-undo', 'checkpoint'))
+        assert self.search_undo in ('checkpoint', 'overlay', 'revert'), \
+            "The given 'search-undo' option '%s' is not 'checkpoint', 'overlay' or 'revert'." % self.search_undo
+        assert self.search_undo != 'overlay' or self.context_tree_backend != 'symbol', \
+            "The 'overlay' search undo can't be used with the 'symbol' context tree."
+        assert self.search_undo != 'overlay' or self.context_tree_model != 'factored', \
+            "The 'overlay' search undo can't be used with a factored context tree model."
+
+        # The node budget of the context tree, and how it's pruned to keep to it.
+        # Retrieved from the given options under 'ct-max-nodes', 'ct-max-bytes', 'ct-pruning-policy' and
+        # 'ct-pruning-threshold'. Defaults to no budget.
+        if 'ct-max-nodes' in options or 'ct-max-bytes' in options:
+            assert self.context_tree_backend in ('object', 'suffix'), \
+                "Only the 'object' and 'suffix' context trees can be kept to 'ct-max-nodes' or 'ct-max-bytes'."
+            # Pruning between simulated updates would leave nodes they revert missing.
+            assert self.search_undo != 'revert', \
+                "The 'revert' search undo can't be used with 'ct-max-nodes' or 'ct-max-bytes'."
+            max_nodes = int(options['ct-max-nodes']) if 'ct-max-nodes' in options else None
+            max_bytes = int(float(options['ct-max-bytes'])) if 'ct-max-bytes' in options else None
+            self.context_tree.set_node_budget(max_nodes, max_bytes,
+                                              policy = str(options.get('ct-pruning-policy', 'lru')),
+                                              threshold = int(options.get('ct-pruning-threshold', 2)))
+        # end if
+
+        # The number of recent predictions the context tree keeps.
+        # Retrieved from the given options under 'ct-prediction-cache'. Defaults to none.
+        if 'ct-prediction-cache' in options:
+            assert self.context_tree_backend != 'symbol', "The 'symbol' context tree can't cache its predictions."
+            self.context_tree.set_prediction_cache(int(options['ct-prediction-cache']))
+        # end if
+
+        # How the context tree keeps its history.
+        # Retrieved from the given options under 'ct-history', 'ct-history-capacity' and 'ct-history-archive'.
+        # Defaults to 'list'.
+        history = str(options.get('ct-history', 'list'))
+        assert history in ('list', 'packed', 'ring'), \
+            "The given 'ct-history' option '%s' is not 'list', 'packed' or 'ring'." % history
+        assert history == 'list' or self.context_tree_backend != 'symbol', \
+            "The 'symbol' context tree keeps its history of whole symbols in a list."
+        assert history == 'list' or self.context_tree_model != 'factored', \
+            "The trees of a factored context tree model keep their histories in lists."
+        if history == 'packed':
+            self.context_tree.set_history(ctw_history.BitPackedHistory(max(64, self.depth)))
+        elif history == 'ring':
+            # a search reverts up to one cycle more than the horizon, and needs a context for the first symbol
+            minimum_capacity = self.depth + (self.horizon + 1) * \
+                               (self.environment.action_bits() + self.environment.percept_bits())
+            capacity = int(options.get('ct-history-capacity', minimum_capacity))
+            assert capacity >= minimum_capacity, \
+                "The given 'ct-history-capacity' option %d is less than the %d symbols a search needs." % \
+                (capacity, minimum_capacity)
+            self.context_tree.set_history(ctw_history.CTWHistory(capacity, options.get('ct-history-archive')))
+        # end if
+
+        # When the context tree removes nodes left without visits by reverts.
+        # Retrieved from the given options under 'ct-compaction' and 'ct-max-ghost-nodes'. Defaults to 'immediate'.
+        self.compaction = str(options.get('ct-compaction', 'immediate'))
+        assert self.compaction in ('immediate', 'cycle', 'threshold'), \
+            "The given 'ct-compaction' option '%s' is not 'immediate', 'cycle' or 'threshold'." % self.compaction
+        if self.compaction != 'immediate':
+            assert self.context_tree_backend in ('object', 'suffix'), \
+                "Only the 'object' and 'suffix' context trees can defer the removal of nodes."
+            max_ghost_nodes = int(options.get('ct-max-ghost-nodes', 100000)) if self.compaction == 'threshold' else None
+            self.context_tree.set_deferred_pruning(True, max_ghost_nodes)
+        # end if
         self.exploration_exploitation_rate = 0.01
-        self.reset()
+
+        # The context tree is new, or was loaded or reopened from a file, so it's kept as it is.
+        agent.Agent.reset(self)
 
     # end def
 
@@ -257,7 +572,8 @@ class MC_AIXI_CTW_Agent(agent.Agent):
 
         # TODO: implement
         # sample from the context tree to get symbols of percept
-        samples = self.context_tree.generate_random_symbols((self.environment.percept_bits()))
+        samples = self.context_tree.generate_random_symbols(self.environment.percept_bits(),
+                                                            self.percept_single_draw)
         # decode samples into percepts
         percept = self.decode_percept(samples)
         return percept
@@ -271,7 +587,8 @@ class MC_AIXI_CTW_Agent(agent.Agent):
 
         # TODO: implement
         # sample from the context tree to get the symbols of percept
-        samples = self.context_tree.generate_random_symbols_and_update(self.environment.percept_bits())
+        samples = self.context_tree.generate_random_symbols_and_update(self.environment.percept_bits(),
+                                                                       self.percept_single_draw)
         # get the observation and reward of the percept
         observation, reward = self.decode_percept(samples)
         # update observation and total reward
@@ -300,7 +617,7 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         """ Returns the length of the stored history for an agent.
         """
 
-        return len(self.context_tree.history)
+        return self.context_tree.history_size()
 
     # end def
 
@@ -338,6 +655,9 @@ class MC_AIXI_CTW_Agent(agent.Agent):
     #         else self.environment.percept_bits())
 
         ''' agent branch implementation '''
+        # roll the context tree back in one step if there is a checkpoint
+        if undo_instance.checkpoint is not None:
+            self.context_tree.rollback(undo_instance.checkpoint)
         # deal with the new elements of history
         while self.history_size() > undo_instance.history_size:
             # when the last update is action update
@@ -419,6 +739,24 @@ class MC_AIXI_CTW_Agent(agent.Agent):
 
     # end def
 
+    def percept_distribution(self):
+        """ Returns the probability of receiving every possible percept according to the agent's
+            environment model, as a dictionary indexed by (observation, reward) pairs.
+
+            The probabilities of all the percept encodings are calculated together by
+            `CTWContextTree.predict_distribution()`.
+        """
+
+        percept_bits = self.environment.percept_bits()
+        distribution = {}
+        for value, probability in enumerate(self.context_tree.predict_distribution(percept_bits)):
+            distribution[self.decode_percept(util.encode(value, percept_bits))] = probability
+        # end for
+
+        return distribution
+
+    # end def
+
     def percept_probability(self, observation, reward):
         """ Returns the probability of receiving a particular percept
             (the given observation and reward) according to the agent's environment model.
@@ -479,8 +817,9 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         """ Resets the agent and clears the context tree.
         """
 
-        # Reset the context tree.
+        # Reset the context tree, and drop any frozen copy of it.
         self.context_tree.clear()
+        self.frozen_context_tree = None
 
         # Reset the basic agent details.
         agent.Agent.reset(self)
@@ -512,13 +851,35 @@ class MC_AIXI_CTW_Agent(agent.Agent):
         # return mct.select_action(self)
 
         ''' agent branch implementation '''
-        # store the state now
-        now = MC_AIXI_CTW_Undo(self)
+        # after the learning period, search against the frozen context tree, compiling it first if need be
+        context_tree = self.context_tree
+        frozen = self.freeze != 'none' and self.learning_period > 0 and self.age > self.learning_period
+        if frozen:
+            if self.frozen_context_tree is None:
+                self.frozen_context_tree = ctw_frozen_context_tree.CTWFrozenContextTree(
+                    context_tree, learning = (self.freeze == 'deltas'))
+            self.context_tree = self.frozen_context_tree
+        # store the state now, with a checkpoint of the context tree if it is used to undo simulations
+        checkpoint = self.context_tree.checkpoint() if self.search_undo == 'checkpoint' or frozen else None
+        now = MC_AIXI_CTW_Undo(self, checkpoint)
         # initialize a new tree and update
         new = monte_carlo_search_tree.MonteCarloSearchNode(decision_node)
         for i in xrange(self.mc_simulations):
-            new.sample(self, self.horizon)
+            if self.search_undo == 'overlay' and not frozen:
+                # simulate against a throwaway overlay, leaving the context tree itself untouched
+                self.context_tree = ctw_context_tree.CTWContextTreeOverlay(context_tree)
+                new.sample(self, self.horizon)
+                self.context_tree = context_tree
+            else:
+                new.sample(self, self.horizon)
             self.model_revert(now)
+        if checkpoint is not None:
+            self.context_tree.release_checkpoint(checkpoint)
+        # the frozen context tree shares the history of the context tree, which is used again from here
+        self.context_tree = context_tree
+        # remove the nodes the simulations left without visits
+        if self.compaction == 'cycle':
+            self.context_tree.compact()
         # initialize the best action as a random chosen one and the best mean to be 0
         best_action = self.generate_random_action()
         best_mean = 0
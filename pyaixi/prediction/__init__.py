@@ -1 +1 @@
-__all__ = ["ctw_context_tree"]
\ No newline at end of file
+__all__ = ["ctw_array_context_tree", "ctw_beta_context_tree", "ctw_context_tree", "ctw_factored_context_tree", "ctw_frozen_context_tree", "ctw_hashed_context_tree", "ctw_history", "ctw_mmap_context_tree", "ctw_suffix_context_tree", "ctw_symbol_context_tree", "ctw_tree_file"]
\ No newline at end of file
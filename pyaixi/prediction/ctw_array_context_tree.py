@@ -0,0 +1,736 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define a context tree that stores its nodes in flat typed arrays rather than as node objects.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import math
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+# NumPy is optional, and only used by the vectorized update (see `CTWArrayContextTree.set_vectorized()`).
+try:
+	import numpy
+except ImportError:
+	numpy = None
+# end try
+
+from pyaixi.prediction import ctw_context_tree
+from pyaixi.prediction.ctw_context_tree import draw_symbol, generations, log_half, log_kt_multiplier, log_kt_table
+
+# The array type codes used for the node statistics: counts, log probabilities and child indices.
+count_typecode = 'Q'
+log_typecode = 'd'
+child_typecode = 'q'
+
+# The array type codes of the counts, log probabilities and child indices for each precision the
+# node statistics can be stored in. 'single' stores 4-byte counts, floats and ids, halving the memory
+# of each node, at the cost of rounding the log probabilities to about seven significant digits.
+precisions = {
+	'double': (count_typecode, log_typecode, child_typecode),
+	'single': ('I', 'f', 'i'),
+}
+
+# The value ln(pi), for `log_kt_estimate()`.
+log_pi = math.log(math.pi)
+
+# The child index used to indicate that a node has no child for a symbol.
+# The root node is never a child, so its index is free to mark a missing child.
+no_child = 0
+
+# Markers used in the undo journal for changes to the node storage, rather than to a node.
+# (Node ids are never negative.)
+journal_allocated = -1
+journal_released = -2
+
+def log_kt_estimate(a, b):
+	""" Returns the log KT estimate of the probability of a sequence of `a` zeros and `b` ones, calculated
+		from the counts rather than accumulated one multiplier at a time (see `CTWContextTreeNode.update()`):
+
+		  Pr_kt(a, b) = Gamma(a + 1/2) Gamma(b + 1/2) / (pi Gamma(a + b + 1))
+
+		- `a`: the number of zeros seen.
+		- `b`: the number of ones seen.
+	"""
+
+	return math.lgamma(a + 1 / 2) + math.lgamma(b + 1 / 2) - math.lgamma(a + b + 1) - log_pi
+# end def
+
+class CTWArrayContextTreeNode:
+	""" A read-only view of a single node of a `CTWArrayContextTree`.
+
+		The array-backed tree doesn't keep node objects. Instead, it exposes views on request,
+		so code written against `CTWContextTreeNode` attributes (`log_kt`, `log_probability`,
+		`symbol_count`, `children`) can still inspect the tree.
+	"""
+
+	# Instance methods.
+
+	def __init__(self, tree, index):
+		""" Construct a view of the node at the given index of the given tree.
+		"""
+
+		# The tree storing this node.
+		self.tree = tree
+
+		# The integer id of this node within the tree's arrays.
+		self.index = index
+	# end def
+
+	@property
+	def children(self):
+		""" The children of this node, as a dictionary of views indexed by symbol.
+		"""
+
+		children = {}
+		for symbol, column in enumerate(self.tree.child):
+			if column[self.index] != no_child:
+				children[symbol] = CTWArrayContextTreeNode(self.tree, column[self.index])
+			# end if
+		# end for
+
+		return children
+	# end def
+
+	@property
+	def log_kt(self):
+		""" The KT estimate of the block log probability for this node.
+		"""
+
+		return self.tree.log_kt[self.index]
+	# end def
+
+	@property
+	def log_probability(self):
+		""" The weighted log probability for this node.
+		"""
+
+		return self.tree.log_probability[self.index]
+	# end def
+
+	@property
+	def symbol_count(self):
+		""" The count of the symbols in the history subsequence relevant to this node.
+		"""
+
+		return {0: self.tree.symbol_count[0][self.index], 1: self.tree.symbol_count[1][self.index]}
+	# end def
+
+	def is_leaf_node(self):
+		""" Return True if the node is a leaf node, False otherwise.
+		"""
+
+		return self.tree.is_leaf_node(self.index)
+	# end def
+
+	def size(self):
+		""" The number of descendants of this node.
+		"""
+
+		return 1 + sum([child.size() for child in self.children.values()])
+	# end def
+
+	def visits(self):
+		""" Returns the number of times this context has been visited.
+		"""
+
+		return self.tree.visits(self.index)
+	# end def
+# end class
+
+
+class CTWArrayContextTree(ctw_context_tree.CTWContextTree):
+	""" An action-conditional context tree whose nodes are stored as a struct of arrays.
+
+		Each node is identified by an integer id, and its statistics live at that index in
+		flat typed arrays (see the `array` module):
+
+		- `symbol_count[0]`, `symbol_count[1]`: the number of zeros and ones seen in the node's context.
+
+		- `log_kt`: the KT estimate of the block log probability.
+
+		- `log_probability`: the weighted log probability.
+
+		- `child[0]`, `child[1]`: the ids of the child nodes, or `no_child`.
+
+		The root node always has id 0. Ids of deleted nodes are kept on a free list and reused by
+		the next created node, so the arrays only grow when the tree does.
+
+		This avoids the per-node Python object, the two dictionaries and the back-reference kept by
+		every `CTWContextTreeNode`, which dominate memory use for deep trees.
+		The mathematics are the same as in `CTWContextTreeNode`, and the tree exposes the same
+		`update`/`revert`/`predict`/`generate_random_symbols*` interface as `CTWContextTree`.
+
+		The `context` list holds node ids rather than node objects, while `root` returns a
+		read-only `CTWArrayContextTreeNode` view.
+
+		While there is a checkpoint, the journal also records the ids taken from and returned to
+		the free list, so that a rollback leaves the arrays and the free list as they were.
+
+		The statistics are stored in 8-byte counts, floats and ids by default, taking 48 bytes per node.
+		In 'single' precision (see `precisions`), they take 24 bytes per node. The probabilities are
+		still calculated in double precision, and only rounded when they are stored. As the weighted
+		log probabilities of the nodes near the root grow with the history, their rounding error does
+		too, so `predict()` recalculates the probability of the history along the context path from the
+		same rounded values as the updated one, rather than reading it from the root
+		(see `CTWContextTree.query_path_log_probability()`). And as adding each multiplier to a rounded
+		log KT estimate would accumulate the rounding errors of every update of the node, the estimates
+		are instead calculated from the counts whenever they're stored (see `log_kt_estimate()`), which
+		keeps the predictions within about 1e-6 of those in double precision.
+	"""
+
+	def __init__(self, depth, precision = 'double'):
+		""" Create an array-backed context tree of specified maximum depth.
+			Nodes are created as needed.
+
+			- `depth`: the maximum depth of the context tree.
+			- `precision`: the precision the node statistics are stored in, one of the keys of `precisions`.
+		"""
+
+		# The array type codes of the node statistics, which `create_nodes()` creates the arrays with.
+		assert precision in precisions, \
+			"The given precision '%s' is not one of %s." % (precision, str(sorted(precisions.keys())))
+		self.precision = precision
+		self.count_typecode, self.log_typecode, self.child_typecode = precisions[precision]
+
+		ctw_context_tree.CTWContextTree.__init__(self, depth)
+
+		# Whether the stored log probabilities are rounded. (See `CTWContextTree.__init__()`.)
+		self.rounded_log_probabilities = precision != 'double'
+
+		# Whether `update()` updates the context path with NumPy array operations (see `set_vectorized()`).
+		self.vectorized = False
+	# end def
+
+	@property
+	def root(self):
+		""" A read-only view of the root node of the context tree.
+		"""
+
+		return CTWArrayContextTreeNode(self, 0)
+	# end def
+
+	def allocate_node(self):
+		""" Returns the id of a new node with empty statistics, reusing a deleted node's id if possible.
+		"""
+
+		# Reuse a released id, resetting its statistics in place.
+		if len(self.free_nodes) > 0:
+			index = self.free_nodes.pop()
+			if self.journal is not None:
+				self.journal.append((journal_allocated, index, None))
+			# end if
+			self.symbol_count[0][index] = 0
+			self.symbol_count[1][index] = 0
+			self.log_kt[index] = 0.0
+			self.log_probability[index] = 0.0
+			self.child[0][index] = no_child
+			self.child[1][index] = no_child
+			return index
+		# end if
+
+		# Otherwise grow the arrays by one node.
+		if self.journal is not None:
+			self.journal.append((journal_allocated, None, None))
+		# end if
+		return self.grow_arrays()
+	# end def
+
+	def clear(self):
+		""" Clears the entire context tree including all nodes and history.
+		"""
+
+		# Reset the history, and discard any checkpoints.
+		del self.history[:]
+		self.journal = None
+
+		# Create empty node arrays, holding just the root node.
+		self.create_nodes()
+		self.generation = next(generations)
+
+		# Unvisited nodes are removed straight away, so there are never any ghost nodes.
+		# (See `CTWContextTree.set_deferred_pruning()`.)
+		self.ghost_nodes = 0
+
+		# Reset the context.
+		self.context = []
+	# end def
+
+	def create_nodes(self):
+		""" Creates empty node arrays, holding just the root node, and resets the tree size.
+		"""
+
+		self.symbol_count = [array.array(self.count_typecode), array.array(self.count_typecode)]
+		self.log_kt = array.array(self.log_typecode)
+		self.log_probability = array.array(self.log_typecode)
+		self.child = [array.array(self.child_typecode), array.array(self.child_typecode)]
+
+		# The ids of deleted nodes, available for reuse.
+		self.free_nodes = []
+
+		self.allocate_node()
+		self.tree_size = 1
+	# end def
+
+	def draw_and_update(self, uniform):
+		""" Returns a symbol drawn according to the context tree statistics with the given uniform
+			random number, after updating the context tree with it, together with the rescaled random number.
+			The context path is walked only once. (See `CTWContextTree.draw_and_update()`.)
+
+			- `uniform`: a random number in [0, 1).
+		"""
+
+		# Symbols without a complete context are not modelled by the tree, so treat them as uniform.
+		if len(self.history) < self.depth:
+			symbol, uniform = draw_symbol(uniform, 0.5)
+			self.update_history([symbol])
+			return (symbol, uniform)
+		# end if
+
+		self.generation = next(generations)
+		self.update_context()
+
+		symbol_count = self.symbol_count
+		log_kt = self.log_kt
+		log_probability = self.log_probability
+		child = self.child
+
+		# The candidate (log KT estimate, weighted log probability) of each node for a zero and a one,
+		# in order from leaf to root.
+		candidates = ([], [])
+		path_child = no_child
+		for index in reversed(self.context):
+			a = symbol_count[0][index]
+			b = symbol_count[1][index]
+			child_0 = child[0][index]
+			child_1 = child[1][index]
+			for symbol in (0, 1):
+				candidate_kt = log_kt[index] + log_kt_multiplier(a, b, symbol)
+
+				if child_0 == no_child and child_1 == no_child:
+					candidate_probability = candidate_kt
+				else:
+					# Use the candidate value for the child on the context path.
+					log_children = 0.0
+					for child_index in (child_0, child_1):
+						if child_index == no_child:
+							continue
+						elif child_index == path_child:
+							log_children += candidates[symbol][-1][1]
+						else:
+							log_children += log_probability[child_index]
+						# end if
+					# end for
+
+					high = max(candidate_kt, log_children)
+					low = min(candidate_kt, log_children)
+					candidate_probability = log_half + high + math.log(1 + math.exp(low - high))
+				# end if
+
+				candidates[symbol].append((candidate_kt, candidate_probability))
+			# end for
+			path_child = index
+		# end for
+
+		# rho(1 | h) = rho(h1)/rho(h).
+		if self.rounded_log_probabilities:
+			# rho(h) = rho(h0) + rho(h1), calculated from the same rounded values (see `precisions`)
+			high = max(candidates[0][-1][1], candidates[1][-1][1])
+			low = min(candidates[0][-1][1], candidates[1][-1][1])
+			log_history = high + math.log(1 + math.exp(low - high))
+		else:
+			log_history = log_probability[0]
+		# end if
+		symbol, uniform = draw_symbol(uniform, math.exp(candidates[1][-1][1] - log_history))
+
+		# Commit the values for the sampled symbol.
+		counts = symbol_count[symbol]
+		for index, (candidate_kt, candidate_probability) in zip(reversed(self.context), candidates[symbol]):
+			counts[index] += 1
+			if self.rounded_log_probabilities:
+				# see `update_node()`
+				candidate_kt = log_kt_estimate(symbol_count[0][index], symbol_count[1][index])
+			# end if
+			log_kt[index] = candidate_kt
+			log_probability[index] = candidate_probability
+		# end for
+
+		self.update_history([symbol])
+		return (symbol, uniform)
+	# end def
+
+	def grow_arrays(self):
+		""" Adds a node with empty statistics to the end of the arrays, and returns its id.
+		"""
+
+		index = len(self.log_kt)
+		self.symbol_count[0].append(0)
+		self.symbol_count[1].append(0)
+		self.log_kt.append(0.0)
+		self.log_probability.append(0.0)
+		self.child[0].append(no_child)
+		self.child[1].append(no_child)
+		return index
+	# end def
+
+	def is_leaf_node(self, index):
+		""" Return True if the given node is a leaf node, False otherwise.
+		"""
+
+		return self.child[0][index] == no_child and self.child[1][index] == no_child
+	# end def
+
+	def log_kt_multiplier(self, index, symbol):
+		""" Returns the logarithm of the KT-estimator update multiplier for the given node.
+			(See `CTWContextTreeNode.log_kt_multiplier()`.)
+		"""
+
+		a = self.symbol_count[0][index]
+		b = self.symbol_count[1][index]
+		if a + b < len(log_kt_table):
+			return log_kt_table[a + b][b if symbol else a]
+		# end if
+
+		return log_kt_multiplier(a, b, symbol)
+	# end def
+
+	def query_child_key(self, key, symbol):
+		""" Returns the key `predict()` uses for the child of the node with the given key.
+			Existing nodes are keyed by their id. (See `CTWContextTree.query_child_key()`.)
+		"""
+
+		if type(key) == tuple:
+			index, bits, length = key
+			return (index, bits | (symbol << length), length + 1)
+		# end if
+
+		child_index = self.child[symbol][key]
+		if child_index == no_child:
+			return (key, symbol, 1)
+		# end if
+
+		return child_index
+	# end def
+
+	def query_pruned_log_probability(self, key):
+		""" Returns 0, as array context trees are not pruned.
+		"""
+
+		return 0.0
+	# end def
+
+	def query_root(self):
+		""" Returns the key `predict()` uses for the root node.
+		"""
+
+		return 0
+	# end def
+
+	def query_state(self, key):
+		""" Returns the (zero count, one count, log KT estimate, weighted log probability) of the node
+			with the given `predict()` key. Nodes that don't exist yet have empty statistics.
+		"""
+
+		if type(key) == tuple:
+			return (0, 0, 0.0, 0.0)
+		# end if
+
+		return (self.symbol_count[0][key], self.symbol_count[1][key], self.log_kt[key], self.log_probability[key])
+	# end def
+
+	def revert(self, symbol_count = 1):
+		""" Restores the context tree to its state prior to a specified number of updates.
+
+			- `num_symbols`: the number of updates (symbols) to revert. (Default of 1.)
+		"""
+
+		self.generation = next(generations)
+		for i in xrange(0, symbol_count):
+			# The symbol was added with the context that preceded it.
+			symbol = self.history[len(self.history) - 1]
+			self.revert_history()
+
+			# Symbols seen before the history could fill a whole context never reached the nodes.
+			if len(self.history) < self.depth:
+				continue
+			# end if
+
+			self.update_context()
+
+			# Revert the children before their parents.
+			for index in reversed(self.context):
+				self.revert_node(index, symbol)
+			# end for
+		# end for
+	# end def
+
+	def revert_node(self, index, symbol):
+		""" Reverts the given node to its state immediately prior to the last update with `symbol`,
+			deleting any child left without visits.
+			(See `CTWContextTreeNode.revert()`.)
+		"""
+
+		counts = self.symbol_count[symbol]
+		if counts[index] >= 1:
+			counts[index] -= 1
+		# end if
+
+		if self.rounded_log_probabilities:
+			# see `update_node()`
+			self.log_kt[index] = log_kt_estimate(self.symbol_count[0][index], self.symbol_count[1][index])
+		else:
+			self.log_kt[index] -= self.log_kt_multiplier(index, symbol)
+		# end if
+
+		# Release any child that is no longer visited.
+		for column in self.child:
+			child_index = column[index]
+			if child_index != no_child and self.visits(child_index) == 0:
+				column[index] = no_child
+				self.free_nodes.append(child_index)
+				self.tree_size -= 1
+				if self.journal is not None:
+					self.journal.append((journal_released, child_index, None))
+				# end if
+			# end if
+		# end for
+
+		self.update_log_probability(index)
+	# end def
+
+	def rollback(self, token):
+		""" Restores the tree to its state when `checkpoint()` returned the given token.
+			(See `CTWContextTree.checkpoint()`.)
+		"""
+
+		journal_length, history_length, tree_size, ghost_nodes, generation = token[0:5]
+		journal = self.journal
+		while len(journal) > journal_length:
+			index, state, removed_symbols = journal.pop()
+			if index is None:
+				# restore symbols removed from the history
+				del self.history[state:]
+				self.history.extend(removed_symbols)
+			elif index == journal_allocated:
+				if state is None:
+					self.shrink_arrays()
+				else:
+					self.free_nodes.append(state)
+				# end if
+			elif index == journal_released:
+				self.free_nodes.pop()
+			else:
+				self.symbol_count[0][index], self.symbol_count[1][index], self.log_kt[index], \
+					self.log_probability[index], self.child[0][index], self.child[1][index] = state
+			# end if
+		# end while
+
+		del self.history[history_length:]
+		self.tree_size = tree_size
+		self.generation = generation
+	# end def
+
+	def set_vectorized(self, vectorized = True):
+		""" Sets whether `update()` updates the nodes of the context path with a few NumPy array operations
+			(see `update_path()`), rather than one node at a time. This needs NumPy.
+
+			The probabilities calculated differ from those of the node-by-node update only by rounding.
+
+			- `vectorized`: whether to update the context path with array operations.
+		"""
+
+		assert not vectorized or numpy is not None, "The vectorized update needs NumPy, which isn't installed."
+		self.vectorized = vectorized
+	# end def
+
+	def shrink_arrays(self):
+		""" Removes the node at the end of the arrays.
+		"""
+
+		for column in (self.symbol_count[0], self.symbol_count[1], self.log_kt,
+		               self.log_probability, self.child[0], self.child[1]):
+			column.pop()
+		# end for
+	# end def
+
+	def snapshot(self, index):
+		""" Returns the statistics and children of the given node, as stored in the undo journal.
+		"""
+
+		return (self.symbol_count[0][index], self.symbol_count[1][index], self.log_kt[index],
+		        self.log_probability[index], self.child[0][index], self.child[1][index])
+	# end def
+
+	def update(self, symbol_list):
+		""" Updates the context tree with a new (binary) symbol, or a list of symbols.
+			Recalculates the log weighted probabilities and log KT estimates for each affected node.
+
+			- `symbol_list`: the symbol (or list of symbols) with which to update the tree.
+							  (The context tree is updated with symbols in the order they appear in the list.)
+		"""
+
+		self.generation = next(generations)
+		for symbol in symbol_list:
+			# The first `depth` symbols have no complete context, so they only extend the history.
+			if len(self.history) >= self.depth:
+				self.update_context()
+
+				if self.vectorized:
+					self.update_path(symbol)
+				else:
+					# Update the leaf first, as the weighted probabilities of parents depend on their children.
+					for index in reversed(self.context):
+						self.update_node(index, symbol)
+					# end for
+				# end if
+			# end if
+
+			self.update_history([symbol])
+		# end for
+	# end def
+
+	def update_context(self):
+		""" Calculates which nodes in the context tree correspond to the current
+			context, and adds their ids to `context` in order from root to leaf.
+
+			Creates the nodes if they do not exist.
+		"""
+
+		history = self.history
+		history_length = len(history)
+		journal = self.journal
+
+		index = 0
+		self.context = [index]
+		created = False
+		for i in xrange(0, self.depth + 1):
+			# Save the state of the nodes about to change if there's a checkpoint.
+			# (Nodes created since the last one are released again by restoring their parent instead.)
+			if journal is not None and not created:
+				journal.append((index, self.snapshot(index), None))
+			# end if
+
+			if i >= min(self.depth, history_length):
+				break
+			# end if
+
+			# Follow the child for the i-th most recent symbol, creating it if needed.
+			column = self.child[history[history_length - 1 - i]]
+			child_index = column[index]
+			if child_index == no_child:
+				child_index = self.allocate_node()
+				column[index] = child_index
+				self.tree_size += 1
+				created = True
+			# end if
+
+			index = child_index
+			self.context.append(index)
+		# end for
+	# end def
+
+	def update_log_probability(self, index):
+		""" Calculates the logarithm of the weighted probability for the given node.
+			(See `CTWContextTreeNode.update_log_probability()`.)
+		"""
+
+		log_kt = self.log_kt[index]
+		child_0 = self.child[0][index]
+		child_1 = self.child[1][index]
+
+		if child_0 == no_child and child_1 == no_child:
+			self.log_probability[index] = log_kt
+			return
+		# end if
+
+		# A missing child has never been visited, so its weighted probability is 1.
+		log_children = 0.0
+		if child_0 != no_child:
+			log_children += self.log_probability[child_0]
+		# end if
+		if child_1 != no_child:
+			log_children += self.log_probability[child_1]
+		# end if
+
+		# Choose the formulation with the smaller exponent to avoid overflow.
+		a = max(log_kt, log_children)
+		b = min(log_kt, log_children)
+		self.log_probability[index] = log_half + a + math.log(1 + math.exp(b - a))
+	# end def
+
+	def update_path(self, symbol):
+		""" Updates the nodes of the current context with a new symbol, using NumPy array operations over
+			the whole path rather than updating one node at a time. (See `set_vectorized()`.)
+
+			With `P(n)`, `KT(n)` and `S(n)` the weighted probability, KT estimate and weighted probability of
+			the child off the context path of the node at depth `n`, and `D` the depth of the tree,
+
+			  P(n) = 1/2 KT(n) + 1/2 S(n) P(n + 1), and P(D) = KT(D),
+
+			which unrolls to a sum over the nodes from `n` to the leaf. The log probabilities of every node of
+			the path are then the reversed cumulative log-sum of its terms, less the log of the product
+			of the factors `1/2 S(m)` above each node.
+		"""
+
+		path = numpy.array(self.context)
+		counts = numpy.asarray(self.symbol_count[symbol])
+		log_kt = numpy.asarray(self.log_kt)
+		log_probability = numpy.asarray(self.log_probability)
+
+		# see `CTWContextTreeNode.update()`
+		symbol_counts = counts[path].astype(numpy.float64)
+		total_counts = symbol_counts + numpy.asarray(self.symbol_count[1 - symbol])[path]
+		counts[path] += 1
+		if self.rounded_log_probabilities:
+			# see `update_node()`
+			path_kt = numpy.array([log_kt_estimate(a, b) for a, b in
+			                       zip(numpy.asarray(self.symbol_count[0])[path].tolist(),
+			                           numpy.asarray(self.symbol_count[1])[path].tolist())])
+		else:
+			path_kt = log_kt[path] + numpy.log((symbol_counts + 0.5) / (total_counts + 1.0))
+		# end if
+		log_kt[path] = path_kt
+
+		# The weighted log probability of the child off the path of each node above the leaf, or 0 if it has none.
+		parents = path[:-1]
+		child_0 = numpy.asarray(self.child[0])[parents]
+		siblings = numpy.where(child_0 == path[1:], numpy.asarray(self.child[1])[parents], child_0)
+		log_siblings = numpy.where(siblings != no_child, log_probability[siblings], 0.0)
+
+		# log of the product of the factors 1/2 S(m) for m above each node, and the log of each term of P(0)
+		log_factors = numpy.concatenate(([0.0], numpy.cumsum(log_half + log_siblings)))
+		log_terms = log_factors + path_kt + log_half
+		log_terms[-1] -= log_half
+
+		log_probability[path] = numpy.logaddexp.accumulate(log_terms[::-1])[::-1] - log_factors
+	# end def
+
+	def update_node(self, index, symbol):
+		""" Updates the given node after having observed a new symbol.
+			(See `CTWContextTreeNode.update()`.)
+		"""
+
+		if self.rounded_log_probabilities:
+			# Calculate the rounded estimate from the counts, so that its rounding errors don't accumulate.
+			self.symbol_count[symbol][index] += 1
+			self.log_kt[index] = log_kt_estimate(self.symbol_count[0][index], self.symbol_count[1][index])
+		else:
+			self.log_kt[index] += self.log_kt_multiplier(index, symbol)
+			self.symbol_count[symbol][index] += 1
+		# end if
+		self.update_log_probability(index)
+	# end def
+
+	def visits(self, index):
+		""" Returns the number of times the context of the given node has been visited.
+		"""
+
+		return self.symbol_count[0][index] + self.symbol_count[1][index]
+	# end def
+# end class
@@ -0,0 +1,478 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define classes to implement context trees that store the ratio (beta) form of the Context Tree Weighting
+algorithm, rather than log probabilities.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import math
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree
+from pyaixi.prediction.ctw_context_tree import draw_symbol, generations, log_half
+
+# The range that the ratio `beta` of a node is kept within.
+# Once `beta` is this far from 1, the weighted conditional probability of the node is its KT estimate
+# (or that of its child) to within floating point precision, so predictions use `beta` clamped to this
+# range. To stop it overflowing or underflowing after long runs, while keeping updates reversible,
+# whole factors of `beta_maximum` are moved into an integer exponent (see `scale_ratio()`).
+beta_maximum = 2.0 ** 64
+beta_minimum = 2.0 ** -64
+
+# The power of two `beta_maximum` is.
+beta_exponent_step = 64
+
+def clamped_ratio(beta, exponent):
+	""" Returns the ratio `beta * 2**exponent`, given by `scale_ratio()`, clamped to between `beta_minimum`
+		and `beta_maximum`.
+	"""
+
+	if exponent == 0:
+		return beta
+	# end if
+
+	return beta_maximum if exponent > 0 else beta_minimum
+# end def
+
+def scale_ratio(beta, exponent):
+	""" Returns the ratio `beta * 2**exponent` as a `(beta, exponent)` pair, with `beta` between `beta_minimum`
+		and `beta_maximum`, and `exponent` a multiple of `beta_exponent_step`, which is 0 unless the ratio is
+		outside that range. Only powers of two are moved between them, so the ratio is unchanged.
+	"""
+
+	if exponent == 0 and beta_minimum <= beta <= beta_maximum:
+		return (beta, 0)
+	# end if
+
+	while beta > beta_maximum:
+		beta *= beta_minimum
+		exponent += beta_exponent_step
+	# end while
+	while beta < beta_minimum:
+		beta *= beta_maximum
+		exponent -= beta_exponent_step
+	# end while
+
+	# Move the exponent back into `beta` as far as the ratio allows.
+	while exponent > 0 and beta <= 1.0:
+		beta *= beta_maximum
+		exponent -= beta_exponent_step
+	# end while
+	while exponent < 0 and beta >= 1.0:
+		beta *= beta_minimum
+		exponent += beta_exponent_step
+	# end while
+
+	return (beta, exponent)
+# end def
+
+class CTWBetaContextTreeNode:
+	""" The CTWBetaContextTreeNode class represents a node in a context tree which stores the ratio
+
+		  beta = Pr_kt(h_n) / (P_w^n0(h_n0) P_w^n1(h_n1))
+
+		between the KT estimate of the node and the product of the weighted probabilities of its children,
+		instead of the log probabilities stored by `CTWContextTreeNode`. (See `CTWContextTreeNode` for the
+		notation.)
+
+		As `P_w^n = 1/2 Pr_kt(h_n) + 1/2 P_w^n0 P_w^n1 = 1/2 (beta + 1) P_w^n0 P_w^n1`, the weighted
+		conditional probability of the next symbol `x` at the node is
+
+		  P_w^n(x | h_n) = (beta Pr_kt(x | h_n) + P_w^c(x | h_c)) / (beta + 1)
+
+		where `c` is the child for the context of `x`, and the ratio is updated with
+
+		  beta := beta Pr_kt(x | h_n) / P_w^c(x | h_c)
+
+		So conditional probabilities are found, and the tree is updated, with a few multiplications
+		per node, instead of a `math.log` and a `math.exp`.
+
+		The ratio is kept as `beta * 2**beta_exponent` (see `scale_ratio()`), so that it can't overflow or
+		underflow, and a revert undoes an update exactly however far the ratio has grown.
+
+		Leaf nodes don't need a ratio, as their weighted probability is their KT estimate.
+	"""
+
+	# Instance methods.
+
+	def __init__(self, tree = None):
+		""" Construct a node of the context tree.
+		"""
+
+		# The children of this node.
+		self.children = {}
+
+		# The tree object associated with this node.
+		self.tree = tree
+
+		# The ratio between the KT estimate and the product of the children's weighted probabilities,
+		# `beta * 2**beta_exponent`. As both are 1 for an unvisited node, so is the ratio.
+		self.beta = 1.0
+		self.beta_exponent = 0
+
+		# The count of the symbols in the history subsequence relevant to this node.
+		self.symbol_count = {0: 0, 1: 0}
+	# end def
+
+	def is_leaf_node(self):
+		""" Return True if the node is a leaf node, False otherwise.
+		"""
+
+		return self.children == {}
+	# end def
+
+	def kt_probability(self, symbol):
+		""" Returns the KT estimate of the conditional probability of observing the given symbol.
+			(See `CTWContextTreeNode.log_kt_multiplier()`.)
+		"""
+
+		return (self.symbol_count[symbol] + 1 / 2) / (self.symbol_count[0] + self.symbol_count[1] + 1)
+	# end def
+
+	def probability(self, symbol, child_probability):
+		""" Returns the weighted conditional probability of observing the given symbol.
+
+			- `symbol`: the symbol to calculate the conditional probability of.
+			- `child_probability`: the weighted conditional probability of the symbol at the child
+			                       for the current context, or None if this node is a leaf of the context.
+		"""
+
+		if child_probability is None:
+			return self.kt_probability(symbol)
+		# end if
+
+		beta = clamped_ratio(self.beta, self.beta_exponent)
+		return (beta * self.kt_probability(symbol) + child_probability) / (beta + 1)
+	# end def
+
+	def restore(self, state):
+		""" Restores the node to a state returned by `snapshot()`.
+		"""
+
+		self.symbol_count[0], self.symbol_count[1], self.beta, self.beta_exponent, self.children = state
+	# end def
+
+	def revert(self, symbol, child_probability):
+		""" Reverts the node to its state immediately prior to the last update, deleting unnecessary
+			child nodes, and returns the weighted conditional probability the symbol had before the update.
+
+			- `symbol`: the symbol used in the previous update.
+			- `child_probability`: the conditional probability returned by reverting the child for the
+			                       current context, or None if this node is a leaf of the context.
+		"""
+
+		if self.symbol_count[symbol] >= 1:
+			self.symbol_count[symbol] -= 1
+		# end if
+
+		# Undo the ratio update, using the restored KT estimate.
+		if child_probability is not None:
+			self.beta, self.beta_exponent = scale_ratio(self.beta * child_probability / self.kt_probability(symbol),
+			                                            self.beta_exponent)
+		# end if
+
+		# Children are reverted before their parents, so any child left without visits is no longer needed.
+		for child_symbol in [key for key, child in self.children.items() if child.visits() == 0]:
+			del self.children[child_symbol]
+			self.tree.tree_size -= 1
+		# end for
+
+		return self.probability(symbol, child_probability)
+	# end def
+
+	def size(self):
+		""" The number of descendants of this node.
+		"""
+
+		return 1 + sum([child.size() for child in self.children.values()])
+	# end def
+
+	def snapshot(self):
+		""" Returns the state of the node, which can be restored by `restore()`.
+		"""
+
+		return (self.symbol_count[0], self.symbol_count[1], self.beta, self.beta_exponent, dict(self.children))
+	# end def
+
+	def update(self, symbol, child_probability):
+		""" Updates the node after having observed a new symbol, and returns the weighted conditional
+			probability of the symbol before the update.
+
+			- `symbol`: the symbol that was observed.
+			- `child_probability`: the conditional probability returned by updating the child for the
+			                       current context, or None if this node is a leaf of the context.
+		"""
+
+		probability = self.probability(symbol, child_probability)
+
+		if child_probability is not None:
+			self.beta, self.beta_exponent = scale_ratio(self.beta * self.kt_probability(symbol) / child_probability,
+			                                            self.beta_exponent)
+		# end if
+
+		self.symbol_count[symbol] += 1
+		return probability
+	# end def
+
+	def visits(self):
+		""" Returns the number of times this context has been visited.
+		"""
+
+		return self.symbol_count[0] + self.symbol_count[1]
+	# end def
+# end class
+
+
+class CTWBetaContextTree(ctw_context_tree.CTWContextTree):
+	""" An action-conditional context tree using `CTWBetaContextTreeNode` nodes.
+
+		It has the interface of `CTWContextTree`, and gives the same predictions to within floating point
+		tolerance, but stores a ratio per node rather than log probabilities, so updates, reversions and
+		predictions only multiply along the context path.
+		(See `CTWBetaContextTreeNode`.)
+
+		Since the tree doesn't store weighted probabilities, the weighted log probability of the history is
+		kept in `log_probability`, which the log-domain tree keeps as `root.log_probability`.
+		This takes one `math.log` per symbol.
+	"""
+
+	def __init__(self, depth):
+		""" Create a context tree of specified maximum depth.
+			Nodes are created as needed.
+
+			- `depth`: the maximum depth of the context tree.
+		"""
+
+		ctw_context_tree.CTWContextTree.__init__(self, depth)
+
+		# The weighted log probability of the history seen by the tree.
+		self.log_probability = 0.0
+	# end def
+
+	def clear(self):
+		""" Clears the entire context tree including all nodes and history.
+		"""
+
+		ctw_context_tree.CTWContextTree.clear(self)
+		self.log_probability = 0.0
+	# end def
+
+	def checkpoint(self):
+		""" Returns a token for the current state of the tree, which `rollback()` can restore.
+			(See `CTWContextTree.checkpoint()`.)
+		"""
+
+		return (ctw_context_tree.CTWContextTree.checkpoint(self), self.log_probability)
+	# end def
+
+	def create_node(self):
+		""" Returns a new, unvisited node for this tree.
+		"""
+
+		return CTWBetaContextTreeNode(tree = self)
+	# end def
+
+	def draw_and_update(self, uniform):
+		""" Returns a symbol drawn according to the context tree statistics with the given uniform
+			random number, after updating the context tree with it, together with the rescaled random number.
+			The context path is walked only once. (See `CTWContextTree.draw_and_update()`.)
+
+			- `uniform`: a random number in [0, 1).
+		"""
+
+		# Symbols without a complete context are not modelled by the tree, so treat them as uniform.
+		if len(self.history) < self.depth:
+			symbol, uniform = draw_symbol(uniform, 0.5)
+			self.update_history([symbol])
+			return (symbol, uniform)
+		# end if
+
+		self.generation = next(generations)
+		self.update_context()
+
+		# Find the conditional probability of both symbols at each node, from leaf to root.
+		probabilities = ([], [])
+		for symbol in (0, 1):
+			probability = None
+			for n in reversed(self.context):
+				probability = n.probability(symbol, probability)
+				probabilities[symbol].append(probability)
+			# end for
+		# end for
+
+		symbol, uniform = draw_symbol(uniform, probabilities[1][-1])
+
+		# Commit the drawn symbol, using the probabilities already found for the children.
+		child_probability = None
+		for n, probability in zip(reversed(self.context), probabilities[symbol]):
+			if child_probability is not None:
+				n.beta, n.beta_exponent = scale_ratio(n.beta * n.kt_probability(symbol) / child_probability,
+				                                      n.beta_exponent)
+			# end if
+			n.symbol_count[symbol] += 1
+			child_probability = probability
+		# end for
+
+		self.log_probability += math.log(child_probability)
+		self.update_history([symbol])
+		return (symbol, uniform)
+	# end def
+
+	def query_pruned_log_probability(self, key):
+		""" Returns zero, as the tree keeps no weighted probabilities for pruned children.
+			(See `CTWContextTree.query_pruned_log_probability()`.)
+		"""
+
+		return 0.0
+	# end def
+
+	def query_state(self, key):
+		""" Returns the (zero count, one count, ratio, ratio exponent) of the node with the given `predict()` key.
+			Nodes that don't exist yet have empty statistics.
+		"""
+
+		if type(key) == tuple:
+			return (0, 0, 1.0, 0)
+		# end if
+
+		return (key.symbol_count[0], key.symbol_count[1], key.beta, key.beta_exponent)
+	# end def
+
+	def query_symbol(self, changes, prefix, prefix_length, symbol, undo = None):
+		""" Returns `log(rho(y | hx))` for a symbol `y`, the history `h` and the first `prefix_length`
+			symbols `x` of `prefix`, without modifying the tree.
+			(See `CTWContextTree.query_symbol()`.)
+
+			Here, `changes` holds the (zero count, one count, ratio, ratio exponent) of the updated nodes.
+		"""
+
+		history = self.history
+		history_length = len(history)
+
+		# Symbols without a complete context are not modelled by the tree, so treat them as uniform.
+		if history_length + prefix_length < self.depth:
+			return log_half
+		# end if
+
+		# Find the keys of the nodes on the context path, from root to leaf.
+		key = self.query_root()
+		path = [key]
+		for i in xrange(0, self.depth):
+			if i < prefix_length:
+				context_symbol = prefix[prefix_length - 1 - i]
+			else:
+				context_symbol = history[history_length - 1 - (i - prefix_length)]
+			# end if
+			key = self.query_child_key(key, context_symbol)
+			path.append(key)
+		# end for
+
+		# Calculate the conditional probability at each node, and the statistics after the update, leaf first.
+		probability = None
+		for key in reversed(path):
+			state = changes.get(key)
+			if undo is not None:
+				undo.append((key, state))
+			# end if
+			if state is None:
+				state = self.query_state(key)
+			# end if
+			a, b, beta, exponent = state
+
+			kt_probability = ((b if symbol else a) + 1 / 2) / (a + b + 1)
+			if probability is None:
+				node_probability = kt_probability
+			else:
+				clamped_beta = clamped_ratio(beta, exponent)
+				node_probability = (clamped_beta * kt_probability + probability) / (clamped_beta + 1)
+				beta, exponent = scale_ratio(beta * kt_probability / probability, exponent)
+			# end if
+
+			if symbol == 0:
+				changes[key] = (a + 1, b, beta, exponent)
+			else:
+				changes[key] = (a, b + 1, beta, exponent)
+			# end if
+			probability = node_probability
+		# end for
+
+		return math.log(probability)
+	# end def
+
+	def revert(self, symbol_count = 1):
+		""" Restores the context tree to its state prior to a specified number of updates.
+
+			- `num_symbols`: the number of updates (symbols) to revert. (Default of 1.)
+		"""
+
+		self.generation = next(generations)
+		for i in xrange(0, symbol_count):
+			# The symbol was added with the context that preceded it.
+			symbol = self.history[len(self.history) - 1]
+			self.revert_history()
+
+			# Symbols seen before the history could fill a whole context never reached the nodes.
+			if len(self.history) < self.depth:
+				continue
+			# end if
+
+			self.update_context()
+
+			# Revert the children before their parents.
+			probability = None
+			for n in reversed(self.context):
+				probability = n.revert(symbol, probability)
+			# end for
+
+			self.log_probability -= math.log(probability)
+		# end for
+	# end def
+
+	def release_checkpoint(self, token):
+		""" Releases the checkpoint with the given token, after which it can't be rolled back to.
+		"""
+
+		ctw_context_tree.CTWContextTree.release_checkpoint(self, token[0])
+	# end def
+
+	def rollback(self, token):
+		""" Restores the tree to its state when `checkpoint()` returned the given token.
+		"""
+
+		ctw_context_tree.CTWContextTree.rollback(self, token[0])
+		self.log_probability = token[1]
+	# end def
+
+	def update(self, symbol_list):
+		""" Updates the context tree with a new (binary) symbol, or a list of symbols.
+			Recalculates the ratios for each affected node.
+
+			- `symbol_list`: the symbol (or list of symbols) with which to update the tree.
+							  (The context tree is updated with symbols in the order they appear in the list.)
+		"""
+
+		self.generation = next(generations)
+		for symbol in symbol_list:
+			# The first `depth` symbols have no complete context, so they only extend the history.
+			if len(self.history) >= self.depth:
+				self.update_context()
+
+				# Update the leaf first, as the ratio of each parent depends on its child.
+				probability = None
+				for n in reversed(self.context):
+					probability = n.update(symbol, probability)
+				# end for
+
+				self.log_probability += math.log(probability)
+			# end if
+
+			self.update_history([symbol])
+		# end for
+	# end def
+# end class
@@ -8,8 +8,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import array
+import collections
+import io
+import itertools
 import math
 import random
+import sys
+import time
 
 # Ensure xrange is defined on Python 3.
 from six.moves import xrange
@@ -18,6 +24,165 @@ from six.moves import xrange
 # This value is used often in computations and so is made a constant for efficiency reasons.
 log_half = math.log(0.5)
 
+# The largest floating point number less than 1, and so the largest number returned by `random.random()`.
+largest_uniform = 1.0 - 2.0 ** -53
+
+# A cache of the log KT multipliers `log((k + 1/2)/(n + 1))` (see `log_kt_multiplier()`), where
+# `log_kt_table[n][k]` is the multiplier for a symbol seen `k` times out of `n` symbols.
+# Rows are added as needed by `grow_log_kt_table()`, `log_kt_table_block_rows` at a time, up to
+# `log_kt_table_maximum_rows` rows. Multipliers beyond the table are calculated directly.
+log_kt_table = []
+
+# The number of rows added to `log_kt_table` whenever it grows.
+log_kt_table_block_rows = 64
+
+# The maximum memory, in bytes, for the values in `log_kt_table`, and the number of rows that fit in it.
+# Both are set by `set_log_kt_table_limit()`.
+log_kt_table_limit = 0
+log_kt_table_maximum_rows = 0
+
+# The ways of choosing the subtrees to prune when a context tree exceeds its node budget
+# (see `CTWContextTree.set_node_budget()`):
+#  - 'lru' prunes the subtrees whose contexts were least recently seen.
+#  - 'visits' prunes the subtrees whose contexts were seen fewer times than a threshold.
+pruning_policies = ('lru', 'visits')
+
+# The fraction of its node budget a tree is pruned down to, so that it isn't pruned again on the next update.
+pruning_target = 0.9
+
+# The default number of symbols `CTWContextTree.update_stream()` reads and updates the tree with at a time.
+stream_chunk_size = 4096
+
+# The default maximum number of released nodes a context tree keeps for reuse. (See `CTWContextTree.create_node()`.)
+node_pool_limit = 1 << 16
+
+# The default number of symbols a context must see before a context tree with an adaptive depth uses the
+# longer contexts below it. (See `CTWContextTree.set_adaptive_depth()`.)
+adaptive_depth_threshold = 8
+
+# The generations given to the states of context trees, each different from every other. Every change to the
+# nodes of a tree gives it the next one. (See `CTWContextTree.generation`.)
+generations = itertools.count(1)
+
+# The default number of predictions a context tree keeps in its prediction cache.
+# (See `CTWContextTree.set_prediction_cache()`.)
+prediction_cache_size = 4096
+
+def draw_symbol(uniform, probability):
+	""" Returns the symbol drawn with the given uniform random number, where the symbol is 1 with the
+		given probability, together with the random number rescaled to be uniform on [0, 1) again.
+
+		The symbol is 1 if `uniform < probability`, so a whole sequence of symbols can be drawn by
+		inverse transform sampling from a single random number.
+
+		- `uniform`: a random number in [0, 1).
+		- `probability`: the probability of drawing a 1.
+	"""
+
+	if uniform < probability:
+		uniform = uniform / probability
+		symbol = 1
+	else:
+		uniform = (uniform - probability) / (1 - probability)
+		symbol = 0
+	# end if
+
+	# Guard against rounding up to the end of the interval.
+	return (symbol, min(uniform, largest_uniform))
+# end def
+
+def grow_log_kt_table(total):
+	""" Adds blocks of rows to `log_kt_table`, up to `log_kt_table_maximum_rows`, so that it has the
+		row for the given symbol total. Returns True if it has the row, False otherwise.
+
+		- `total`: the number of symbols `n` seen at a node.
+	"""
+
+	if total >= log_kt_table_maximum_rows:
+		return False
+	# end if
+
+	rows = min((total // log_kt_table_block_rows + 1) * log_kt_table_block_rows, log_kt_table_maximum_rows)
+	for n in xrange(len(log_kt_table), rows):
+		log_kt_table.append(array.array('d', [math.log((k + 1 / 2) / (n + 1)) for k in xrange(0, n + 1)]))
+	# end for
+
+	return True
+# end def
+
+def log_kt_multiplier(a, b, symbol):
+	""" Returns the logarithm of the KT-estimator update multiplier for a node that has seen
+		`a` zeros and `b` ones, using `log_kt_table` where possible.
+		(See `CTWContextTreeNode.log_kt_multiplier()`.)
+
+		- `a`: the number of zeros seen.
+		- `b`: the number of ones seen.
+		- `symbol`: the symbol for which to calculate the log KT estimate of conditional probability.
+	"""
+
+	total = a + b
+	if total < len(log_kt_table) or grow_log_kt_table(total):
+		return log_kt_table[total][b if symbol else a]
+	# end if
+
+	return math.log(((b if symbol else a) + 1 / 2) / (total + 1))
+# end def
+
+def set_log_kt_table_limit(limit):
+	""" Sets the maximum memory, in bytes, for the values in `log_kt_table`, removing rows beyond it.
+		A limit of 0 disables the table.
+
+		- `limit`: the maximum memory in bytes.
+	"""
+
+	global log_kt_table_limit, log_kt_table_maximum_rows
+
+	# Each row `n` holds `n + 1` values of 8 bytes, so the first `rows` rows hold `rows (rows + 1) / 2`.
+	rows = 0
+	while 8 * (rows + 1) * (rows + 2) // 2 <= limit:
+		rows += 1
+	# end while
+
+	log_kt_table_limit = limit
+	log_kt_table_maximum_rows = rows
+	del log_kt_table[rows:]
+# end def
+
+# Allow the table 16 MB by default, which holds 2047 rows.
+set_log_kt_table_limit(16 * 1024 * 1024)
+
+def stream_chunks(source, chunk_size = stream_chunk_size):
+	""" Yields the symbols of the given source in lists of at most `chunk_size` symbols (rounded up to
+		a multiple of 8 for binary sources).
+
+		- `source`: an iterable (such as a list or a generator) of symbols, or a binary file or bytes
+		  object of symbols packed eight to a byte, least significant bit first
+		  (as in `ctw_history.BitPackedHistory`).
+		- `chunk_size`: the most symbols to yield at a time.
+	"""
+
+	if hasattr(source, 'read') or isinstance(source, (bytes, bytearray)):
+		read = source.read if hasattr(source, 'read') else io.BytesIO(source).read
+		byte_count = max(1, (chunk_size + 7) // 8)
+		while True:
+			data = bytearray(read(byte_count))
+			if len(data) == 0:
+				return
+			# end if
+			yield [(byte >> bit) & 1 for byte in data for bit in xrange(0, 8)]
+		# end while
+	else:
+		iterator = iter(source)
+		while True:
+			chunk = list(itertools.islice(iterator, chunk_size))
+			if len(chunk) == 0:
+				return
+			# end if
+			yield chunk
+		# end while
+	# end if
+# end def
+
 class CTWContextTreeNode:
 	""" The CTWContextTreeNode class represents a node in an action-conditional context tree.
 
@@ -107,14 +272,21 @@ class CTWContextTreeNode:
 
 		# The count of the symbols in the history subsequence relevant to this node.
 		self.symbol_count = {0: 0, 1: 0}
+
+		# The tree's `visit_clock` when this node was last part of the context.
+		self.last_visit = 0
+
+		# The sum of the weighted log probabilities of the children pruned from this node (see
+		# `CTWContextTree.prune()`), which stand in for them in the weighted probability of this node.
+		self.pruned_log_probability = 0.0
 	# end def
 
 	def is_leaf_node(self):
 		""" Return True if the node is a leaf node, False otherwise.
 		"""
 
-		# If this node has no children, it's a leaf node.
-		return self.children == {}
+		# If this node has no children, and none were pruned, it's a leaf node.
+		return self.children == {} and self.pruned_log_probability == 0.0
 	# end def
 
 	def log_kt_multiplier(self, symbol):
@@ -137,14 +309,13 @@ class CTWContextTreeNode:
 
 		# TODO(DONE): implement
 
+		# the multipliers are cached in `log_kt_table`, and looked up here directly for the common case
 		a = self.symbol_count[0]
 		b = self.symbol_count[1]
-		if symbol == 0:
-			log_kt = math.log((a + 1 / 2) / (a + b + 1))
-		else:
-			log_kt = math.log((b + 1 / 2) / (a + b + 1))
+		if a + b < len(log_kt_table):
+			return log_kt_table[a + b][b if symbol else a]
 
-		return log_kt
+		return log_kt_multiplier(a, b, symbol)
 	# end def
 
 	def revert(self, symbol):
@@ -160,15 +331,50 @@ class CTWContextTreeNode:
 		if self.symbol_count[symbol] >= 1:
 			self.symbol_count[symbol] -= 1
 
+		# The multiplier is calculated from the restored counts, undoing exactly what `update()` added.
 		self.log_kt -= self.log_kt_multiplier(symbol)
 
-		if symbol in self.children and self.children[symbol].visits() == 0:
-			del self.children[symbol]
-			self.tree.tree_size -= 1
+		# Undo the extension of the context below the node when the update that made it is reverted.
+		# (See `CTWContextTree.set_adaptive_depth()`.)
+		if self.tree.adaptive_threshold is not None and self.visits() == self.tree.adaptive_threshold:
+			self.pruned_log_probability = 0.0
+		# end if
+
+		if self.tree.deferred_pruning:
+			# Leave the node in place if it has no visits left, as a ghost for `CTWContextTree.compact()`.
+			if self.visits() == 0 and self is not self.tree.root:
+				self.tree.tree_size -= 1
+				self.tree.ghost_nodes += 1
+		else:
+			# Children are reverted before their parents, so any child left without visits is no longer needed.
+			for child_symbol in [key for key, child in self.children.items() if child.visits() == 0]:
+				self.tree.release_node(self.children.pop(child_symbol))
+				self.tree.tree_size -= 1
 
 		self.update_log_probability()
 	# end def
 
+	def reset(self):
+		""" Resets the node to the state of a new, unvisited node, so that it can be reused.
+		"""
+
+		self.children.clear()
+		self.symbol_count[0] = 0
+		self.symbol_count[1] = 0
+		self.log_kt = 0.0
+		self.log_probability = 0.0
+		self.last_visit = 0
+		self.pruned_log_probability = 0.0
+	# end def
+
+	def restore(self, state):
+		""" Restores the node to a state returned by `snapshot()`.
+		"""
+
+		self.symbol_count[0], self.symbol_count[1], self.log_kt, self.log_probability, self.children, \
+			self.pruned_log_probability, self.last_visit = state
+	# end def
+
 	def size(self):
 		""" The number of descendants of this node.
 		"""
@@ -177,6 +383,14 @@ class CTWContextTreeNode:
 		return 1 + sum([child.size() for child in self.children.values()])
 	# end def
 
+	def snapshot(self):
+		""" Returns the state of the node, which can be restored by `restore()`.
+		"""
+
+		return (self.symbol_count[0], self.symbol_count[1], self.log_kt, self.log_probability, dict(self.children),
+		        self.pruned_log_probability, self.last_visit)
+	# end def
+
 	def update(self, symbol):
 		""" Updates the node after having observed a new symbol.
 			This involves updating the symbol counts and recalculating the cached probabilities.
@@ -186,13 +400,12 @@ class CTWContextTreeNode:
 
 		# TODO(DONE): implement
 
-		self.symbol_count[symbol] += 1
 		# log[Pr_kt(a + 1, b)] = log[(a + 1 / 2) / (a + b + 1)] + log[Pr_kt(a, b)]
 		# log[Pr_kt(a, b + 1)] = log[(b + 1 / 2) / (a + b + 1)] + log[Pr_kt(a, b)]
-		self.log_kt = self.log_kt_multiplier(symbol)
+		# The multiplier must be calculated from the counts before they include the new symbol.
+		self.log_kt += self.log_kt_multiplier(symbol)
+		self.symbol_count[symbol] += 1
 		self.update_log_probability()
-
-
 	# end def
 
 	def update_log_probability(self):
@@ -232,19 +445,20 @@ class CTWContextTreeNode:
 
 		# TODO(DONE): implement
 
-		pr = 0
 		# log(P^n_w) := log(Pr_kt(h_n)            (if n is a leaf node)
 		if self.is_leaf_node():
 			pr = self.log_kt
 		# log(P^n_w) := log(1/2 Pr_kt(h_n)) + 1/2 P^n0_w x P^n1_w)      (if n is NOT a leaf node)
 		else:
-			pn01 = 0
+			# A missing child has never been visited, so its weighted probability is 1,
+			# unless it was pruned.
+			pn01 = self.pruned_log_probability
 			for key, child in self.children.items():
 				pn01 += child.log_probability
 
 			# choose smaller b to avoid overflow
-			a = max(pr, pn01)
-			b = min(pr, pn01)
+			a = max(self.log_kt, pn01)
+			b = min(self.log_kt, pn01)
 
 			pr = log_half + a + math.log(1 + math.exp(b-a))
 
@@ -277,10 +491,28 @@ class CTWContextTree:
 		- `update_history(symbol_or_list_of_symbols)` updates just the history
 		  after the agent has executed an action.
 
+		- `update_stream(source)` trains the tree on a long stream of symbols, a chunk at a time.
+
 		- `revert()` reverts the last update to the tree.
 
 		- `revert_history()` deletes the recent history.
 
+		- `set_history()` keeps the history in a `CTWHistory` ring buffer or a `BitPackedHistory`
+		  rather than a list.
+
+		- `checkpoint()` and `rollback()` save and restore the state of the tree, which is
+		  much cheaper than reverting the updates made since the checkpoint one by one.
+
+		- `set_node_budget()` limits the number of nodes, which `prune()` keeps to after updates.
+
+		- `set_deferred_pruning()` leaves the nodes reverts empty in the tree, for `compact()`
+		  to remove later in one pass.
+
+		- `set_adaptive_depth()` only uses the longer contexts below a context once it has been
+		  seen often enough.
+
+		- `set_prediction_cache()` keeps recent predictions, so that repeating one doesn't walk the tree.
+
 		- `predict()` predicts the probability of future outcomes.
 
 		- `generate_random_symbols_and_update()` samples a sequence from the
@@ -311,11 +543,90 @@ class CTWContextTree:
 		# The history (a list) of symbols seen by the tree.
 		self.history = []
 
-		# The root node of the context tree.
-		self.root = CTWContextTreeNode(tree = self)
+		# The undo journal kept while there is a checkpoint (see `checkpoint()`), or None,
+		# and the number of checkpoints not yet released.
+		self.journal = None
+		self.checkpoint_count = 0
 
-		# The size of this tree.
-		self.tree_size = 1
+		# Whether the nodes store their log probabilities rounded to less than double precision, in which case
+		# `predict()` recalculates the probability of the history rather than reading it from the root.
+		self.rounded_log_probabilities = False
+
+		# The released nodes kept for reuse by `create_node()`, and the most that are kept.
+		self.free_nodes = []
+		self.node_pool_limit = node_pool_limit
+
+		# The number of nodes `create_node()` has allocated, and the number it has reused from `free_nodes`.
+		self.allocated_nodes = 0
+		self.reused_nodes = 0
+
+		# The root node of the context tree, and the size of this tree, not counting ghost nodes.
+		# Subclasses keeping their nodes differently create them in `create_nodes()`.
+		self.create_nodes()
+
+		# Whether nodes left without visits by reverts stay in the tree, and the number that have.
+		# (See `set_deferred_pruning()`.)
+		self.deferred_pruning = False
+		self.ghost_nodes = 0
+
+		# The (parent, node) pairs of the nodes that reverts left as ghosts below ordinary nodes, which
+		# `compact()` removes, or None if it has to search the whole tree for them.
+		self.ghost_parents = []
+
+		# The number of ghost nodes above which they are removed by `compact()`, or None.
+		self.max_ghost_nodes = None
+
+		# The maximum number of nodes, or None for no limit, and how nodes are chosen to be pruned
+		# when there are more. (See `set_node_budget()`.)
+		self.max_nodes = None
+		self.pruning_policy = 'lru'
+		self.pruning_threshold = 2
+
+		# The number of contexts visited, which stamps the `last_visit` of the nodes of each context for
+		# the 'lru' policy. Unlike the length of the history, it never goes back on a revert or rollback,
+		# so the ancestors of a node are always stamped at least as late as it is.
+		self.visit_clock = 0
+
+		# The number of nodes pruned.
+		self.pruned_nodes = 0
+
+		# The number of symbols a context must see before the contexts below it are used, or None for
+		# a fixed depth. (See `set_adaptive_depth()`.)
+		self.adaptive_threshold = None
+
+		# The depth of the deepest context updated so far, and the number of updates whose context was
+		# of each depth (indexed by depth).
+		self.effective_depth = 0
+		self.context_depth_counts = [0] * (depth + 1)
+
+		# The generation of the nodes' statistics, taken from `generations` whenever they change,
+		# and restored with them by `rollback()`. Changes to the history alone keep the generation.
+		self.generation = next(generations)
+
+		# The cache of recent predictions, or None. (See `set_prediction_cache()`.)
+		self.set_prediction_cache(None)
+	# end def
+
+	def checkpoint(self):
+		""" Returns a token for the current state of the tree, which `rollback()` can restore.
+
+			While there is a checkpoint, the previous state of each node is appended to the undo `journal`
+			before the node is changed, together with any symbols removed from the history.
+			Rolling back restores these states in reverse, without recalculating any probabilities,
+			so it costs time proportional to the number of nodes changed.
+
+			Checkpoints can be nested, and a token stays valid after it is rolled back to, until
+			`release_checkpoint()` is called with it. The token ends with the number of checkpoints
+			the new one is nested in.
+		"""
+
+		if self.journal is None:
+			self.journal = []
+			self.checkpoint_count = 0
+		self.checkpoint_count += 1
+
+		return (len(self.journal), len(self.history), self.tree_size, self.ghost_nodes, self.generation,
+		        self.checkpoint_count - 1)
 	# end def
 
 	def clear(self):
@@ -323,47 +634,227 @@ class CTWContextTree:
 		"""
 
 		# Reset the history.
-		self.history = []
+		del self.history[:]
 
 		# Set a new root object, and reset the tree size.
 		self.root.tree = None
 		del self.root
-		self.root = CTWContextTreeNode(tree = self)
-		self.tree_size = 1
+		self.create_nodes()
+		self.ghost_nodes = 0
+		self.ghost_parents = []
+		self.generation = next(generations)
 
-		# Reset the context.
+		# Reset the context, and discard any checkpoints.
 		self.context = []
+		self.journal = None
+
+		# Reset the pruning count, and the depths of the contexts updated.
+		self.pruned_nodes = 0
+		self.effective_depth = 0
+		self.context_depth_counts = [0] * (self.depth + 1)
+	# end def
+
+	def compact(self):
+		""" Removes the ghost nodes left in the tree by reverts (see `set_deferred_pruning()`),
+			and returns the number removed.
+		"""
+
+		assert self.journal is None, "The tree can't be compacted while there is a checkpoint."
+
+		ghost_nodes = self.ghost_nodes
+		if ghost_nodes == 0:
+			self.ghost_parents = []
+			return 0
+		# end if
+		self.generation = next(generations)
+
+		# The descendants of a ghost are ghosts too, so each node without visits is removed with its subtree.
+		if self.ghost_parents is None:
+			stack = [self.root]
+			while len(stack) > 0:
+				node = stack.pop()
+				for symbol, child in list(node.children.items()):
+					if child.visits() == 0:
+						self.prune_child(node, symbol)
+					else:
+						stack.append(child)
+					# end if
+				# end for
+			# end while
+		else:
+			# Skip the ghosts used again since, and those below a parent that became a ghost later,
+			# which are removed with the parent's subtree.
+			for parent, node in self.ghost_parents:
+				if node.visits() == 0 and (parent.visits() > 0 or parent is self.root):
+					for symbol, child in list(parent.children.items()):
+						if child is node:
+							self.prune_child(parent, symbol)
+						# end if
+					# end for
+				# end if
+			# end for
+		# end if
+		self.ghost_parents = []
+
+		return ghost_nodes - self.ghost_nodes
+	# end def
+
+	def create_node(self):
+		""" Returns a new, unvisited node for this tree.
+
+			Nodes released by `release_node()` are reset and reused before any new ones are allocated,
+			which saves allocating and collecting the nodes that searches create and revert again and again.
+			`allocated_nodes` and `reused_nodes` count each case.
+
+			While there is a checkpoint, the node is journaled, so that `rollback()` can release it.
+		"""
+
+		if len(self.free_nodes) > 0:
+			node = self.free_nodes.pop()
+			node.reset()
+			self.reused_nodes += 1
+		else:
+			node = CTWContextTreeNode(tree = self)
+			self.allocated_nodes += 1
+		# end if
+
+		if self.journal is not None:
+			self.journal.append((node, None, None))
+		# end if
+
+		return node
 	# end def
 
-	def generate_random_symbols(self, symbol_count):
+	def create_nodes(self):
+		""" Creates the nodes of an empty tree, which is just the root node, and resets the tree size.
+			Called by `__init__()` and `clear()`, so that subclasses storing their nodes differently only
+			need to override this, and can still call `CTWContextTree.__init__()` for the rest of the tree's state.
+		"""
+
+		self.root = self.create_node()
+		self.tree_size = 1
+	# end def
+
+	def draw_and_update(self, uniform):
+		""" Returns a symbol drawn according to the context tree statistics with the given uniform
+			random number, after updating the context tree with it, together with the random number
+			rescaled for drawing another symbol. (See `draw_symbol()`.)
+
+			The context path is walked only once: for every node, from the leaf to the root, the
+			KT estimates and weighted probabilities that would follow both a zero and a one are computed
+			from the current statistics. Then `rho(1 | h)` is given by the two root probabilities, and
+			the values for the drawn symbol are written back to the nodes.
+
+			- `uniform`: a random number in [0, 1).
+		"""
+
+		# symbols without a complete context are not modelled by the tree, so treat them as uniform
+		if len(self.history) < self.depth:
+			symbol, uniform = draw_symbol(uniform, 0.5)
+			self.update_history([symbol])
+			return (symbol, uniform)
+
+
+		self.generation = next(generations)
+		self.update_context()
+
+		# the candidate (log KT estimate, weighted log probability) of each node for a zero and a one,
+		# in order from leaf to root
+		candidates = ([], [])
+		child = None
+		for n in reversed(self.context):
+			a = n.symbol_count[0]
+			b = n.symbol_count[1]
+			for symbol in (0, 1):
+				# log(Pr_kt(symbol | 0^a 1^b)), as given by `log_kt_multiplier()`
+				log_kt = n.log_kt + log_kt_multiplier(a, b, symbol)
+
+				# the weighted probability, as given by `update_log_probability()`, using the
+				# candidate value for the child on the context path
+				if n.is_leaf_node():
+					log_probability = log_kt
+				else:
+					pn01 = n.pruned_log_probability
+					for key, node_child in n.children.items():
+						if node_child is child:
+							pn01 += candidates[symbol][-1][1]
+						else:
+							pn01 += node_child.log_probability
+
+					# choose smaller b to avoid overflow
+					high = max(log_kt, pn01)
+					low = min(log_kt, pn01)
+					log_probability = log_half + high + math.log(1 + math.exp(low - high))
+
+				candidates[symbol].append((log_kt, log_probability))
+			child = n
+
+		# rho(1 | h) = rho(h1)/rho(h), as given by `predict([1])`
+		symbol, uniform = draw_symbol(uniform, math.exp(candidates[1][-1][1] - self.root.log_probability))
+
+		# commit the values for the sampled symbol
+		for n, (log_kt, log_probability) in zip(reversed(self.context), candidates[symbol]):
+			n.symbol_count[symbol] += 1
+			n.log_kt = log_kt
+			n.log_probability = log_probability
+
+		self.update_history([symbol])
+		self.keep_to_node_budget()
+		return (symbol, uniform)
+	# end def
+
+
+	def estimated_node_bytes(self):
+		""" Returns an estimate of the memory used by each node of the tree, in bytes.
+		"""
+
+		# Measure a node with two children. It's made directly rather than by `create_node()`, so that it isn't
+		# taken from the pool or journaled, and is never part of the tree.
+		node = CTWContextTreeNode(tree = self)
+		node.children = {0: None, 1: None}
+		return sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.symbol_count) + \
+		       sys.getsizeof(node.children) + 2 * sys.getsizeof(node.log_kt)
+	# end def
+
+	def generate_random_symbols(self, symbol_count, single_draw = False):
 		""" Returns a symbol string of a specified length by sampling from the context tree.
 
 			- `symbol_count`: the number of symbols to generate.
+			- `single_draw`: whether to draw the whole string with one random number.
+			                 (See `generate_random_symbols_and_update()`.)
 		"""
-		symbol_list = self.generate_random_symbols_and_update(symbol_count)
+		symbol_list = self.generate_random_symbols_and_update(symbol_count, single_draw)
 		self.revert(symbol_count)
 
 		return symbol_list
 	# end def
 
-	def generate_random_symbols_and_update(self, symbol_count):
+	def generate_random_symbols_and_update(self, symbol_count, single_draw = False):
 		""" Returns a specified number of random symbols distributed according to
 			the context tree statistics and update the context tree with the newly
 			generated symbols.
 
 			- `symbol_count`: the number of symbols to generate.
+			- `single_draw`: whether to draw the whole string with one random number, rather than
+			                 one random number per symbol.
+			                 The number `u` is used by inverse transform sampling: each symbol is
+			                 chosen by comparing `u` with `rho(1 | h)`, and `u` is then rescaled to the
+			                 chosen interval, so it is uniformly distributed again for the next symbol.
 		"""
 
-		# TODO: implement
+		# TODO(DONE): implement
 
+		# each symbol is drawn and committed in one pass over its context path (see `draw_and_update()`),
+		# rather than calling `predict([1])` (an update and a revert) and then `update()`
 		symbol_list = []
-		for i in range(0, symbol_count):
-			if random.randint(0, 1) >= self.predict([1]):
-				next_symbol = 1
-			else:
-				next_symbol = 0
-			symbol_list.append(next_symbol)
-			self.update([next_symbol])
+		if single_draw:
+			uniform = random.random()
+			for i in range(0, symbol_count):
+				symbol, uniform = self.draw_and_update(uniform)
+				symbol_list.append(symbol)
+		else:
+			for i in range(0, symbol_count):
+				symbol_list.append(self.sample_and_update())
 
 		return symbol_list
 	# end def
@@ -382,20 +873,319 @@ class CTWContextTree:
 							0 corresponds to `rho(0 | h)` and 1 to `rho(1 | h)`.
 		"""
 
-		# TODO: implement
+		# TODO(DONE): implement
+
+		# The query doesn't modify the tree: it evaluates the context path of each symbol from the leaf
+		# to the root, calculating the statistics the nodes would have after the update, and keeps these
+		# in a local dictionary so that later symbols of the list see the earlier ones.
+		# This makes `predict()` safe to call from several readers of the same tree, unless it keeps
+		# its predictions in a cache (see `set_prediction_cache()`).
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		# A prediction depends only on the nodes, the end of the history that holds the contexts, and the symbols.
+		cache = self.prediction_cache
+		if cache is not None:
+			history_length = len(self.history)
+			key = (self.generation, tuple(self.history[max(0, history_length - self.depth):history_length]),
+			       tuple(symbol_list))
+			probability = cache.pop(key, None)
+			if probability is not None:
+				# keep the prediction as the most recently used
+				cache[key] = probability
+				self.cache_hits += 1
+				return probability
+			# end if
+			self.cache_misses += 1
+		# end if
+
+		# The (zero count, one count, log KT estimate, weighted log probability) each node would have,
+		# indexed by node key (see `query_child_key()`).
+		changes = {}
+
+		# log(rho(y | h))
+		log_conditional = 0.0
+		for j, symbol in enumerate(symbol_list):
+			log_conditional += self.query_symbol(changes, symbol_list, j, symbol)
+
+		probability = math.exp(log_conditional)
+		if cache is not None:
+			cache[key] = probability
+			if len(cache) > self.max_cached_predictions:
+				# evict the least recently used prediction
+				cache.popitem(last = False)
+				self.cache_evictions += 1
+			# end if
+		# end if
+
+		return probability
+	# end def
+
+	def predict_distribution(self, symbol_count):
+		""" Returns the conditional probabilities of every sequence of `symbol_count` symbols, considering the history.
+
+			The result is a list of `2^symbol_count` probabilities, where the probability of a sequence
+			is at the index given by reading the sequence as a binary number with the first symbol as
+			the most significant bit (the order used by `util.encode()`).
+			So `predict_distribution(k)[i] == predict(util.encode(i, k))`.
 
-		# rho(h)
-		pw_h = self.root.log_probability
+			The sequences are enumerated as a binary trie, so each prefix is evaluated only once:
+			this takes `2^(symbol_count + 1) - 2` path evaluations rather than `symbol_count 2^symbol_count`.
+			As with `predict()`, the tree isn't modified.
 
-		# add y to h to produce rho(hy)
-		self.update(symbol_list)
-		pw_hy = self.root.log_probability
+			- `symbol_count`: the number of symbols in each sequence.
+		"""
+
+		distribution = []
+
+		# The node statistics for the current prefix of the trie, as kept by `predict()`.
+		changes = {}
+		prefix = []
+
+		def visit(log_conditional):
+			""" Adds the probabilities of the sequences that start with `prefix` to `distribution`.
+			"""
+
+			if len(prefix) == symbol_count:
+				distribution.append(math.exp(log_conditional))
+				return
+
+			for symbol in (0, 1):
+				# evaluate the next symbol, remembering the statistics it replaced so they can be restored
+				undo = []
+				log_symbol = self.query_symbol(changes, prefix, len(prefix), symbol, undo)
+
+				prefix.append(symbol)
+				visit(log_conditional + log_symbol)
+				prefix.pop()
+
+				for key, state in reversed(undo):
+					if state is None:
+						del changes[key]
+					else:
+						changes[key] = state
+		# end def
+
+		visit(0.0)
+		return distribution
+	# end def
+
+	def query_child_key(self, key, symbol):
+		""" Returns the key `predict()` uses for the child of the node with the given key.
+
+			An existing node is its own key. A node that doesn't exist yet is keyed by the tuple
+			`(node, bits, length)` of its deepest existing ancestor `node` and the `length` context
+			symbols below that ancestor, packed into the integer `bits`.
+
+			- `key`: the key of the parent node.
+			- `symbol`: the context symbol leading to the child.
+		"""
+
+		if type(key) == tuple:
+			node, bits, length = key
+			return (node, bits | (symbol << length), length + 1)
 
-		# revert y from h
-		self.revert(len(symbol_list))
+		child = key.children.get(symbol)
+		if child is None:
+			return (key, symbol, 1)
 
-		# return rho(hy)/rho(h) => exp(pw_hy) / exp(pw_h)
-		return math.exp(pw_hy - pw_h)
+		return child
+	# end def
+
+	def query_path_log_probability(self, changes, path):
+		""" Returns the weighted log probability of the root recalculated from the nodes of the given
+			context path, leaf first, with their statistics in `changes` or in the tree. (See `query_symbol()`.)
+
+			Trees that store rounded log probabilities (see `rounded_log_probabilities`) compare the updated
+			root with this, rather than with the stored root, so that the rounding of the values stored on
+			the path cancels out of the conditional probability.
+		"""
+
+		log_probability = 0.0
+		path_child = None
+		for key in reversed(path):
+			state = changes.get(key)
+			if state is None:
+				state = self.query_state(key)
+			# end if
+			log_kt = state[2]
+
+			pn01 = self.query_pruned_log_probability(key)
+			has_children = pn01 != 0.0
+			for child_symbol in (0, 1):
+				child_key = self.query_child_key(key, child_symbol)
+				if child_key == path_child:
+					if type(child_key) == tuple and child_key not in changes:
+						# the path continues to a node that doesn't exist yet
+						continue
+					# end if
+					pn01 += log_probability
+				elif child_key in changes:
+					pn01 += changes[child_key][3]
+				elif type(child_key) != tuple:
+					pn01 += self.query_state(child_key)[3]
+				else:
+					continue
+				# end if
+				has_children = True
+			# end for
+
+			if not has_children:
+				log_probability = log_kt
+			else:
+				high = max(log_kt, pn01)
+				low = min(log_kt, pn01)
+				log_probability = log_half + high + math.log(1 + math.exp(low - high))
+			# end if
+
+			path_child = key
+		# end for
+
+		return log_probability
+	# end def
+
+	def query_pruned_log_probability(self, key):
+		""" Returns the sum of the weighted log probabilities of the children pruned from the node with
+			the given `predict()` key. (See `prune()`.)
+		"""
+
+		if type(key) == tuple:
+			return 0.0
+
+		return key.pruned_log_probability
+	# end def
+
+	def query_root(self):
+		""" Returns the key `predict()` uses for the root node.
+		"""
+
+		return self.root
+	# end def
+
+	def query_state(self, key):
+		""" Returns the (zero count, one count, log KT estimate, weighted log probability) of the node
+			with the given `predict()` key. Nodes that don't exist yet have empty statistics.
+		"""
+
+		if type(key) == tuple:
+			return (0, 0, 0.0, 0.0)
+
+		return (key.symbol_count[0], key.symbol_count[1], key.log_kt, key.log_probability)
+	# end def
+
+	def query_symbol(self, changes, prefix, prefix_length, symbol, undo = None):
+		""" Returns `log(rho(y | hx))` for a symbol `y`, the history `h` and the first `prefix_length`
+			symbols `x` of `prefix`, without modifying the tree.
+
+			The statistics the nodes would have after the update are stored in `changes`, which must
+			already hold those for `x`. (See `predict()`.)
+
+			- `changes`: the (zero count, one count, log KT estimate, weighted log probability) of the
+			             updated nodes, indexed by node key (see `query_child_key()`).
+			- `prefix`: the list of symbols observed after the history.
+			- `prefix_length`: the number of symbols of `prefix` to use.
+			- `symbol`: the symbol to calculate the conditional probability of.
+			- `undo`: if given, a list to append the `(key, previous statistics or None)` of each changed
+			          node to, so that `changes` can be restored.
+		"""
+
+		history = self.history
+		history_length = len(history)
+
+		# symbols without a complete context are not modelled by the tree, so treat them as uniform
+		if history_length + prefix_length < self.depth:
+			return log_half
+
+		# find the keys of the nodes on the context path, from root to leaf, following the history
+		# extended by the prefix
+		root = self.query_root()
+		path = [root]
+		key = root
+		for i in xrange(0, self.depth):
+			# with an adaptive depth, the path ends at a context seen too few times (see `update_context()`)
+			if self.adaptive_threshold is not None:
+				state = changes.get(key)
+				if state is None:
+					state = self.query_state(key)
+				# end if
+				if state[0] + state[1] < self.adaptive_threshold:
+					break
+				# end if
+			# end if
+
+			if i < prefix_length:
+				context_symbol = prefix[prefix_length - 1 - i]
+			else:
+				context_symbol = history[history_length - 1 - (i - prefix_length)]
+			key = self.query_child_key(key, context_symbol)
+			path.append(key)
+
+		# rho(hx)
+		if self.rounded_log_probabilities:
+			pw_h = self.query_path_log_probability(changes, path)
+		else:
+			pw_h = changes.get(root, self.query_state(root))[3]
+
+		# calculate the statistics of each node after observing the symbol, leaf first
+		path_child = None
+		for key in reversed(path):
+			state = changes.get(key)
+			if undo is not None:
+				undo.append((key, state))
+			if state is None:
+				state = self.query_state(key)
+			a, b, log_kt = state[0], state[1], state[2]
+
+			# see `CTWContextTreeNode.update()`
+			log_kt += log_kt_multiplier(a, b, symbol)
+			if symbol == 0:
+				a += 1
+			else:
+				b += 1
+
+			# see `CTWContextTreeNode.update_log_probability()`
+			pn01 = self.query_pruned_log_probability(key)
+			if self.adaptive_threshold is not None and path_child is not None and pn01 == 0.0 and \
+			   (type(key) == tuple or not key.children):
+				# the update extends the context below the node (see `update_context()`), keeping the
+				# log KT estimate it had then, which is noted for the symbols after it
+				extension_key = (key, None)
+				if extension_key not in changes:
+					changes[extension_key] = state[2]
+					if undo is not None:
+						undo.append((extension_key, None))
+					# end if
+				# end if
+				pn01 = changes[extension_key]
+			# end if
+			has_children = pn01 != 0.0
+			for child_symbol in (0, 1):
+				child_key = self.query_child_key(key, child_symbol)
+				if child_key == path_child:
+					pn01 += log_probability
+				elif child_key in changes:
+					pn01 += changes[child_key][3]
+				elif type(child_key) != tuple:
+					pn01 += self.query_state(child_key)[3]
+				else:
+					continue
+				has_children = True
+
+			if not has_children:
+				log_probability = log_kt
+			else:
+				high = max(log_kt, pn01)
+				low = min(log_kt, pn01)
+				log_probability = log_half + high + math.log(1 + math.exp(low - high))
+
+			changes[key] = (a, b, log_kt, log_probability)
+			path_child = key
+
+		# rho(y | hx) = rho(hxy)/rho(hx)
+		return log_probability - pw_h
 	# end def
 
 	def revert(self, symbol_count = 1):
@@ -406,21 +1196,178 @@ class CTWContextTree:
 
 		# TODO: implement
 
+		self.generation = next(generations)
 		for i in range(0, symbol_count):
 
 			# symbol count to revert should never exceeds length of history in practice, hence we shouldn't need to
 			# particularly handle for boundary case
-			symbol = self.history[len(self.history) - 1 - i]
+			symbol = self.history[len(self.history) - 1]
 
-			self.update_context()
+			# the symbol was added with the context that preceded it, so remove it from history before
+			# finding the context
+			self.revert_history()
+
+			# symbols seen before the history could fill a whole context never reached the nodes
+			if len(self.history) < self.depth:
+				continue
+
+			if self.adaptive_threshold is None:
+				self.update_context()
+			else:
+				self.update_context(reverting = True)
+			# end if
 
 			# nodes in self.context are in order of parent -> children, we need to revert children then parent
 			for n in reversed(self.context):
 				n.revert(symbol)
 
-			# revert the symbol from history
-			self.revert_history()
+			# note where any ghosts the revert left hang from the tree, for `compact()`
+			if self.deferred_pruning and self.ghost_parents is not None and self.context[-1].visits() == 0:
+				context = self.context
+				for d in range(1, len(context)):
+					if context[d].visits() == 0:
+						self.ghost_parents.append((context[d - 1], context[d]))
+						break
+					# end if
+				# end for
+			# end if
+
+		# remove the ghost nodes once there are too many, unless a checkpoint may still roll the tree back
+		if self.max_ghost_nodes is not None and self.ghost_nodes > self.max_ghost_nodes and self.journal is None:
+			self.compact()
+	# end def
+
+	def prune(self, max_nodes):
+		""" Removes subtrees, chosen by the pruning policy, until the tree has at most `max_nodes` nodes,
+			and returns the number of nodes removed.
+
+			The weighted log probability of each removed subtree is added to the `pruned_log_probability`
+			of its parent, which stands in for it from then on. So the weighted probabilities of the
+			remaining nodes, and the probability of the history, are unchanged by pruning, and later
+			predictions stay normalised. If the context of a removed subtree is seen again, a new
+			subtree is grown for it, which only learns from the symbols seen since.
+
+			The cost is in later predictions, which can no longer use the statistics of the removed
+			contexts. (The `pruning` benchmark of `ctw_benchmark.py` measures this.)
+
+			- `max_nodes`: the number of nodes to prune the tree to.
+		"""
+
+		tree_size = self.tree_size
+		self.generation = next(generations)
+
+		# the nodes noted as ghosts may be removed (see `compact()`)
+		if self.ghost_parents:
+			self.ghost_parents = None
+
+		if self.pruning_policy == 'lru':
+			# Consider the least recently visited nodes first. The ancestors of a node were visited at least as
+			# recently as it was, so take deeper nodes first among those visited at the same time, which makes
+			# each node come after its descendants.
+			nodes = []
+			stack = [(self.root, 0)]
+			while len(stack) > 0:
+				node, depth = stack.pop()
+				for symbol, child in node.children.items():
+					nodes.append((child, depth + 1, node, symbol))
+					stack.append((child, depth + 1))
+				# end for
+			# end while
+			nodes.sort(key = lambda entry: (entry[0].last_visit, -entry[1]))
+
+			for child, depth, parent, symbol in nodes:
+				if self.tree_size <= max_nodes:
+					break
+				# end if
+				self.prune_child(parent, symbol)
+			# end for
+		else:
+			# Remove the subtrees visited fewer times than the threshold, doubling it until enough are removed.
+			# The descendants of a node are visited no more often than it is, so whole subtrees are removed.
+			threshold = self.pruning_threshold
+			while self.tree_size > max_nodes:
+				stack = [self.root]
+				while len(stack) > 0:
+					node = stack.pop()
+					for symbol, child in list(node.children.items()):
+						if child.visits() < threshold:
+							self.prune_child(node, symbol)
+						else:
+							stack.append(child)
+						# end if
+					# end for
+				# end while
+				threshold *= 2
+			# end while
+		# end if
 
+		self.pruned_nodes += tree_size - self.tree_size
+		return tree_size - self.tree_size
+	# end def
+
+	def prune_child(self, node, symbol):
+		""" Removes the subtree of the given node's child for the given symbol, keeping its weighted
+			log probability in the node. (See `prune()`.)
+		"""
+
+		child = node.children.pop(symbol)
+		node.pruned_log_probability += child.log_probability
+
+		# release the nodes of the subtree
+		stack = [child]
+		while len(stack) > 0:
+			child = stack.pop()
+			stack.extend(child.children.values())
+			self.release_node(child)
+			if child.visits() == 0:
+				self.ghost_nodes -= 1
+			else:
+				self.tree_size -= 1
+			# end if
+		# end while
+	# end def
+
+	def keep_to_node_budget(self):
+		""" Prunes the tree to `pruning_target` of its node budget if updates have grown it past the budget,
+			unless a checkpoint may still roll the tree back. Called after every update, sampled or not.
+			(See `set_node_budget()`.)
+		"""
+
+		if self.max_nodes is not None and self.tree_size > self.max_nodes and self.journal is None:
+			self.prune(int(self.max_nodes * pruning_target))
+		# end if
+	# end def
+
+	def release_node(self, node):
+		""" Keeps a node deleted from the tree for reuse by `create_node()`, if there is room in the pool.
+
+			Nodes aren't kept while there is a checkpoint, as the journal may still refer to them. Those
+			created since the checkpoint are released by `rollback()` instead.
+		"""
+
+		if self.journal is None and len(self.free_nodes) < self.node_pool_limit:
+			self.free_nodes.append(node)
+		# end if
+	# end def
+
+	def history_size(self):
+		""" Returns the length of the history.
+		"""
+
+		return len(self.history)
+	# end def
+
+	def release_checkpoint(self, token):
+		""" Releases the checkpoint with the given token, after which it can't be rolled back to.
+			The undo journal is discarded once the first checkpoint is released, ending any checkpoints
+			nested in it. (Those taken before anything was journaled have the journal length of the first,
+			so it's told apart by its nesting.)
+		"""
+
+		if token[5] == 0:
+			self.journal = None
+		elif self.journal is not None:
+			self.checkpoint_count -= 1
 	# end def
 
 	def revert_history(self, symbol_count = 1):
@@ -432,7 +1379,193 @@ class CTWContextTree:
 		assert history_length >= symbol_count, "The given symbol count must be greater than the history length."
 
 		new_size = history_length - symbol_count
-		self.history = self.history[:new_size]
+
+		# keep the removed symbols, so that a rollback can restore them
+		if self.journal is not None:
+			self.journal.append((None, new_size, self.history[new_size:]))
+
+		del self.history[new_size:]
+	# end def
+
+	def rollback(self, token):
+		""" Restores the tree to its state when `checkpoint()` returned the given token.
+		"""
+
+		journal_length, history_length, tree_size, ghost_nodes, generation = token[0:5]
+		journal = self.journal
+		while len(journal) > journal_length:
+			node, state, removed_symbols = journal.pop()
+			if node is None:
+				# restore symbols removed from the history
+				del self.history[state:]
+				self.history.extend(removed_symbols)
+			elif state is None:
+				# the node was created since the checkpoint, so nothing refers to it once the journal
+				# entries before it are restored
+				if len(self.free_nodes) < self.node_pool_limit:
+					self.free_nodes.append(node)
+			else:
+				node.restore(state)
+
+		del self.history[history_length:]
+		self.tree_size = tree_size
+		self.ghost_nodes = ghost_nodes
+
+		# the nodes are as they were, so cached predictions of that state hold again
+		self.generation = generation
+
+		# nodes noted as ghosts since the checkpoint may no longer be in the tree
+		if self.ghost_parents:
+			self.ghost_parents = None
+	# end def
+
+	def sample_and_update(self):
+		""" Returns a random symbol distributed according to the context tree statistics,
+			after updating the context tree with it.
+
+			This gives the same symbols and leaves the tree in the same state as drawing with
+			`predict([1])` followed by `update()`, but walks the context path only once.
+			(See `draw_and_update()`.)
+		"""
+
+		return self.draw_and_update(random.random())[0]
+	# end def
+
+	def set_adaptive_depth(self, threshold = adaptive_depth_threshold):
+		""" Makes the tree use the contexts below a context only once it has been seen `threshold` times,
+			so that the depth of the contexts grows with the data, up to the tree's maximum depth.
+
+			Early on, the deep nodes of a context have seen too few symbols to predict anything, yet every update
+			and prediction walks them all. With an adaptive depth, a context seen fewer than `threshold` times is
+			a leaf of the tree: the walk stops there, and its KT estimate is its weighted probability.
+			When a context has been seen `threshold` times, the walk goes on below it, and its KT estimate of
+			those first symbols is kept in its `pruned_log_probability`, standing in for the children in the
+			weighted probability (as for the children removed by `prune()`). The children then only learn from
+			the symbols seen since, but the weighted probabilities stay those of a proper mixture, and the
+			node's weighted probability is unchanged by the extension. Reverting the update that extended
+			the context undoes the extension.
+
+			`effective_depth` is the depth of the deepest context updated so far, and `context_depth_counts`
+			counts the updates whose context was of each depth.
+
+			The depth must be set on an empty tree, and can't be combined with deferred pruning or a node budget.
+
+			- `threshold`: the number of symbols a context must see before the contexts below it are used,
+			  or None for a fixed depth.
+		"""
+
+		assert self.tree_size == 1 and self.root.visits() == 0, "The depth can only be made adaptive on an empty tree."
+		assert threshold is None or threshold > 0, "The given threshold must be greater than zero."
+		assert type(self).update_context == CTWContextTree.update_context, \
+			"Only context trees that walk the context from the root can have an adaptive depth."
+		assert not self.deferred_pruning and self.max_nodes is None, \
+			"An adaptive depth can't be combined with deferred pruning or a node budget."
+
+		self.adaptive_threshold = threshold
+	# end def
+
+	def set_deferred_pruning(self, deferred_pruning = True, max_ghost_nodes = None):
+		""" Sets whether nodes left without visits by `revert()` stay in the tree.
+
+			Searches revert their simulated updates straight away, and often make them again soon after,
+			so deleting and creating the same nodes each time is wasted work. With deferred pruning, these
+			nodes stay in the tree as ghosts. A ghost has empty statistics, so it adds nothing to the
+			weighted probability of its parent, and it becomes an ordinary node again when its context
+			is next updated.
+
+			`size()` counts only the ordinary nodes, and `ghost_nodes` the ghosts. `compact()` removes
+			the ghosts; it is called by `revert()` once there are more than `max_ghost_nodes` of them,
+			and can also be called at any other time there is no checkpoint, e.g. once per agent cycle.
+
+			- `deferred_pruning`: whether to leave the nodes in the tree. If False, any ghosts are removed.
+			- `max_ghost_nodes`: the number of ghost nodes above which `revert()` compacts the tree, or None.
+		"""
+
+		assert isinstance(getattr(self, 'root', None), CTWContextTreeNode), \
+			"Only context trees made of `CTWContextTreeNode` nodes can defer pruning."
+		assert self.adaptive_threshold is None, "A tree with an adaptive depth can't defer pruning."
+
+		self.deferred_pruning = deferred_pruning
+		self.max_ghost_nodes = max_ghost_nodes
+		if not deferred_pruning:
+			self.compact()
+		# end if
+	# end def
+
+	def set_history(self, history):
+		""" Makes the tree keep its history in the given sequence, which is usually a
+			`ctw_history.CTWHistory` or `ctw_history.BitPackedHistory`, in place of a list.
+			The sequence is given the current history.
+
+			- `history`: an empty `CTWHistory` or `BitPackedHistory`, or another sequence supporting
+			  the same operations.
+		"""
+
+		history.extend(self.history)
+		self.history = history
+	# end def
+
+	def set_node_budget(self, max_nodes = None, max_bytes = None, policy = 'lru', threshold = 2):
+		""" Limits the size of the tree. Whenever an update leaves the tree with more nodes than the budget
+			allows, it is pruned (see `prune()`) to `pruning_target` of the budget.
+
+			The budget isn't kept to while there is a checkpoint, as rolling back might then restore
+			pruned nodes.
+
+			- `max_nodes`: the maximum number of nodes, or None.
+			- `max_bytes`: the maximum memory used by the nodes, or None. (See `estimated_node_bytes()`.)
+			- `policy`: how subtrees are chosen for pruning, one of `pruning_policies`.
+			- `threshold`: for the 'visits' policy, the number of visits below which subtrees are pruned first.
+		"""
+
+		assert policy in pruning_policies, \
+			"The given pruning policy '%s' is not one of %s." % (policy, str(pruning_policies))
+		assert isinstance(getattr(self, 'root', None), CTWContextTreeNode), \
+			"Only context trees made of `CTWContextTreeNode` nodes can be pruned."
+		assert self.adaptive_threshold is None, "A tree with an adaptive depth can't be kept to a node budget."
+
+		if max_bytes is not None:
+			max_bytes_nodes = int(max_bytes // self.estimated_node_bytes())
+			max_nodes = max_bytes_nodes if max_nodes is None else min(max_nodes, max_bytes_nodes)
+		# end if
+
+		assert max_nodes is None or int(max_nodes * pruning_target) > self.depth, \
+			"The node budget must leave room for more than a context of the tree's depth."
+
+		self.max_nodes = max_nodes
+		self.pruning_policy = policy
+		self.pruning_threshold = threshold
+	# end def
+
+	def set_prediction_cache(self, max_predictions = prediction_cache_size):
+		""" Makes `predict()` keep up to `max_predictions` of its recent predictions, and serve repeated ones
+			from them without walking the tree.
+
+			Searches often make the same prediction of the same tree again and again, e.g. at the start of
+			every simulation, as rolling back to a checkpoint restores the tree each time. Every change to
+			the nodes gives the tree a new `generation`, and `rollback()` restores the generation of the
+			checkpoint along with the nodes. So a prediction is keyed by the generation, the last `depth`
+			symbols of the history (the contexts of the symbols predicted), and the symbols predicted,
+			and stays valid for as long as the tree can return to that state. The least recently used
+			prediction is evicted when the cache is full.
+
+			`cache_hits` and `cache_misses` count the predictions served from the cache and those
+			calculated, and `cache_evictions` the predictions evicted, which help choose its size.
+			(The `prediction-cache` benchmark of `ctw_benchmark.py` measures these.)
+
+			As `predict()` then changes the cache, readers in several threads shouldn't share the tree.
+
+			- `max_predictions`: the number of predictions to keep, or None to keep none. The counts are reset.
+		"""
+
+		assert max_predictions is None or max_predictions > 0, \
+			"The given number of predictions to cache must be greater than zero."
+
+		self.prediction_cache = None if max_predictions is None else collections.OrderedDict()
+		self.max_cached_predictions = max_predictions
+		self.cache_hits = 0
+		self.cache_misses = 0
+		self.cache_evictions = 0
 	# end def
 
 	def size(self):
@@ -453,50 +1586,95 @@ class CTWContextTree:
 
 		# TODO: implement
 
+		self.generation = next(generations)
+
 		# iterate through symbol
 		for symbol in symbol_list:
 			# for each symbol, go through context tree -> the path from root to leaf based on history and increase a or b for each node in path
 			# i.e. if history is 01101, symbol is 1
 			# we'll go through each node corresponds to 0, 01, 011, 0110, 01101 and increase their b value
 			# this could be easily done through self.update_context() which returns the list of nodes in context
-			self.update_context()
-			for i in range(0, len(self.context)):
-				# update leaf first, as Pw of parents depends on children
-				n = self.context[len(self.context) - 1 - i]
-				n.update(symbol)
+			# the first `depth` symbols have no complete context, so they only extend the history
+			if len(self.history) >= self.depth:
+				self.update_context()
+				for i in range(0, len(self.context)):
+					# update leaf first, as Pw of parents depends on children
+					n = self.context[len(self.context) - 1 - i]
+					n.update(symbol)
 			# insert the symbol to history before next round of process - this is important as context changes
 			self.update_history([symbol])
+
+		self.keep_to_node_budget()
 	# end def
 
-	def update_context(self):
+	def update_context(self, reverting = False):
 		""" Calculates which nodes in the context tree correspond to the current
 			context, and adds them to `context` in order from root to leaf.
 
 			In particular, `context[0]` will always correspond to the root node
 			and `context[self.depth]` corresponds to the relevant leaf node.
+			(With an adaptive depth, the context may end at a shallower node. See `set_adaptive_depth()`.)
 
 			Creates the nodes if they do not exist.
+
+			- `reverting`: whether the context is of an update about to be reverted. With an adaptive depth,
+			  the context then ends where it ended for the update, before the nodes saw the symbol.
 		"""
 		# TODO: implement
 
+		journal = self.journal
+		adaptive_threshold = self.adaptive_threshold
+		self.visit_clock += 1
+		visit_clock = self.visit_clock
+
 		v = self.root
 		self.context = [v]
-		for i in range(0, self.depth):
+		created = False
+		for i in range(0, self.depth + 1):
+			# the nodes on the context are about to change, so save their state if there's a checkpoint
+			# (nodes created since the last one are dropped by restoring their parent instead)
+			if journal is not None and not created:
+				journal.append((v, v.snapshot(), None))
+
+			v.last_visit = visit_clock
+
 			# handle corner case
-			if i >= len(self.history):
+			if i >= min(self.depth, len(self.history)):
 				break
 
+			if adaptive_threshold is not None:
+				# a context seen too few times is a leaf, and one seen just often enough is extended
+				if v.visits() - reverting < adaptive_threshold:
+					break
+				elif v.is_leaf_node():
+					v.pruned_log_probability = v.log_kt
+				# end if
+			# end if
+
 			# find the ith suffix in history string
 			symbol = self.history[len(self.history) - 1 - i]
 			# if node not exists, create it
 			if symbol not in v.children:
-				u = CTWContextTreeNode(self)
+				u = self.create_node()
 				v.children[symbol] = u
 				self.tree_size += 1
+				created = True
+			elif self.ghost_nodes > 0 and v.children[symbol].visits() == 0:
+				# a ghost left by a revert is in use again (see `set_deferred_pruning()`)
+				self.tree_size += 1
+				self.ghost_nodes -= 1
 			# else creates new node and add the the list
 			v = v.children[symbol]
 			self.context.append(v)
 
+		# count the depth of the context
+		if not reverting:
+			context_depth = len(self.context) - 1
+			self.context_depth_counts[context_depth] += 1
+			if context_depth > self.effective_depth:
+				self.effective_depth = context_depth
+			# end if
+		# end if
 	# end def
 
 	def update_history(self, symbol_list):
@@ -512,4 +1690,237 @@ class CTWContextTree:
 
 		self.history += symbol_list
 	# end def
-# end class
\ No newline at end of file
+
+	def update_stream(self, source, chunk_size = stream_chunk_size, progress = None,
+			checkpoint_interval = None, checkpoint_callback = None):
+		""" Updates the tree with every symbol of the given source, and returns the number of symbols.
+
+			The source is read and passed to `update()` a chunk at a time (see `stream_chunks()`), so only
+			one chunk is held in memory besides the tree and its history. (A `ctw_history.BitPackedHistory`
+			or `ctw_history.CTWHistory` keeps the history small for long streams.)
+
+			- `source`: an iterable or generator of symbols, or a binary file of packed symbols.
+			- `chunk_size`: the number of symbols to read at a time.
+			- `progress`: if given, a function called after each chunk with the number of symbols read
+			  so far and the throughput, in symbols (bits) per second.
+			- `checkpoint_interval`, `checkpoint_callback`: if given, `checkpoint_callback` is called with the
+			  tree and the number of symbols read so far after each chunk that takes that number past
+			  another `checkpoint_interval` symbols, e.g. to save the tree so that training can resume.
+		"""
+
+		symbol_count = 0
+		next_checkpoint = checkpoint_interval
+		start = time.time()
+		for chunk in stream_chunks(source, chunk_size):
+			self.update(chunk)
+			symbol_count += len(chunk)
+
+			if progress is not None:
+				elapsed = time.time() - start
+				progress(symbol_count, symbol_count / elapsed if elapsed > 0 else 0.0)
+			# end if
+
+			if checkpoint_callback is not None and next_checkpoint is not None and symbol_count >= next_checkpoint:
+				checkpoint_callback(self, symbol_count)
+				next_checkpoint = (symbol_count // checkpoint_interval + 1) * checkpoint_interval
+			# end if
+		# end for
+
+		return symbol_count
+	# end def
+# end class
+
+class CTWContextTreeOverlay:
+	""" A copy-on-write view of a context tree, for simulating future updates without changing the tree.
+
+		The overlay has the interface of the tree used by the agent while searching:
+		`update()`, `update_history()`, `predict()` and `generate_random_symbols*()`.
+		The statistics that updates would give the nodes are kept in the overlay's `changes` dictionary
+		(see `CTWContextTree.query_symbol()`), and the symbols added after the tree's history in `symbols`.
+
+		The tree itself is never modified, so the overlay is simply discarded at the end of a simulation
+		instead of being reverted, and several overlays can be used at once over one tree, as long as the
+		tree isn't updated while they are.
+	"""
+
+	def __init__(self, tree):
+		""" Create an overlay of the given context tree, with no changes.
+
+			- `tree`: the `CTWContextTree` (or subclass) to overlay.
+		"""
+
+		# The underlying context tree.
+		self.tree = tree
+
+		# The maximum depth of the underlying context tree.
+		self.depth = tree.depth
+
+		# The statistics of the nodes changed by updates to the overlay, indexed by node key.
+		self.changes = {}
+
+		# The symbols added to the history through the overlay.
+		self.symbols = []
+	# end def
+
+	@property
+	def history(self):
+		""" A copy of the history of the tree, extended by the symbols added to the overlay.
+		"""
+
+		return self.tree.history + self.symbols
+	# end def
+
+	def draw_and_update(self, uniform, undo = None):
+		""" Returns a symbol drawn according to the overlay's statistics with the given uniform random
+			number, after updating the overlay with it, together with the rescaled random number.
+			(See `CTWContextTree.draw_and_update()`.)
+
+			- `uniform`: a random number in [0, 1).
+			- `undo`: if given, a list to append the changes made to `changes` to. (See `restore_changes()`.)
+		"""
+
+		tree = self.tree
+		changes = self.changes
+		symbols = self.symbols
+
+		# Find rho(1 | h) by updating with a one, which is kept if a one is drawn.
+		one_undo = []
+		log_probability = tree.query_symbol(changes, symbols, len(symbols), 1, one_undo)
+		symbol, uniform = draw_symbol(uniform, math.exp(log_probability))
+		if symbol == 0:
+			self.restore_changes(one_undo)
+			tree.query_symbol(changes, symbols, len(symbols), 0, undo)
+		elif undo is not None:
+			undo.extend(one_undo)
+		# end if
+
+		symbols.append(symbol)
+		return (symbol, uniform)
+	# end def
+
+	def generate_random_symbols(self, symbol_count, single_draw = False):
+		""" Returns a symbol string of a specified length by sampling from the overlay,
+			leaving the overlay unchanged.
+			(See `CTWContextTree.generate_random_symbols()`.)
+		"""
+
+		undo = []
+		symbol_list = self.generate_random_symbols_and_update(symbol_count, single_draw, undo)
+		self.restore_changes(undo)
+		del self.symbols[len(self.symbols) - symbol_count:]
+
+		return symbol_list
+	# end def
+
+	def generate_random_symbols_and_update(self, symbol_count, single_draw = False, undo = None):
+		""" Returns a specified number of random symbols distributed according to the overlay's
+			statistics, after updating the overlay with them.
+			(See `CTWContextTree.generate_random_symbols_and_update()`.)
+
+			- `undo`: if given, a list to append the changes made to `changes` to.
+		"""
+
+		symbol_list = []
+		if single_draw:
+			uniform = random.random()
+		# end if
+		for i in xrange(0, symbol_count):
+			if not single_draw:
+				uniform = random.random()
+			# end if
+			symbol, uniform = self.draw_and_update(uniform, undo)
+			symbol_list.append(symbol)
+		# end for
+
+		return symbol_list
+	# end def
+
+	def predict(self, symbol_list):
+		""" Returns the conditional probability of a symbol (or a list of symbols), considering the
+			history of the tree and the symbols added to the overlay.
+			(See `CTWContextTree.predict()`.)
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		prefix = self.symbols + symbol_list
+		start = len(self.symbols)
+
+		undo = []
+		log_conditional = 0.0
+		for j, symbol in enumerate(symbol_list):
+			log_conditional += self.tree.query_symbol(self.changes, prefix, start + j, symbol, undo)
+		# end for
+		self.restore_changes(undo)
+
+		return math.exp(log_conditional)
+	# end def
+
+	def restore_changes(self, undo):
+		""" Undoes the changes to `changes` recorded in the given undo list, latest first.
+		"""
+
+		changes = self.changes
+		for key, state in reversed(undo):
+			if state is None:
+				changes.pop(key, None)
+			else:
+				changes[key] = state
+			# end if
+		# end for
+	# end def
+
+	def history_size(self):
+		""" Returns the length of the history of the tree, extended by the symbols added to the overlay.
+		"""
+
+		return self.tree.history_size() + len(self.symbols)
+	# end def
+
+	def revert_history(self, symbol_count = 1):
+		""" Removes symbols added to the overlay by `update_history()`.
+			Updates can't be reverted: the overlay should be discarded instead.
+		"""
+
+		assert symbol_count <= len(self.symbols), "Only symbols added to the overlay can be removed."
+		del self.symbols[len(self.symbols) - symbol_count:]
+	# end def
+
+	def size(self):
+		""" Returns the number of nodes the tree would have after the overlay's updates.
+		"""
+
+		return self.tree.size() + sum([1 for key in self.changes if type(key) == tuple and len(key) == 3])
+	# end def
+
+	def update(self, symbol_list):
+		""" Updates the overlay with a new (binary) symbol, or a list of symbols.
+			(See `CTWContextTree.update()`.)
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		for symbol in symbol_list:
+			self.tree.query_symbol(self.changes, self.symbols, len(self.symbols), symbol)
+			self.symbols.append(symbol)
+		# end for
+	# end def
+
+	def update_history(self, symbol_list):
+		""" Appends a symbol (or a list of symbols) to the overlay's history without updating it.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		self.symbols += symbol_list
+	# end def
+# end class
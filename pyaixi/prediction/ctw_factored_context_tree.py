@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define a factored context tree model, which predicts each bit of a percept with a context tree of its own.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import math
+import random
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree
+
+class CTWFactoredContextTree:
+	""" A factored action-conditional model (Veness et al., 2011, section 5), made of one context tree
+		for each bit position of the percepts.
+
+		The percept `x = x_1 ... x_k` is predicted as
+
+		  rho(x | h) = prod_i rho_i(x_i | h x_1 ... x_(i-1))
+
+		where `rho_i` is the context tree for bit `i`, whose context is the history followed by the
+		earlier bits of the percept. Each tree is updated only with the bits at its own position, so the
+		bits don't compete for the same nodes, and each tree stays much smaller than a single tree of
+		the same depth.
+
+		Every tree keeps the whole history, so that its contexts are the same as those of a single tree.
+		The model has the interface of `CTWContextTree` used by the agent. The symbols given to `update()`
+		are taken to be the bits of percepts, in order: `position` is the index in the percept of the
+		next bit to update, and the bit is given to the tree at that position, while the other trees only
+		add it to their history. Symbols given to `update_history()`, such as actions, are added to the
+		history of every tree, without changing the position.
+	"""
+
+	def __init__(self, depth, percept_bits, tree_class = ctw_context_tree.CTWContextTree, **arguments):
+		""" Create a factored model of trees of the given class and maximum depth, one for each percept bit.
+
+			- `depth`: the maximum depth of each context tree.
+			- `percept_bits`: the number of bits of each percept.
+			- `tree_class`: the context tree class of the trees.
+			- `arguments`: any further arguments to create each tree with, after its depth.
+		"""
+
+		assert percept_bits > 0, "The given number of percept bits must be greater than zero."
+
+		# The maximum depth of each context tree.
+		self.depth = depth
+
+		# The context tree of each percept bit.
+		self.trees = [tree_class(depth, **arguments) for i in xrange(0, percept_bits)]
+
+		# The position in the percept of the next bit to update.
+		self.position = 0
+	# end def
+
+	def checkpoint(self):
+		""" Returns a token for the current state of the model, which `rollback()` can restore.
+			(See `CTWContextTree.checkpoint()`.)
+		"""
+
+		return (self.position, [tree.checkpoint() for tree in self.trees])
+	# end def
+
+	def clear(self):
+		""" Clears every context tree, including all nodes and history.
+		"""
+
+		for tree in self.trees:
+			tree.clear()
+		# end for
+		self.position = 0
+	# end def
+
+	def compact(self):
+		""" Removes the ghost nodes of every context tree. (See `CTWContextTree.compact()`.)
+		"""
+
+		for tree in self.trees:
+			tree.compact()
+		# end for
+	# end def
+
+	def generate_random_symbols(self, symbol_count, single_draw = False):
+		""" Returns a symbol string of a specified length by sampling from the model.
+			The model is left exactly as it was, by rolling back the updates with the symbols.
+
+			- `symbol_count`: the number of symbols to generate.
+			- `single_draw`: whether to draw the whole string with one random number.
+		"""
+
+		token = self.checkpoint()
+		symbol_list = self.generate_random_symbols_and_update(symbol_count, single_draw)
+		self.rollback(token)
+		self.release_checkpoint(token)
+
+		return symbol_list
+	# end def
+
+	def generate_random_symbols_and_update(self, symbol_count, single_draw = False):
+		""" Returns a specified number of random symbols distributed according to the model,
+			and updates the model with each as it's drawn, so that it's the context of the next.
+
+			- `symbol_count`: the number of symbols to generate.
+			- `single_draw`: whether to draw the whole string with one random number.
+			                 (See `CTWContextTree.generate_random_symbols_and_update()`.)
+		"""
+
+		symbol_list = []
+		uniform = random.random()
+		for i in xrange(0, symbol_count):
+			tree = self.trees[self.position]
+			if single_draw:
+				symbol, uniform = tree.draw_and_update(uniform)
+			else:
+				symbol = tree.draw_and_update(random.random())[0]
+			# end if
+			self.update_others([symbol])
+			symbol_list.append(symbol)
+		# end for
+
+		return symbol_list
+	# end def
+
+	def history_size(self):
+		""" Returns the length of the history.
+		"""
+
+		return self.trees[0].history_size()
+	# end def
+
+	def predict(self, symbol_list):
+		""" Returns the conditional probability of a symbol (or a list of symbols), considering the history.
+			The symbols are predicted by the trees of their positions, each after the symbols before it.
+
+			- `symbol_list`: the symbol (or list of symbols) to estimate the conditional probability of.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		if len(symbol_list) == 1:
+			return self.trees[self.position].predict(symbol_list)
+		# end if
+
+		# Each later symbol is predicted with the earlier ones in the history, so they're added, then rolled back.
+		token = self.checkpoint()
+		probability = 1.0
+		for symbol in symbol_list:
+			probability *= self.trees[self.position].predict([symbol])
+			self.update([symbol])
+		# end for
+		self.rollback(token)
+		self.release_checkpoint(token)
+
+		return probability
+	# end def
+
+	def predict_distribution(self, symbol_count):
+		""" Returns the conditional probabilities of every sequence of `symbol_count` symbols, considering the history,
+			in the order of `CTWContextTree.predict_distribution()`.
+
+			The sequences are enumerated as a binary trie, so each prefix is added to the history only once.
+			The model is rolled back after each prefix, so it's left exactly as it was.
+
+			- `symbol_count`: the number of symbols in each sequence.
+		"""
+
+		distribution = []
+
+		def visit(log_conditional, remaining):
+			""" Adds the probabilities of the sequences that start with the symbols added so far to `distribution`.
+			"""
+
+			if remaining == 0:
+				distribution.append(math.exp(log_conditional))
+				return
+			# end if
+
+			probability = self.trees[self.position].predict([1])
+			for symbol, symbol_probability in ((0, 1.0 - probability), (1, probability)):
+				if symbol_probability <= 0.0:
+					distribution.extend([0.0] * (1 << (remaining - 1)))
+					continue
+				# end if
+
+				token = self.checkpoint()
+				self.update([symbol])
+				visit(log_conditional + math.log(symbol_probability), remaining - 1)
+				self.rollback(token)
+				self.release_checkpoint(token)
+			# end for
+		# end def
+
+		visit(0.0, symbol_count)
+		return distribution
+	# end def
+
+	def release_checkpoint(self, token):
+		""" Releases the checkpoint with the given token. (See `CTWContextTree.release_checkpoint()`.)
+		"""
+
+		for tree, tree_token in zip(self.trees, token[1]):
+			tree.release_checkpoint(tree_token)
+		# end for
+	# end def
+
+	def revert(self, symbol_count = 1):
+		""" Restores the model to its state prior to a specified number of updates.
+
+			- `symbol_count`: the number of updates (symbols) to revert. (Default of 1.)
+		"""
+
+		percept_bits = len(self.trees)
+		for i in xrange(0, symbol_count):
+			self.position = (self.position - 1) % percept_bits
+			for position, tree in enumerate(self.trees):
+				if position == self.position:
+					tree.revert(1)
+				else:
+					tree.revert_history(1)
+				# end if
+			# end for
+		# end for
+	# end def
+
+	def revert_history(self, symbol_count = 1):
+		""" Shrinks the history of every tree without affecting the trees.
+		"""
+
+		for tree in self.trees:
+			tree.revert_history(symbol_count)
+		# end for
+	# end def
+
+	def rollback(self, token):
+		""" Restores the model to its state when `checkpoint()` returned the given token.
+		"""
+
+		self.position = token[0]
+		for tree, tree_token in zip(self.trees, token[1]):
+			tree.rollback(tree_token)
+		# end for
+	# end def
+
+	def set_deferred_pruning(self, deferred_pruning = True, max_ghost_nodes = None):
+		""" Sets whether nodes left without visits by `revert()` stay in each tree, with the given maximum
+			number of ghost nodes shared between the trees. (See `CTWContextTree.set_deferred_pruning()`.)
+		"""
+
+		for tree in self.trees:
+			tree.set_deferred_pruning(deferred_pruning,
+			                          None if max_ghost_nodes is None else max(1, max_ghost_nodes // len(self.trees)))
+		# end for
+	# end def
+
+	def set_node_budget(self, max_nodes = None, max_bytes = None, policy = 'lru', threshold = 2):
+		""" Limits the size of the model, sharing the budget evenly between the trees.
+			(See `CTWContextTree.set_node_budget()`.)
+		"""
+
+		tree_count = len(self.trees)
+		for tree in self.trees:
+			tree.set_node_budget(None if max_nodes is None else max_nodes // tree_count,
+			                     None if max_bytes is None else max_bytes // tree_count, policy, threshold)
+		# end for
+	# end def
+
+	def set_prediction_cache(self, max_predictions = ctw_context_tree.prediction_cache_size):
+		""" Makes each tree keep its recent predictions, sharing the given number evenly between the trees.
+			(See `CTWContextTree.set_prediction_cache()`.)
+		"""
+
+		for tree in self.trees:
+			tree.set_prediction_cache(None if max_predictions is None else max(1, max_predictions // len(self.trees)))
+		# end for
+	# end def
+
+	def set_vectorized(self, vectorized = True):
+		""" Sets whether each tree updates its context paths with NumPy array operations.
+			(See `CTWArrayContextTree.set_vectorized()`.)
+		"""
+
+		for tree in self.trees:
+			tree.set_vectorized(vectorized)
+		# end for
+	# end def
+
+	def size(self):
+		""" Returns the number of nodes in all the context trees.
+		"""
+
+		return sum([tree.size() for tree in self.trees])
+	# end def
+
+	def update(self, symbol_list):
+		""" Updates the tree of the current position with each symbol in turn, adding it to the history
+			of the other trees.
+
+			- `symbol_list`: the symbol (or list of symbols) with which to update the model.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		for symbol in symbol_list:
+			self.trees[self.position].update([symbol])
+			self.update_others([symbol])
+		# end for
+	# end def
+
+	def update_history(self, symbol_list):
+		""" Appends a symbol (or a list of symbols) to the history of every tree without updating the trees.
+
+			- `symbol_list`: the symbol (or list of symbols) to add to the history.
+		"""
+
+		for tree in self.trees:
+			tree.update_history(symbol_list)
+		# end for
+	# end def
+
+	def update_others(self, symbol_list):
+		""" Adds the given symbol, just used to update the tree of the current position, to the history of
+			the other trees, and moves on to the next position.
+		"""
+
+		for position, tree in enumerate(self.trees):
+			if position != self.position:
+				tree.update_history(symbol_list)
+			# end if
+		# end for
+		self.position = (self.position + 1) % len(self.trees)
+	# end def
+# end class
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define a frozen context tree: an immutable copy of a learnt context tree, compiled into flat arrays,
+for searching once the agent has stopped learning.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import math
+
+from pyaixi.prediction import ctw_beta_context_tree, ctw_context_tree, ctw_hashed_context_tree
+from pyaixi.prediction.ctw_array_context_tree import child_typecode, count_typecode, log_typecode, no_child
+from pyaixi.prediction.ctw_context_tree import draw_symbol
+
+# The default number of per-context predictions a frozen tree keeps. (See `CTWFrozenContextTree`.)
+frozen_prediction_limit = 1 << 20
+
+class CTWFrozenContextTree(ctw_context_tree.CTWContextTree):
+	""" An immutable copy of a learnt context tree, whose nodes are compiled into flat arrays, in the
+		layout of `CTWArrayContextTree` (`symbol_count`, `log_kt`, `log_probability` and `child`), along
+		with the `pruned_log_probability` of each node. The nodes are numbered in preorder, with the root 0.
+
+		The frozen tree never changes, so the probability of a one after a context, `rho(1 | h)`, depends only
+		on the last `depth` symbols of the history, and is kept in the `predictions` dictionary, indexed by
+		that context, once it has been found. `cache_hits` and `cache_misses` count the predictions found
+		there and those calculated. When the dictionary holds `max_predictions` predictions, it's emptied.
+
+		The frozen tree shares the history of the tree it was compiled from, so symbols added to the history
+		of either are seen by both. It has the interface of the tree used by the agent while searching, and
+		how it treats updates depends on `learning`:
+
+		- If `learning` is True, updates are kept as simulation deltas over the frozen nodes: the statistics
+		  the updates would give the nodes are kept in `changes`, as by a `CTWContextTreeOverlay`, with the
+		  state each update replaced in `delta_journal`, so that `revert()` and `rollback()` can restore it.
+		  Predictions are the same as the compiled tree would make after the same updates, and are only
+		  taken from `predictions` while there are no deltas, e.g. at the start of each search simulation.
+
+		- If `learning` is False, updates only add to the history, as when the agent updates its model
+		  after the learning period, so every prediction is taken from `predictions`, and searches only
+		  add and remove history symbols.
+	"""
+
+	def __init__(self, tree, learning = True, max_predictions = frozen_prediction_limit):
+		""" Compile the given context tree into a frozen tree.
+
+			- `tree`: a `CTWContextTree`, `CTWSuffixContextTree`, `CTWArrayContextTree` or `CTWMmapContextTree`
+			  with a fixed depth, and without a checkpoint.
+			- `learning`: whether updates are kept as deltas over the frozen nodes (see above).
+			- `max_predictions`: the number of per-context predictions to keep.
+		"""
+
+		assert isinstance(tree, ctw_context_tree.CTWContextTree) and \
+		       not isinstance(tree, (ctw_beta_context_tree.CTWBetaContextTree,
+		                             ctw_hashed_context_tree.CTWHashedContextTree)), \
+			"A %s can't be frozen." % type(tree).__name__
+		assert tree.adaptive_threshold is None, "A context tree with an adaptive depth can't be frozen."
+		assert tree.journal is None, "The tree can't be frozen while there is a checkpoint."
+		assert max_predictions > 0, "The given number of predictions to keep must be greater than zero."
+
+		# The tree the frozen tree is compiled from, by `create_nodes()`.
+		self.tree = tree
+
+		ctw_context_tree.CTWContextTree.__init__(self, tree.depth)
+
+		# The history of the tree the frozen tree was compiled from, shared with it.
+		self.history = tree.history
+		self.rounded_log_probabilities = tree.rounded_log_probabilities
+
+		# Whether updates are kept as deltas over the frozen nodes.
+		self.learning = learning
+
+		# The statistics updates have given the nodes, indexed by node key, the `(key, previous statistics
+		# or None)` of each change, and the length of `delta_journal` before each update, latest last.
+		self.changes = {}
+		self.delta_journal = []
+		self.update_marks = []
+
+		# The probability of a one after each context seen, and the most that are kept.
+		self.predictions = {}
+		self.max_predictions = max_predictions
+		self.cache_hits = 0
+		self.cache_misses = 0
+	# end def
+
+	def checkpoint(self):
+		""" Returns a token for the current state of the frozen tree, which `rollback()` can restore.
+			Checkpoints cost nothing, as every update is journaled.
+		"""
+
+		return (len(self.history), len(self.update_marks))
+	# end def
+
+	def clear(self):
+		""" Frozen trees can't be cleared.
+		"""
+
+		assert False, "A frozen context tree can't be cleared."
+	# end def
+
+	def create_nodes(self):
+		""" Compiles the nodes of the tree the frozen tree is compiled from, numbering them in preorder through
+			the keys the tree's queries use, and sets the tree size.
+		"""
+
+		tree = self.tree
+		self.symbol_count = [array.array(count_typecode), array.array(count_typecode)]
+		self.log_kt = array.array(log_typecode)
+		self.log_probability = array.array(log_typecode)
+		self.pruned_log_probability = array.array(log_typecode)
+		self.child = [array.array(child_typecode), array.array(child_typecode)]
+
+		stack = [(tree.query_root(), -1, 0)]
+		while len(stack) > 0:
+			key, parent, symbol = stack.pop()
+			index = len(self.log_kt)
+			if parent >= 0:
+				self.child[symbol][parent] = index
+			# end if
+
+			a, b, log_kt, log_probability = tree.query_state(key)
+			self.symbol_count[0].append(a)
+			self.symbol_count[1].append(b)
+			self.log_kt.append(log_kt)
+			self.log_probability.append(log_probability)
+			self.pruned_log_probability.append(tree.query_pruned_log_probability(key))
+			self.child[0].append(no_child)
+			self.child[1].append(no_child)
+
+			for child_symbol in (1, 0):
+				child_key = tree.query_child_key(key, child_symbol)
+				if type(child_key) != tuple:
+					stack.append((child_key, index, child_symbol))
+				# end if
+			# end for
+		# end while
+		self.tree_size = len(self.log_kt)
+	# end def
+
+	def draw_and_update(self, uniform):
+		""" Returns a symbol drawn according to the frozen tree and its deltas with the given uniform
+			random number, after updating the tree with it, together with the rescaled random number.
+			(See `CTWContextTree.draw_and_update()`.)
+
+			- `uniform`: a random number in [0, 1).
+		"""
+
+		if not self.learning or len(self.changes) == 0:
+			symbol, uniform = draw_symbol(uniform, self.symbol_probability([], 0))
+			self.update([symbol])
+			return (symbol, uniform)
+		# end if
+
+		self.update_marks.append(len(self.delta_journal))
+		if len(self.history) < self.depth:
+			symbol, uniform = draw_symbol(uniform, 0.5)
+			self.update_history([symbol])
+			return (symbol, uniform)
+		# end if
+
+		# Find rho(1 | h) by updating with a one, which is kept if a one is drawn.
+		one_undo = []
+		log_probability = self.query_symbol(self.changes, [], 0, 1, one_undo)
+		symbol, uniform = draw_symbol(uniform, math.exp(log_probability))
+		if symbol == 0:
+			self.restore_changes(one_undo)
+			self.query_symbol(self.changes, [], 0, 0, self.delta_journal)
+		else:
+			self.delta_journal.extend(one_undo)
+		# end if
+
+		self.update_history([symbol])
+		return (symbol, uniform)
+	# end def
+
+	def predict(self, symbol_list):
+		""" Returns the conditional probability of a symbol (or a list of symbols), considering the history
+			and any deltas. (See `CTWContextTree.predict()`.)
+
+			- `symbol_list`: the symbol (or list of symbols) to estimate the conditional probability of.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		# Later symbols of a list are predicted after learning from the earlier ones, unless the tree doesn't learn.
+		if not self.learning or (len(self.changes) == 0 and len(symbol_list) == 1):
+			probability = 1.0
+			for j, symbol in enumerate(symbol_list):
+				probability_one = self.symbol_probability(symbol_list, j)
+				probability *= probability_one if symbol == 1 else 1.0 - probability_one
+			# end for
+			return probability
+		# end if
+
+		undo = []
+		log_conditional = 0.0
+		for j, symbol in enumerate(symbol_list):
+			log_conditional += self.query_symbol(self.changes, symbol_list, j, symbol, undo)
+		# end for
+		self.restore_changes(undo)
+
+		return math.exp(log_conditional)
+	# end def
+
+	def predict_distribution(self, symbol_count):
+		""" Returns the conditional probabilities of every sequence of `symbol_count` symbols, considering
+			the history and any deltas, in the order of `CTWContextTree.predict_distribution()`.
+
+			- `symbol_count`: the number of symbols in each sequence.
+		"""
+
+		distribution = []
+
+		# The node statistics for the current prefix of the trie, starting from the deltas.
+		changes = dict(self.changes)
+		prefix = []
+
+		def visit(log_conditional):
+			""" Adds the probabilities of the sequences that start with `prefix` to `distribution`.
+			"""
+
+			if len(prefix) == symbol_count:
+				distribution.append(math.exp(log_conditional))
+				return
+			# end if
+
+			if not self.learning:
+				probability_one = self.symbol_probability(prefix, len(prefix))
+			# end if
+
+			for symbol in (0, 1):
+				undo = []
+				if self.learning:
+					log_symbol = self.query_symbol(changes, prefix, len(prefix), symbol, undo)
+				else:
+					probability = probability_one if symbol == 1 else 1.0 - probability_one
+					if probability <= 0.0:
+						distribution.extend([0.0] * (1 << (symbol_count - len(prefix) - 1)))
+						continue
+					# end if
+					log_symbol = math.log(probability)
+				# end if
+
+				prefix.append(symbol)
+				visit(log_conditional + log_symbol)
+				prefix.pop()
+
+				for key, state in reversed(undo):
+					if state is None:
+						del changes[key]
+					else:
+						changes[key] = state
+					# end if
+				# end for
+			# end for
+		# end def
+
+		visit(0.0)
+		return distribution
+	# end def
+
+	def query_child_key(self, key, symbol):
+		""" Returns the key `predict()` uses for the child of the node with the given key.
+			Existing nodes are keyed by their id. (See `CTWContextTree.query_child_key()`.)
+		"""
+
+		if type(key) == tuple:
+			index, bits, length = key
+			return (index, bits | (symbol << length), length + 1)
+		# end if
+
+		child_index = self.child[symbol][key]
+		if child_index == no_child:
+			return (key, symbol, 1)
+		# end if
+
+		return child_index
+	# end def
+
+	def query_pruned_log_probability(self, key):
+		""" Returns the sum of the weighted log probabilities of the children pruned from the node with
+			the given `predict()` key before the tree was frozen.
+		"""
+
+		if type(key) == tuple:
+			return 0.0
+		# end if
+
+		return self.pruned_log_probability[key]
+	# end def
+
+	def query_root(self):
+		""" Returns the key `predict()` uses for the root node.
+		"""
+
+		return 0
+	# end def
+
+	def query_state(self, key):
+		""" Returns the (zero count, one count, log KT estimate, weighted log probability) of the node
+			with the given `predict()` key. Nodes that don't exist yet have empty statistics.
+		"""
+
+		if type(key) == tuple:
+			return (0, 0, 0.0, 0.0)
+		# end if
+
+		return (self.symbol_count[0][key], self.symbol_count[1][key], self.log_kt[key], self.log_probability[key])
+	# end def
+
+	def release_checkpoint(self, token):
+		""" Releases the checkpoint with the given token. Checkpoints keep no state, so this does nothing.
+		"""
+
+		pass
+	# end def
+
+	def restore_changes(self, undo):
+		""" Undoes the changes to `changes` recorded in the given undo list, latest first.
+		"""
+
+		changes = self.changes
+		for key, state in reversed(undo):
+			if state is None:
+				changes.pop(key, None)
+			else:
+				changes[key] = state
+			# end if
+		# end for
+	# end def
+
+	def revert(self, symbol_count = 1):
+		""" Removes the deltas of the last updates, and their symbols from the history.
+
+			- `symbol_count`: the number of updates (symbols) to revert. (Default of 1.)
+		"""
+
+		assert symbol_count <= len(self.update_marks), "Only updates made to the frozen tree can be reverted."
+
+		mark = self.update_marks[len(self.update_marks) - symbol_count]
+		del self.update_marks[len(self.update_marks) - symbol_count:]
+		self.restore_changes(self.delta_journal[mark:])
+		del self.delta_journal[mark:]
+		self.revert_history(symbol_count)
+	# end def
+
+	def rollback(self, token):
+		""" Restores the frozen tree to its state when `checkpoint()` returned the given token.
+		"""
+
+		history_length, update_count = token
+		assert len(self.history) >= history_length, \
+			"Symbols removed from the history since the checkpoint can't be restored."
+
+		if update_count < len(self.update_marks):
+			mark = self.update_marks[update_count]
+			del self.update_marks[update_count:]
+			self.restore_changes(self.delta_journal[mark:])
+			del self.delta_journal[mark:]
+		# end if
+		del self.history[history_length:]
+	# end def
+
+	def size(self):
+		""" Returns the number of nodes of the frozen tree, and of those its deltas add.
+		"""
+
+		return self.tree_size + sum([1 for key in self.changes if type(key) == tuple])
+	# end def
+
+	def symbol_probability(self, prefix, prefix_length):
+		""" Returns the probability of a one after the history and the first `prefix_length` symbols of
+			`prefix`, predicted by the frozen nodes alone, taking it from `predictions` if it's there.
+		"""
+
+		history = self.history
+		history_length = len(history)
+		depth = self.depth
+
+		# symbols without a complete context are not modelled by the tree, so treat them as uniform
+		if history_length + prefix_length < depth:
+			return 0.5
+		# end if
+
+		if prefix_length >= depth:
+			context = tuple(prefix[prefix_length - depth:prefix_length])
+		else:
+			context = tuple(history[history_length - depth + prefix_length:history_length]) + \
+			          tuple(prefix[:prefix_length])
+		# end if
+
+		probability = self.predictions.get(context)
+		if probability is not None:
+			self.cache_hits += 1
+			return probability
+		# end if
+		self.cache_misses += 1
+
+		# the prefix is only the context, as the nodes aren't updated with it
+		probability = math.exp(self.query_symbol({}, prefix, prefix_length, 1))
+		if len(self.predictions) >= self.max_predictions:
+			self.predictions.clear()
+		# end if
+		self.predictions[context] = probability
+
+		return probability
+	# end def
+
+	def update(self, symbol_list):
+		""" Updates the frozen tree with a new (binary) symbol, or a list of symbols, keeping the changes to
+			the nodes as deltas if the tree is learning, and adding the symbols to the history.
+
+			- `symbol_list`: the symbol (or list of symbols) with which to update the tree.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		for symbol in symbol_list:
+			self.update_marks.append(len(self.delta_journal))
+			if self.learning and len(self.history) >= self.depth:
+				self.query_symbol(self.changes, [], 0, symbol, self.delta_journal)
+			# end if
+			self.update_history([symbol])
+		# end for
+	# end def
+# end class
@@ -0,0 +1,619 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define a context tree that stores its node statistics in a fixed-size hash table, so that its memory use
+doesn't grow with the number of contexts seen.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import math
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree, ctw_suffix_context_tree
+from pyaixi.prediction.ctw_context_tree import draw_symbol, generations, log_half, log_kt_multiplier, log_kt_table
+
+# The policies for a context that finds no free slot in the table:
+#  - 'replace' evicts the least visited node in the slots searched, and gives the slot to the new context.
+#  - 'share' lets the new context share the statistics of the first slot searched.
+collision_policies = ('replace', 'share')
+
+# The number of bytes of table memory used by each slot: a key, two counts and two log probabilities.
+slot_bytes = 5 * 8
+
+# The key that marks a slot which has never been used.
+empty_key = -1
+
+# The number of slots searched for a context, starting at its hashed position, before it collides.
+probe_length = 8
+
+def log_add(x, y):
+	""" Returns `log(exp(x) + exp(y))`, choosing the formulation with the smaller exponent to avoid overflow.
+	"""
+
+	high = max(x, y)
+	return high + math.log(1 + math.exp(min(x, y) - high))
+# end def
+
+class CTWHashedContextTree(ctw_suffix_context_tree.CTWSuffixContextTree):
+	""" An action-conditional context tree whose nodes are kept in a preallocated open-addressing hash table.
+
+		Like `CTWSuffixContextTree`, the node for depth `d` of the current context is identified by
+		the key `(1 << d) | (suffix & ((1 << d) - 1))`. The key's hash selects a position in flat typed
+		arrays (see `CTWArrayContextTree`) of a fixed number of slots:
+
+		- `slot_key`: the hash of the key of the node in each slot, or `empty_key`.
+
+		- `symbol_count[0]`, `symbol_count[1]`, `log_kt`, `log_probability`: the node statistics.
+
+		A context is looked for in `probe_length` consecutive slots. If it isn't found, it takes the first
+		of these slots which is unused or holds a node without visits, and otherwise the `collision_policy`
+		decides which slot it uses, counting `collided_lookups` and `evictions`.
+
+		`collided_lookups` counts the lookups that found neither the context nor a free slot. Under 'replace',
+		the context takes a slot, so each of these is a context colliding again. Under 'share', the context
+		never gets a slot of its own, so every lookup of it collides, and the count measures how often shared
+		statistics are used rather than how many contexts share them. (Counting each shared context once would
+		mean remembering them all, which the fixed-size table is meant to avoid.)
+		While the table has room, the tree gives the predictions of `CTWContextTree` (to within rounding).
+		Once it fills up, nodes lose some of their statistics, trading accuracy for bounded memory.
+
+		The root node is always kept in slot 0. The children of a node aren't stored: they are looked up
+		by key when the node's weighted probability is calculated.
+
+		After a collision, the weighted probability stored in a node no longer matches its children,
+		so `rho(y | h)` can't be found as `rho(hy)/rho(h)` at the root. Instead, the conditional probability
+		is found at each node of the context from the conditional probability at its child:
+
+		  P_w^n(y | h) = (Pr_kt(h_n) Pr_kt(y | h_n) + P_w^n0 P_w^n1 P_w^c(y | h)) / (Pr_kt(h_n) + P_w^n0 P_w^n1)
+
+		which sums to one over `y` however the node's statistics were found, and which is the same as
+		`rho(hy)/rho(h)` when they match.
+	"""
+
+	def __init__(self, depth, memory_bytes = 64 * 1024 * 1024, collision_policy = 'replace'):
+		""" Create a hashed context tree of specified maximum depth, using a table of a fixed size.
+
+			- `depth`: the maximum depth of the context tree.
+			- `memory_bytes`: the size of the table, in bytes.
+			- `collision_policy`: one of `collision_policies`.
+		"""
+
+		# How a context that finds no free slot is stored.
+		assert collision_policy in collision_policies, \
+			"The given collision policy '%s' is not one of %s." % (collision_policy, str(collision_policies))
+		self.collision_policy = collision_policy
+
+		# The number of slots in the table: the root, and room for at least one full search.
+		self.capacity = max(probe_length + 1, int(memory_bytes // slot_bytes))
+
+		# The table has no node objects, so it doesn't use the `CTWSuffixContextTree` map of nodes.
+		ctw_context_tree.CTWContextTree.__init__(self, depth)
+
+		# The keys of the nodes of the current context, from root to leaf, filled in by `update_context()`
+		# with their slots in `context`.
+		self.context_keys = []
+
+		# The last `depth` symbols of the history, the most recent in bit 0, and the mask selecting them.
+		self.suffix = 0
+		self.suffix_mask = (1 << depth) - 1
+	# end def
+
+	def claim_slot(self, key, context):
+		""" Returns the slot for the node with the given key, giving it a slot if it doesn't have one.
+
+			- `key`: the key of the node.
+			- `context`: the slots of the nodes already found for the current context, which can't be taken.
+		"""
+
+		slot, free_slot = self.find_slot(key, context)
+		new_node = False
+		if slot < 0:
+			if free_slot >= 0:
+				# take an unused slot, or the slot of a node without visits
+				slot = free_slot
+				new_node = True
+			else:
+				self.collided_lookups += 1
+				candidates = [candidate for candidate in self.probe_slots(key) if candidate not in context]
+				if len(candidates) == 0:
+					# the table is too small for the context; share the first slot
+					candidates = self.probe_slots(key)[:1]
+				# end if
+
+				if self.collision_policy == 'share':
+					slot = candidates[0]
+				else:
+					slot = min(candidates, key = self.visits)
+					self.evictions += 1
+					self.tree_size -= 1
+					new_node = True
+				# end if
+			# end if
+		# end if
+
+		# Save the state of the slot about to change if there's a checkpoint.
+		if self.journal is not None:
+			self.journal.append((slot, self.snapshot(slot), None))
+		# end if
+
+		if new_node:
+			self.slot_key[slot] = hash(key)
+			self.symbol_count[0][slot] = 0
+			self.symbol_count[1][slot] = 0
+			self.log_kt[slot] = 0.0
+			self.log_probability[slot] = 0.0
+		# end if
+
+		return slot
+	# end def
+
+	def clear(self):
+		""" Clears the entire context tree including all nodes and history.
+		"""
+
+		# Reset the history and the context, and discard any checkpoints.
+		del self.history[:]
+		self.context = []
+		self.context_keys = []
+		self.journal = None
+		self.suffix = 0
+
+		# Create the table, with the root in slot 0.
+		self.create_nodes()
+		self.generation = next(generations)
+
+		# Unvisited nodes are removed straight away, so there are never any ghost nodes.
+		# (See `CTWContextTree.set_deferred_pruning()`.)
+		self.ghost_nodes = 0
+	# end def
+
+	def create_nodes(self):
+		""" Creates an empty table, with the root node in slot 0, and resets the tree size
+			and the collision counts.
+		"""
+
+		capacity = self.capacity
+		self.slot_key = array.array('q', [empty_key]) * capacity
+		self.symbol_count = [array.array('Q', [0]) * capacity, array.array('Q', [0]) * capacity]
+		self.log_kt = array.array('d', [0.0]) * capacity
+		self.log_probability = array.array('d', [0.0]) * capacity
+		self.slot_key[0] = hash(1)
+		self.tree_size = 1
+
+		# The number of lookups which found no free slot (see above), and the number of nodes evicted for them.
+		self.collided_lookups = 0
+		self.evictions = 0
+	# end def
+
+	def draw_and_update(self, uniform):
+		""" Returns a symbol drawn according to the context tree statistics with the given uniform
+			random number, after updating the context tree with it, together with the rescaled random number.
+			The context path is walked only once. (See `CTWContextTree.draw_and_update()`.)
+
+			- `uniform`: a random number in [0, 1).
+		"""
+
+		# Symbols without a complete context are not modelled by the tree, so treat them as uniform.
+		if len(self.history) < self.depth:
+			symbol, uniform = draw_symbol(uniform, 0.5)
+			self.update_history([symbol])
+			return (symbol, uniform)
+		# end if
+
+		self.generation = next(generations)
+		self.update_context()
+
+		symbol_count = self.symbol_count
+		log_kt = self.log_kt
+		log_probability = self.log_probability
+
+		# The candidate (log KT estimate, weighted log probability) of each node for a zero and a one,
+		# in order from leaf to root, and the log conditional probability of each symbol at the last node.
+		candidates = ([], [])
+		log_conditional = [0.0, 0.0]
+		for d in xrange(self.depth, -1, -1):
+			slot = self.context[d]
+			a = symbol_count[0][slot]
+			b = symbol_count[1][slot]
+			if d < self.depth:
+				log_sibling = self.sibling_log_probability(d)
+				log_children = log_probability[self.context[d + 1]] + log_sibling
+				log_weight = log_add(log_kt[slot], log_children)
+			# end if
+
+			for symbol in (0, 1):
+				multiplier = log_kt_multiplier(a, b, symbol)
+				candidate_kt = log_kt[slot] + multiplier
+				if d == self.depth:
+					candidate_probability = candidate_kt
+					log_conditional[symbol] = multiplier
+				else:
+					candidate_probability = log_half + log_add(candidate_kt, candidates[symbol][-1][1] + log_sibling)
+					log_conditional[symbol] = log_add(candidate_kt, log_children + log_conditional[symbol]) - log_weight
+				# end if
+
+				candidates[symbol].append((candidate_kt, candidate_probability))
+			# end for
+		# end for
+
+		symbol, uniform = draw_symbol(uniform, math.exp(log_conditional[1]))
+
+		# Commit the values for the sampled symbol.
+		counts = symbol_count[symbol]
+		for slot, (candidate_kt, candidate_probability) in zip(reversed(self.context), candidates[symbol]):
+			if slot > 0 and self.visits(slot) == 0:
+				self.tree_size += 1
+			# end if
+			counts[slot] += 1
+			log_kt[slot] = candidate_kt
+			log_probability[slot] = candidate_probability
+		# end for
+
+		self.update_history([symbol])
+		return (symbol, uniform)
+	# end def
+
+	def find_slot(self, key, context = ()):
+		""" Returns the slot holding the node with the given key, or -1 if there is none, together with
+			the first slot searched which is free for the node to take, or -1 if there is none.
+
+			- `key`: the key of the node.
+			- `context`: the slots of the nodes already found for the current context, which aren't free
+			             even if their nodes have no visits yet, as they are about to be updated.
+		"""
+
+		# The root always has slot 0.
+		if key == 1:
+			return (0, -1)
+		# end if
+
+		key_hash = hash(key)
+		slot_key = self.slot_key
+		free_slot = -1
+		for slot in self.probe_slots(key):
+			if slot_key[slot] == key_hash:
+				return (slot, -1)
+			elif slot_key[slot] == empty_key:
+				# keys are never removed, so the node can't be further on
+				if free_slot < 0:
+					free_slot = slot
+				# end if
+				break
+			elif free_slot < 0 and self.visits(slot) == 0 and slot not in context:
+				free_slot = slot
+			# end if
+		# end for
+
+		return (-1, free_slot)
+	# end def
+
+	def log_kt_multiplier(self, slot, symbol):
+		""" Returns the logarithm of the KT-estimator update multiplier for the given slot.
+			(See `CTWContextTreeNode.log_kt_multiplier()`.)
+		"""
+
+		a = self.symbol_count[0][slot]
+		b = self.symbol_count[1][slot]
+		if a + b < len(log_kt_table):
+			return log_kt_table[a + b][b if symbol else a]
+		# end if
+
+		return log_kt_multiplier(a, b, symbol)
+	# end def
+
+	def probe_slots(self, key):
+		""" Returns the slots searched for the node with the given key, in order.
+			Slot 0 is kept for the root, so the others are in 1 to `capacity - 1`.
+
+			The search starts at the slot given by the top bits of the key multiplied by `2^64` over the golden
+			ratio, modulo `2^64` (Fibonacci hashing), which spreads the keys of neighbouring contexts across
+			the table. (The product modulo the number of slots would map them along a few lines of slots,
+			filling runs of slots long before the table is full.)
+		"""
+
+		slots = self.capacity - 1
+		start = (((hash(key) * 11400714819323198485) & 0xFFFFFFFFFFFFFFFF) * slots) >> 64
+		return [(start + i) % slots + 1 for i in xrange(0, probe_length)]
+	# end def
+
+	def query_child_key(self, key, symbol):
+		""" Returns the key `predict()` uses for the child of the node with the given key.
+			(See `CTWContextTree.query_child_key()`.)
+
+			Nodes are keyed by their context, as in the table. Children of the nodes at the maximum depth
+			are marked as nodes that don't exist.
+		"""
+
+		if type(key) == tuple:
+			return (key, symbol)
+		# end if
+
+		d = key.bit_length() - 1
+		if d >= self.depth:
+			return (key, symbol)
+		# end if
+
+		return (key ^ (1 << d)) | (1 << (d + 1)) | (symbol << d)
+	# end def
+
+	def query_pruned_log_probability(self, key):
+		""" Returns zero, as nodes are evicted from the table rather than pruned from their parents.
+			(See `CTWContextTree.query_pruned_log_probability()`.)
+		"""
+
+		return 0.0
+	# end def
+
+	def query_root(self):
+		""" Returns the key `predict()` uses for the root node.
+		"""
+
+		return 1
+	# end def
+
+	def query_state(self, key):
+		""" Returns the (zero count, one count, log KT estimate, weighted log probability) of the node
+			with the given `predict()` key. Nodes without a slot have empty statistics.
+		"""
+
+		if type(key) == tuple:
+			return (0, 0, 0.0, 0.0)
+		# end if
+
+		slot = self.find_slot(key)[0]
+		if slot < 0:
+			return (0, 0, 0.0, 0.0)
+		# end if
+
+		return (self.symbol_count[0][slot], self.symbol_count[1][slot], self.log_kt[slot], self.log_probability[slot])
+	# end def
+
+	def query_symbol(self, changes, prefix, prefix_length, symbol, undo = None):
+		""" Returns `log(rho(y | hx))` for a symbol `y`, the history `h` and the first `prefix_length`
+			symbols `x` of `prefix`, without modifying the tree.
+			(See `CTWContextTree.query_symbol()`.)
+
+			The conditional probability is found at each node from that of its child (see above).
+		"""
+
+		history = self.history
+		history_length = len(history)
+
+		# Symbols without a complete context are not modelled by the tree, so treat them as uniform.
+		if history_length + prefix_length < self.depth:
+			return log_half
+		# end if
+
+		# Find the keys of the nodes on the context path, from root to leaf.
+		key = self.query_root()
+		path = [key]
+		for i in xrange(0, self.depth):
+			if i < prefix_length:
+				context_symbol = prefix[prefix_length - 1 - i]
+			else:
+				context_symbol = history[history_length - 1 - (i - prefix_length)]
+			# end if
+			key = self.query_child_key(key, context_symbol)
+			path.append(key)
+		# end for
+
+		# Calculate the conditional probability at each node, and the statistics after the update, leaf first.
+		for d in xrange(self.depth, -1, -1):
+			key = path[d]
+			state = changes.get(key)
+			if undo is not None:
+				undo.append((key, state))
+			# end if
+			if state is None:
+				state = self.query_state(key)
+			# end if
+			a, b, log_kt, log_probability = state
+
+			multiplier = log_kt_multiplier(a, b, symbol)
+			if d == self.depth:
+				log_conditional = multiplier
+				child_log_probability = log_kt + multiplier
+			else:
+				sibling_key = path[d + 1] ^ (1 << d)
+				log_sibling = changes[sibling_key][3] if sibling_key in changes else self.query_state(sibling_key)[3]
+				log_children = child_before + log_sibling
+				log_conditional = log_add(log_kt + multiplier, log_children + log_conditional) - log_add(log_kt, log_children)
+				child_log_probability = log_half + log_add(log_kt + multiplier, child_after + log_sibling)
+			# end if
+
+			if symbol == 0:
+				changes[key] = (a + 1, b, log_kt + multiplier, child_log_probability)
+			else:
+				changes[key] = (a, b + 1, log_kt + multiplier, child_log_probability)
+			# end if
+
+			# the weighted log probability of this node before and after the update, for its parent
+			child_before = log_probability
+			child_after = child_log_probability
+		# end for
+
+		return log_conditional
+	# end def
+
+	def revert(self, symbol_count = 1):
+		""" Restores the context tree to its state prior to a specified number of updates.
+
+			- `num_symbols`: the number of updates (symbols) to revert. (Default of 1.)
+		"""
+
+		self.generation = next(generations)
+		for i in xrange(0, symbol_count):
+			# The symbol was added with the context that preceded it.
+			symbol = self.history[len(self.history) - 1]
+			self.revert_history()
+
+			# Symbols seen before the history could fill a whole context never reached the nodes.
+			if len(self.history) < self.depth:
+				continue
+			# end if
+
+			self.update_context()
+
+			# Revert the children before their parents.
+			for d in xrange(self.depth, -1, -1):
+				self.revert_node(d, symbol)
+			# end for
+		# end for
+	# end def
+
+	def revert_node(self, d, symbol):
+		""" Reverts the node at depth `d` of the context to its state immediately prior to the last update
+			with `symbol`. A node left without visits frees its slot.
+			(See `CTWContextTreeNode.revert()`.)
+		"""
+
+		slot = self.context[d]
+		counts = self.symbol_count[symbol]
+		if counts[slot] >= 1:
+			counts[slot] -= 1
+			if slot > 0 and self.visits(slot) == 0:
+				self.tree_size -= 1
+			# end if
+		# end if
+
+		self.log_kt[slot] -= self.log_kt_multiplier(slot, symbol)
+
+		# A node without visits has the statistics of a node that doesn't exist.
+		if slot > 0 and self.visits(slot) == 0:
+			self.log_kt[slot] = 0.0
+			self.log_probability[slot] = 0.0
+			return
+		# end if
+
+		self.update_log_probability(d)
+	# end def
+
+	def rollback(self, token):
+		""" Restores the tree to its state when `checkpoint()` returned the given token.
+			(See `CTWContextTree.checkpoint()`.)
+			The collision and eviction counts are not rolled back.
+		"""
+
+		journal_length, history_length, tree_size, ghost_nodes, generation = token[0:5]
+		journal = self.journal
+		while len(journal) > journal_length:
+			slot, state, removed_symbols = journal.pop()
+			if slot is None:
+				# restore symbols removed from the history
+				del self.history[state:]
+				self.history.extend(removed_symbols)
+			else:
+				self.slot_key[slot], self.symbol_count[0][slot], self.symbol_count[1][slot], \
+					self.log_kt[slot], self.log_probability[slot] = state
+			# end if
+		# end while
+
+		del self.history[history_length:]
+		self.tree_size = tree_size
+		self.generation = generation
+		self.update_suffix()
+	# end def
+
+	def sibling_log_probability(self, d):
+		""" Returns the weighted log probability of the child of the node at depth `d` of the context which
+			is not on the context, or 0 if it has no slot.
+		"""
+
+		sibling = self.find_slot(self.context_keys[d + 1] ^ (1 << d))[0]
+		if sibling < 0:
+			return 0.0
+		# end if
+
+		return self.log_probability[sibling]
+	# end def
+
+	def snapshot(self, slot):
+		""" Returns the key and statistics of the given slot, as stored in the undo journal.
+		"""
+
+		return (self.slot_key[slot], self.symbol_count[0][slot], self.symbol_count[1][slot],
+		        self.log_kt[slot], self.log_probability[slot])
+	# end def
+
+	def update(self, symbol_list):
+		""" Updates the context tree with a new (binary) symbol, or a list of symbols.
+			Recalculates the log weighted probabilities and log KT estimates for each affected node.
+
+			- `symbol_list`: the symbol (or list of symbols) with which to update the tree.
+							  (The context tree is updated with symbols in the order they appear in the list.)
+		"""
+
+		self.generation = next(generations)
+		for symbol in symbol_list:
+			# The first `depth` symbols have no complete context, so they only extend the history.
+			if len(self.history) >= self.depth:
+				self.update_context()
+
+				# Update the leaf first, as the weighted probabilities of parents depend on their children.
+				for d in xrange(self.depth, -1, -1):
+					slot = self.context[d]
+					if slot > 0 and self.visits(slot) == 0:
+						self.tree_size += 1
+					# end if
+					self.log_kt[slot] += self.log_kt_multiplier(slot, symbol)
+					self.symbol_count[symbol][slot] += 1
+					self.update_log_probability(d)
+				# end for
+			# end if
+
+			self.update_history([symbol])
+		# end for
+	# end def
+
+	def update_context(self):
+		""" Finds the slots of the nodes of the current context, and adds them to `context` in order from
+			root to leaf, with their keys in `context_keys`.
+
+			Gives the nodes slots if they don't have them.
+		"""
+
+		suffix = self.suffix
+		self.context = context = []
+		self.context_keys = context_keys = []
+		for d in xrange(0, self.depth + 1):
+			key = (1 << d) | (suffix & ((1 << d) - 1))
+			context.append(self.claim_slot(key, context))
+			context_keys.append(key)
+		# end for
+	# end def
+
+	def update_log_probability(self, d):
+		""" Calculates the logarithm of the weighted probability for the node at depth `d` of the context.
+			(See `CTWContextTreeNode.update_log_probability()`.)
+		"""
+
+		slot = self.context[d]
+		log_kt = self.log_kt[slot]
+
+		if d == self.depth:
+			self.log_probability[slot] = log_kt
+			return
+		# end if
+
+		# A child without a slot has never been visited, so its weighted probability is 1.
+		log_children = self.log_probability[self.context[d + 1]] + self.sibling_log_probability(d)
+
+		# Choose the formulation with the smaller exponent to avoid overflow.
+		a = max(log_kt, log_children)
+		b = min(log_kt, log_children)
+		self.log_probability[slot] = log_half + a + math.log(1 + math.exp(b - a))
+	# end def
+
+	def visits(self, slot):
+		""" Returns the number of times the context of the node in the given slot has been visited.
+		"""
+
+		return self.symbol_count[0][slot] + self.symbol_count[1][slot]
+	# end def
+# end class
@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define compact stores for the history of a context tree: a fixed-capacity ring buffer, and a bit-packed
+sequence of the whole history.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+class BitPackedHistory:
+	""" The history of a context tree, packed eight symbols to a byte.
+
+		It can be used in place of the list a context tree normally keeps its history in (see
+		`CTWContextTree.set_history()`), and supports the list operations the trees use:
+		`len()`, indexing and slicing, `append()`, `extend()`, `+=`, and truncation with `del history[n:]`.
+		A list holds a pointer of at least eight bytes per symbol, so this uses about 1/64 of the memory.
+
+		Symbol `i` is bit `i % 8` of byte `i // 8` of `bits`. The most recent symbols are also kept in the
+		integer `tail`, the most recent in bit 0, so that `suffix()` returns the last `k` symbols as
+		an integer in constant time, in the form the suffix-addressed context trees use as keys.
+
+		Slicing returns a list, as with a list. (`util.decode()` indexes the history directly, so it
+		needs no copy of the symbols it decodes.)
+	"""
+
+	def __init__(self, suffix_length = 64):
+		""" Create an empty history.
+
+			- `suffix_length`: the longest suffix that `suffix()` returns in constant time.
+			  For a context tree, this should be at least its depth.
+		"""
+
+		# The symbols, packed eight to a byte.
+		self.bits = bytearray()
+
+		# The length of the history.
+		self.length = 0
+
+		# The longest suffix kept in `tail`.
+		self.suffix_length = suffix_length
+
+		# The last `tail_length` symbols, the most recent in bit 0. Up to twice `suffix_length` symbols are kept,
+		# so that truncations only need to read symbols back from `bits` once every `suffix_length` symbols.
+		self.tail = 0
+		self.tail_length = 0
+	# end def
+
+	def __add__(self, symbol_list):
+		""" Returns a copy of the history extended by the given symbols.
+		"""
+
+		history = BitPackedHistory(self.suffix_length)
+		history.bits[:] = self.bits
+		history.length = self.length
+		history.tail = self.tail
+		history.tail_length = self.tail_length
+		history.extend(symbol_list)
+		return history
+	# end def
+
+	def __delitem__(self, index):
+		""" Truncates the history. Only slices to the end of the history, `del history[n:]`, are supported.
+		"""
+
+		assert type(index) == slice and index.stop is None and index.step is None, \
+			"Only the end of the history can be deleted."
+
+		self.truncate(index.indices(self.length)[0])
+	# end def
+
+	def __getitem__(self, index):
+		""" Returns the symbol at the given index, or a list of the symbols in the given slice.
+		"""
+
+		if type(index) == slice:
+			start, stop, step = index.indices(self.length)
+			return [(self.bits[i >> 3] >> (i & 7)) & 1 for i in xrange(start, stop, step)]
+		# end if
+
+		if index < 0:
+			index += self.length
+		# end if
+
+		if index < 0 or index >= self.length:
+			raise IndexError("History index %d is out of range." % index)
+		# end if
+
+		return (self.bits[index >> 3] >> (index & 7)) & 1
+	# end def
+
+	def __iadd__(self, symbol_list):
+		""" Appends the given symbols to the history.
+		"""
+
+		self.extend(symbol_list)
+		return self
+	# end def
+
+	def __iter__(self):
+		""" Iterates over the symbols of the history.
+		"""
+
+		bits = self.bits
+		for index in xrange(0, self.length):
+			yield (bits[index >> 3] >> (index & 7)) & 1
+		# end for
+	# end def
+
+	def __len__(self):
+		""" Returns the length of the history.
+		"""
+
+		return self.length
+	# end def
+
+	def append(self, symbol):
+		""" Appends a symbol to the history.
+		"""
+
+		length = self.length
+		if length & 7 == 0:
+			self.bits.append(symbol)
+		else:
+			self.bits[-1] |= symbol << (length & 7)
+		# end if
+		self.length = length + 1
+
+		tail_length = self.tail_length
+		if tail_length < 2 * self.suffix_length:
+			self.tail = (self.tail << 1) | symbol
+			self.tail_length = tail_length + 1
+		else:
+			self.tail = ((self.tail << 1) | symbol) & ((1 << tail_length) - 1)
+		# end if
+	# end def
+
+	def extend(self, symbol_list):
+		""" Appends the given symbols to the history.
+		"""
+
+		for symbol in symbol_list:
+			self.append(symbol)
+		# end for
+	# end def
+
+	def suffix(self, length):
+		""" Returns the last `length` symbols of the history (or the whole history, if it is shorter)
+			as an integer, with the most recent symbol in bit 0.
+		"""
+
+		if length <= self.tail_length:
+			return self.tail & ((1 << length) - 1)
+		# end if
+
+		# read the symbols from `bits`, oldest first
+		suffix = 0
+		bits = self.bits
+		for index in xrange(max(0, self.length - length), self.length):
+			suffix = (suffix << 1) | ((bits[index >> 3] >> (index & 7)) & 1)
+		# end for
+		return suffix
+	# end def
+
+	def truncate(self, length):
+		""" Removes the symbols after the first `length` symbols from the history.
+		"""
+
+		assert 0 <= length <= self.length, "The given history length (%d) is invalid." % length
+
+		removed = self.length - length
+		del self.bits[(length + 7) >> 3:]
+		if length & 7:
+			self.bits[-1] &= (1 << (length & 7)) - 1
+		# end if
+		self.length = length
+
+		if self.tail_length - removed >= min(self.suffix_length, length):
+			self.tail >>= removed
+			self.tail_length -= removed
+		else:
+			# too few symbols are left in the tail, so read it back from `bits`
+			self.tail_length = 0
+			self.tail = self.suffix(min(2 * self.suffix_length, length))
+			self.tail_length = min(2 * self.suffix_length, length)
+		# end if
+	# end def
+
+# end class
+
+class CTWHistory:
+	""" The history of a context tree, keeping only its most recent symbols in a ring buffer.
+
+		It can be used in place of the list a context tree normally keeps its history in (see
+		`CTWContextTree.set_history()`), and supports the list operations the trees use:
+		`len()`, indexing and slicing, `append()`, `extend()`, `+=`, and truncation with `del history[n:]`.
+		Appending and truncating take time proportional to the number of symbols added or removed,
+		however long the history is.
+
+		`len()` is the length of the whole history, but only the last `capacity` symbols are kept.
+		The capacity must be at least the tree's depth plus the number of symbols added by a search
+		simulation, so that reverting a simulation never needs symbols that are no longer kept.
+
+		If an `archive` file is given, symbols pushed out of the buffer are written to it, one byte
+		per symbol, so that the full history stays available without being held in memory.
+	"""
+
+	def __init__(self, capacity, archive = None):
+		""" Create an empty history.
+
+			- `capacity`: the number of most recent symbols to keep in memory.
+			- `archive`: the path of a file to write older symbols to, or None to discard them.
+		"""
+
+		assert capacity > 0, "The given history capacity must be greater than zero."
+
+		# The number of symbols kept.
+		self.capacity = capacity
+
+		# The ring buffer of symbols. Symbol `i` of the history is kept at `i % capacity`.
+		self.symbols = bytearray(capacity)
+
+		# The length of the history.
+		self.length = 0
+
+		# The index of the oldest symbol still in the buffer.
+		self.start = 0
+
+		# The file older symbols are written to, holding symbols `0` to `start - 1`, or None.
+		self.archive = open(archive, 'w+b') if archive is not None else None
+	# end def
+
+	def __add__(self, symbol_list):
+		""" Returns a copy of the history, without its archive, extended by the given symbols.
+		"""
+
+		history = CTWHistory(self.capacity)
+		history.symbols[:] = self.symbols
+		history.length = self.length
+		history.start = self.start
+		history.extend(symbol_list)
+		return history
+	# end def
+
+	def __delitem__(self, index):
+		""" Truncates the history. Only slices to the end of the history, `del history[n:]`, are supported.
+		"""
+
+		assert type(index) == slice and index.stop is None and index.step is None, \
+			"Only the end of the history can be deleted."
+
+		self.truncate(index.indices(self.length)[0])
+	# end def
+
+	def __getitem__(self, index):
+		""" Returns the symbol at the given index, or a list of the symbols in the given slice.
+		"""
+
+		if type(index) == slice:
+			start, stop, step = index.indices(self.length)
+			return [self[i] for i in xrange(start, stop, step)]
+		# end if
+
+		if index < 0:
+			index += self.length
+		# end if
+
+		if index < self.start or index >= self.length:
+			if 0 <= index < self.start and self.archive is not None:
+				return self.read_archive(index, 1)[0]
+			# end if
+			raise IndexError("History index %d is out of the range of symbols kept (%d to %d)." %
+							 (index, self.start, self.length - 1))
+		# end if
+
+		return self.symbols[index % self.capacity]
+	# end def
+
+	def __iadd__(self, symbol_list):
+		""" Appends the given symbols to the history.
+		"""
+
+		self.extend(symbol_list)
+		return self
+	# end def
+
+	def __iter__(self):
+		""" Iterates over the symbols of the history.
+		"""
+
+		for index in xrange(0, self.length):
+			yield self[index]
+		# end for
+	# end def
+
+	def __len__(self):
+		""" Returns the length of the history.
+		"""
+
+		return self.length
+	# end def
+
+	def append(self, symbol):
+		""" Appends a symbol to the history, pushing the oldest symbol out of the buffer if it's full.
+		"""
+
+		length = self.length
+		capacity = self.capacity
+		if length - self.start == capacity:
+			if self.archive is not None:
+				self.archive.seek(self.start)
+				self.archive.write(self.symbols[self.start % capacity:self.start % capacity + 1])
+			# end if
+			self.start += 1
+		# end if
+
+		self.symbols[length % capacity] = symbol
+		self.length = length + 1
+	# end def
+
+	def close(self):
+		""" Closes the archive file, if there is one.
+		"""
+
+		if self.archive is not None:
+			self.archive.close()
+			self.archive = None
+		# end if
+	# end def
+
+	def extend(self, symbol_list):
+		""" Appends the given symbols to the history.
+		"""
+
+		for symbol in symbol_list:
+			self.append(symbol)
+		# end for
+	# end def
+
+	def read_archive(self, index, count):
+		""" Returns a bytearray of the `count` symbols from the given index read from the archive file.
+		"""
+
+		self.archive.flush()
+		self.archive.seek(index)
+		return bytearray(self.archive.read(count))
+	# end def
+
+	def truncate(self, length):
+		""" Removes the symbols after the first `length` symbols from the history.
+
+			Symbols before the oldest one kept can only be removed if there is an archive, in which case
+			the symbols before the new end are read back into the buffer.
+		"""
+
+		assert 0 <= length <= self.length, "The given history length (%d) is invalid." % length
+
+		if length < self.start:
+			if length > 0:
+				assert self.archive is not None, \
+					"The history can't be truncated to %d symbols, as only symbols from %d on are kept." % \
+					(length, self.start)
+
+				# read the most recent symbols left back into the buffer
+				start = max(0, length - self.capacity)
+				for index, symbol in enumerate(self.read_archive(start, length - start)):
+					self.symbols[(start + index) % self.capacity] = symbol
+				# end for
+				self.start = start
+			else:
+				self.start = 0
+			# end if
+
+			if self.archive is not None:
+				self.archive.truncate(self.start)
+			# end if
+		# end if
+
+		self.length = length
+	# end def
+# end class
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define a context tree that keeps its nodes in a memory-mapped file, so that it can grow larger than memory
+and be reopened later.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import mmap
+import os
+import shutil
+import tempfile
+
+from pyaixi.prediction import ctw_array_context_tree, ctw_tree_file
+from pyaixi.prediction.ctw_array_context_tree import child_typecode, count_typecode, log_typecode, no_child
+from pyaixi.prediction.ctw_context_tree import generations
+from pyaixi.prediction.ctw_tree_file import record_fields, record_size
+
+# The number of records a new node file has room for. The file doubles in size whenever it's full.
+initial_capacity = 1024
+
+# The number of records at the start of the file to ask the operating system to read ahead on opening.
+hot_nodes = 1 << 14
+
+class CTWMmapContextTree(ctw_array_context_tree.CTWArrayContextTree):
+	""" An action-conditional context tree whose nodes are stored in fixed-size records in a memory-mapped file.
+
+		The node file is a tree file (see `ctw_tree_file`) with room for more records than are in use,
+		and records released by reverts chained together through their zero child.
+
+		The node statistics are read and written through strided views of the mapped file, with the same
+		names and indexing as the arrays of `CTWArrayContextTree` (`symbol_count`, `log_kt`, `log_probability`
+		and `child`), so the tree works exactly like the array-backed one. The operating system keeps the
+		recently used pages of the file in memory and writes the others back to disk, so the tree can grow
+		much larger than the available memory.
+
+		Nodes are numbered in the order they're created, so the nodes near the root, which every context
+		visits, share the first pages of the file and stay in memory, while deep, rarely visited nodes are
+		only read from disk when they're used. The first `hot_nodes` records are read ahead when the file
+		is mapped.
+
+		`flush()` writes the header and the end of the history to the file, and `close()` closes it.
+		Creating a tree with the path of an existing node file, or of a tree saved by `ctw_tree_file.save_tree()`,
+		reopens it without reading the nodes, with the last `depth` symbols of the saved history as its history.
+
+		With `copy_on_write`, the file is mapped privately, so that changes to the tree are never written
+		back to it. Trained trees can then be loaded without copying them, e.g. for a warm start. Once the
+		tree outgrows the file, it's copied to a temporary file, which the tree is kept in from then on.
+		(A saved tree has no room for more nodes, so this happens on the first update that creates a node.)
+	"""
+
+	def __init__(self, depth, path = None, hot_nodes = hot_nodes, copy_on_write = False):
+		""" Create a context tree of specified maximum depth, stored in the given file.
+			Nodes are created as needed.
+
+			- `depth`: the maximum depth of the context tree.
+			- `path`: the path of the node file. If the file exists and isn't empty, the tree saved in it is
+			  reopened. Otherwise a new tree is created in it. If None, a temporary file is used.
+			- `hot_nodes`: the number of records at the start of the file to read ahead when it's mapped.
+			- `copy_on_write`: whether to keep changes to an existing tree out of its file (see above).
+		"""
+
+		# The number of records read ahead.
+		self.hot_nodes = hot_nodes
+
+		# The size of the header, followed by room for the last `depth` symbols of the history.
+		self.header_size = ctw_tree_file.header_size(depth)
+
+		# Whether the file is mapped privately, so that changes aren't written back to it.
+		self.copy_on_write = False
+
+		# The mapped file, and the views of it in use.
+		self.map = None
+		self.views = []
+
+		# The node file, which `create_nodes()` maps.
+		if path is not None and os.path.exists(path) and os.path.getsize(path) > 0:
+			self.file = open(path, 'rb' if copy_on_write else 'r+b')
+			self.copy_on_write = copy_on_write
+		else:
+			self.file = open(path, 'w+b') if path is not None else tempfile.TemporaryFile()
+		# end if
+
+		# The node records always hold 8-byte statistics (see `ctw_array_context_tree.precisions`).
+		ctw_array_context_tree.CTWArrayContextTree.__init__(self, depth, 'double')
+	# end def
+
+	def clear(self):
+		""" Clears the entire context tree including all nodes and history.
+		"""
+
+		# Reset the history, and discard any checkpoints.
+		del self.history[:]
+		self.journal = None
+
+		# Empty the file, then add the root node. A file mapped privately is left as it is.
+		if self.copy_on_write:
+			self.unmap_file()
+			self.file.close()
+			self.file = tempfile.TemporaryFile()
+			self.copy_on_write = False
+		# end if
+		self.create_nodes()
+		self.generation = next(generations)
+
+		# Unvisited nodes are removed straight away, so there are never any ghost nodes.
+		self.ghost_nodes = 0
+
+		# Reset the context.
+		self.context = []
+	# end def
+
+	def close(self):
+		""" Writes the tree to its file, and closes it. The tree can't be used afterwards.
+		"""
+
+		self.flush()
+		self.unmap_file()
+		self.file.close()
+	# end def
+
+	def create_nodes(self):
+		""" Maps the node file with room for `initial_capacity` records, holding just the root node, and resets
+			the tree size. When the tree is created from a node file that isn't empty, the tree saved in it is
+			restored instead.
+		"""
+
+		if self.map is None and os.fstat(self.file.fileno()).st_size > 0:
+			self.load_header()
+			return
+		# end if
+
+		self.node_count = 0
+		self.map_file(initial_capacity)
+
+		# The ids of deleted nodes, available for reuse.
+		self.free_nodes = []
+
+		self.allocate_node()
+		self.tree_size = 1
+	# end def
+
+	def flush(self):
+		""" Writes the header and the end of the history to the file, and any changed nodes not yet written
+			back, so that the tree can be reopened from the file. Does nothing for a copy-on-write tree.
+		"""
+
+		assert self.journal is None, "The tree can't be written to its file while there is a checkpoint."
+
+		if self.copy_on_write:
+			return
+		# end if
+
+		# Chain the released records together through their zero child, from the last released.
+		free_head = -1
+		for index in self.free_nodes:
+			self.child[0][index] = free_head
+			free_head = index
+		# end for
+
+		ctw_tree_file.write_header(self.map, self.depth, self.node_count, self.tree_size, free_head, self.history)
+		self.map.flush()
+	# end def
+
+	def grow_arrays(self):
+		""" Adds a record with empty statistics to the end of the file, and returns its id.
+		"""
+
+		index = self.node_count
+		if index >= self.capacity:
+			self.map_file(2 * self.capacity)
+		# end if
+		self.node_count = index + 1
+
+		# The record may hold the statistics of a node removed by a rollback.
+		self.symbol_count[0][index] = 0
+		self.symbol_count[1][index] = 0
+		self.log_kt[index] = 0.0
+		self.log_probability[index] = 0.0
+		self.child[0][index] = no_child
+		self.child[1][index] = no_child
+		return index
+	# end def
+
+	def load_header(self):
+		""" Maps an existing node file, and restores the tree's state from its header.
+		"""
+
+		self.file.seek(0)
+		depth, node_count, tree_size, free_head, history, flags = ctw_tree_file.read_header(
+			self.file.read(self.header_size))
+		assert depth == self.depth, \
+			"The node file holds a tree of depth %d, rather than %d." % (depth, self.depth)
+		assert not flags & ctw_tree_file.flag_pruned, "A memory-mapped context tree can't hold a pruned tree."
+
+		self.node_count = node_count
+		self.map_file(max(node_count, (os.fstat(self.file.fileno()).st_size - self.header_size) // record_size))
+
+		# Follow the chain of released records, restoring the free list in the order it was written.
+		self.free_nodes = []
+		index = free_head
+		while index != -1:
+			self.free_nodes.append(index)
+			index = self.child[0][index]
+		# end while
+		self.free_nodes.reverse()
+
+		self.history = history
+		self.journal = None
+		self.tree_size = tree_size
+		self.generation = next(generations)
+		self.ghost_nodes = 0
+		self.context = []
+	# end def
+
+	def map_file(self, capacity):
+		""" Sizes the file to hold the given number of records, then maps it and updates the views
+			of the node statistics.
+		"""
+
+		size = self.header_size + capacity * record_size
+
+		if self.copy_on_write and self.map is not None:
+			# Changes to a file mapped privately would be lost by mapping it again, so carry on in a temporary copy.
+			copy = tempfile.TemporaryFile()
+			self.map.seek(0)
+			shutil.copyfileobj(self.map, copy)
+			self.unmap_file()
+			self.file.close()
+			self.file = copy
+			self.copy_on_write = False
+		# end if
+
+		self.unmap_file()
+
+		if self.copy_on_write:
+			self.map = mmap.mmap(self.file.fileno(), size, access = mmap.ACCESS_COPY)
+		else:
+			if os.fstat(self.file.fileno()).st_size != size:
+				self.file.truncate(size)
+			# end if
+			self.file.flush()
+			self.map = mmap.mmap(self.file.fileno(), size)
+		# end if
+		self.capacity = capacity
+
+		# Ask for the records of the nodes near the root to be read ahead.
+		if hasattr(self.map, 'madvise') and self.hot_nodes > 0:
+			hot_size = min(size, self.header_size + self.hot_nodes * record_size)
+			self.map.madvise(mmap.MADV_WILLNEED, 0, hot_size)
+		# end if
+
+		# Field `f` of record `i` is item `i * record_fields + f` of the records viewed as 8-byte values.
+		records = memoryview(self.map)[self.header_size:]
+		counts = records.cast(count_typecode)
+		logs = records.cast(log_typecode)
+		children = records.cast(child_typecode)
+		self.symbol_count = [counts[0::record_fields], counts[1::record_fields]]
+		self.log_kt = logs[2::record_fields]
+		self.log_probability = logs[3::record_fields]
+		self.child = [children[4::record_fields], children[5::record_fields]]
+
+		self.views = [records, counts, logs, children, self.log_kt, self.log_probability] + \
+		             self.symbol_count + self.child
+	# end def
+
+	def shrink_arrays(self):
+		""" Removes the record at the end of the file from use.
+		"""
+
+		self.node_count -= 1
+	# end def
+
+	def unmap_file(self):
+		""" Releases the views of the mapped file, and unmaps it.
+		"""
+
+		for view in self.views:
+			view.release()
+		# end for
+		self.views = []
+
+		if self.map is not None:
+			self.map.close()
+			self.map = None
+		# end if
+	# end def
+
+	def update_context(self):
+		""" Calculates which nodes in the context tree correspond to the current
+			context, and adds their ids to `context` in order from root to leaf.
+			(See `CTWArrayContextTree.update_context()`.)
+
+			The file is grown first if a new context might not fit, so that it isn't remapped
+			while the context is being found.
+		"""
+
+		if self.node_count + self.depth + 1 > self.capacity:
+			self.map_file(max(2 * self.capacity, self.node_count + self.depth + 1))
+		# end if
+
+		ctw_array_context_tree.CTWArrayContextTree.update_context(self)
+	# end def
+# end class
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define a context tree that finds the nodes of the current context by their suffix, rather than by
+following child pointers from the root.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree, ctw_history
+
+class CTWSuffixContextTree(ctw_context_tree.CTWContextTree):
+	""" An action-conditional context tree whose nodes are found through a hash map keyed by their context.
+
+		The last `depth` symbols of the history are kept in the integer shift register `suffix`,
+		with the most recent symbol in bit 0. The node at depth `d` of the current context is then
+
+		  nodes[(1 << d) | (suffix & ((1 << d) - 1))]
+
+		where the leading one bit distinguishes the depth, so each key stands for a (depth, suffix bits) pair.
+		`update_context()` finds the whole context path with these integer operations and dictionary
+		lookups, and writes it into the same `context` list each time instead of building a new one.
+
+		The nodes are ordinary `CTWContextTreeNode`s, and still hold links to their children, so the
+		tree can be inspected and queried (see `predict()`) like a `CTWContextTree`.
+
+		Nodes deleted from the tree by `revert()` or `rollback()` are left in `nodes`. If their context
+		is seen again, they are cleared and attached to their parent again, rather than being created.
+		This takes the place of the pool of released nodes of `CTWContextTree`, which isn't used.
+		Once the deleted nodes outnumber the nodes in the tree, `update_context()` rebuilds the map from
+		the tree, so the map holds at most about twice as many nodes as the tree, however many contexts
+		searches have simulated and reverted. The map isn't rebuilt while there is a checkpoint, as rolling
+		back puts nodes deleted since the checkpoint back in the tree.
+	"""
+
+	def __init__(self, depth):
+		""" Create a context tree of specified maximum depth.
+			Nodes are created as needed.
+
+			- `depth`: the maximum depth of the context tree.
+		"""
+
+		ctw_context_tree.CTWContextTree.__init__(self, depth)
+
+		# The nodes below the root, indexed by their depth and context (see above).
+		self.nodes = {}
+
+		# The last `depth` symbols of the history, the most recent in bit 0.
+		self.suffix = 0
+
+		# The mask selecting the last `depth` symbols of the history.
+		self.suffix_mask = (1 << depth) - 1
+
+		# The nodes of the current context, from root to leaf, filled in by `update_context()`.
+		self.context = [self.root] * (depth + 1)
+
+		# Deleted nodes stay in `nodes` to be reattached, so they can't be reused for other contexts.
+		self.node_pool_limit = 0
+	# end def
+
+	def clear(self):
+		""" Clears the entire context tree including all nodes and history.
+		"""
+
+		ctw_context_tree.CTWContextTree.clear(self)
+
+		self.nodes = {}
+		self.suffix = 0
+		self.context = [self.root] * (self.depth + 1)
+	# end def
+
+	def prune(self, max_nodes):
+		""" Removes subtrees until the tree has at most `max_nodes` nodes, and returns the number of nodes
+			removed. (See `CTWContextTree.prune()`.)
+
+			The map of nodes is rebuilt from the remaining tree, so that the memory of the removed nodes
+			(and of any deleted earlier) is freed.
+		"""
+
+		pruned_nodes = ctw_context_tree.CTWContextTree.prune(self, max_nodes)
+		self.update_nodes()
+		return pruned_nodes
+	# end def
+
+	def revert_history(self, symbol_count = 1):
+		""" Shrinks the history without affecting the context tree.
+		"""
+
+		ctw_context_tree.CTWContextTree.revert_history(self, symbol_count)
+		self.update_suffix()
+	# end def
+
+	def rollback(self, token):
+		""" Restores the tree to its state when `checkpoint()` returned the given token.
+			(See `CTWContextTree.checkpoint()`.)
+		"""
+
+		ctw_context_tree.CTWContextTree.rollback(self, token)
+		self.update_suffix()
+	# end def
+
+	def update_context(self):
+		""" Finds the nodes of the current context by their suffix, and writes them into `context`
+			in order from root to leaf.
+
+			Creates the nodes if they do not exist, and reattaches nodes deleted from the tree.
+		"""
+
+		context = self.context
+		journal = self.journal
+		suffix = self.suffix
+
+		# Drop the deleted nodes from the map once they outnumber the nodes in the tree (see above).
+		if journal is None and len(self.nodes) > 2 * (self.tree_size + self.ghost_nodes) + self.depth:
+			self.update_nodes()
+		# end if
+		nodes = self.nodes
+
+		self.visit_clock += 1
+		visit_clock = self.visit_clock
+
+		v = self.root
+		if journal is not None:
+			journal.append((v, v.snapshot(), None))
+		# end if
+		v.last_visit = visit_clock
+
+		created = False
+		for d in xrange(1, self.depth + 1):
+			key = (1 << d) | (suffix & ((1 << d) - 1))
+			u = nodes.get(key)
+			if u is None:
+				u = self.create_node()
+				nodes[key] = u
+				v.children[(suffix >> (d - 1)) & 1] = u
+				self.tree_size += 1
+				created = True
+			elif v.children.get((suffix >> (d - 1)) & 1) is not u:
+				# the node was deleted since it was last used, so clear it and attach it to its parent again
+				u.restore((0, 0, 0.0, 0.0, {}, 0.0, 0))
+				v.children[(suffix >> (d - 1)) & 1] = u
+				self.tree_size += 1
+				created = True
+			else:
+				if self.ghost_nodes > 0 and u.visits() == 0:
+					# a ghost left by a revert is in use again (see `CTWContextTree.set_deferred_pruning()`)
+					self.tree_size += 1
+					self.ghost_nodes -= 1
+				# end if
+				if journal is not None and not created:
+					# save the state of nodes about to change (see `CTWContextTree.update_context()`)
+					journal.append((u, u.snapshot(), None))
+				# end if
+			# end if
+
+			u.last_visit = visit_clock
+			context[d] = u
+			v = u
+		# end for
+	# end def
+
+	def update_history(self, symbol_list):
+		""" Appends a symbol (or a list of symbols) to the tree's history without updating the tree.
+
+			- `symbol_list`: the symbol (or list of symbols) to add to the history.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		self.history += symbol_list
+
+		# Shift the new symbols into the suffix.
+		suffix = self.suffix
+		for symbol in symbol_list:
+			suffix = (suffix << 1) | symbol
+		# end for
+		self.suffix = suffix & self.suffix_mask
+	# end def
+
+	def update_nodes(self):
+		""" Rebuilds the map of nodes from the tree, after nodes have been removed from it or added to it
+			other than by `update_context()`.
+		"""
+
+		self.nodes = {}
+		stack = [(self.root, 1)]
+		while len(stack) > 0:
+			node, key = stack.pop()
+			d = key.bit_length() - 1
+			for symbol, child in node.children.items():
+				child_key = (key ^ (1 << d)) | (1 << (d + 1)) | (symbol << d)
+				self.nodes[child_key] = child
+				stack.append((child, child_key))
+			# end for
+		# end while
+	# end def
+
+	def update_suffix(self):
+		""" Recalculates `suffix` from the history, after symbols have been removed from it.
+		"""
+
+		history = self.history
+
+		# a bit-packed history keeps its suffix ready
+		if isinstance(history, ctw_history.BitPackedHistory):
+			self.suffix = history.suffix(self.depth)
+			return
+		# end if
+
+		suffix = 0
+		for symbol in history[max(0, len(history) - self.depth):]:
+			suffix = (suffix << 1) | symbol
+		# end for
+		self.suffix = suffix
+	# end def
+# end class
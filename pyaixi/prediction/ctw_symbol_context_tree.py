@@ -0,0 +1,594 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define a context tree over whole symbols of several bits, such as the agent's percepts, rather than over bits.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import math
+import random
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi import util
+from pyaixi.prediction.ctw_context_tree import log_half
+from pyaixi.prediction.ctw_hashed_context_tree import log_add
+
+# The priors the symbol estimators can be given by name (see `CTWSymbolContextTree.__init__()`):
+#  - 'kt' gives each symbol a pseudo-count of 1/2, as the KT estimator does.
+#  - 'sparse' gives each symbol a pseudo-count of 1/M, for an alphabet of `M` symbols, so that the estimator
+#    learns quickly when only a few of the symbols are ever seen.
+symbol_priors = ('kt', 'sparse')
+
+# The log probabilities of the nodes are kept in fixed point, as whole numbers of `1/log_scale`, so that
+# reverting an update subtracts exactly what it added, and leaves the tree exactly as it was.
+# Predictions, which change nothing, are calculated in floating point, multiplying by `log_unit`.
+log_scale = 1 << 48
+log_unit = 1.0 / log_scale
+
+def fixed_log(value):
+	""" Returns the given log probability in fixed point. (See `log_scale`.)
+	"""
+
+	return int(round(value * log_scale))
+# end def
+
+def symbol_value(symbol_list):
+	""" Returns the value of the given list of bits, read with the first bit as the most significant
+		(the order used by `util.encode()`).
+	"""
+
+	value = 0
+	for symbol in symbol_list:
+		value = (value << 1) | symbol
+	# end for
+	return value
+# end def
+
+class CTWSymbolContextTreeNode:
+	""" A node of a `CTWSymbolContextTree`.
+
+		The node holds an estimator over an alphabet of `M` symbols. Denoting by `n_x` the number of
+		times symbol `x` was seen at the node, and by `n` the number of symbols seen, the estimator is
+		updated with the multiplier
+
+		  Pr_kt(x | h_n) = (n_x + a)/(n + a M)
+
+		where `a` is the pseudo-count of the tree's prior. With `a = 1/2` this is the multi-alphabet
+		KT estimator, which is the binary estimator of `CTWContextTreeNode` when `M` is 2.
+		The weighted probability is
+
+		  P_w^n(h_n) := Pr_kt(h_n)                                      (if n is a leaf node)
+		                1/2 Pr_kt(h_n) + 1/2 prod_c P_w^c(h_c)           (otherwise)
+
+		where the product is over the children `c` of the node, one for each symbol seen before `h_n`.
+		The sum of the weighted log probabilities of the children, `log_children`, is kept up to date as
+		they change, so a node's children aren't visited to update it.
+
+		The log probabilities are kept in fixed point (see `log_scale`), as integers, so that they are
+		restored exactly when updates are reverted, however many updates there have been.
+	"""
+
+	def __init__(self):
+		""" Construct a node of the context tree.
+		"""
+
+		# The children of this node, indexed by the value of the context symbol leading to them.
+		self.children = {}
+
+		# The sum of the weighted log probabilities of the children, in fixed point.
+		self.log_children = 0
+
+		# The KT estimate of the block log probability for this node, in fixed point.
+		self.log_kt = 0
+
+		# The weighted log probability for this node, in fixed point.
+		self.log_probability = 0
+
+		# The number of times each symbol value was seen at this node. Values never seen are left out.
+		self.symbol_count = {}
+
+		# The number of symbols seen at this node.
+		self.visit_count = 0
+	# end def
+
+	def size(self):
+		""" The number of descendants of this node, including itself.
+		"""
+
+		return 1 + sum([child.size() for child in self.children.values()])
+	# end def
+
+	def visits(self):
+		""" Returns the number of times this context has been visited.
+		"""
+
+		return self.visit_count
+	# end def
+# end class
+
+class CTWSymbolContextTree:
+	""" An action-conditional context tree whose nodes predict whole symbols of `symbol_bits` bits, with
+		contexts made of whole symbols of the history rather than bits.
+
+		The tree has the interface of `CTWContextTree`, so the agent can use it in the same way, but
+		each list of bits given to `update()` or `update_history()` is treated as a single symbol
+		(`update()` splits a list into symbols of `symbol_bits` bits). So an agent that updates the
+		history with each action and the tree with each percept walks one context path per percept,
+		rather than one per percept bit, and its contexts are the last `depth` actions and percepts.
+
+		The history is kept as a list of symbol values, with the number of bits of each, so that
+		`history_size()` gives the length of the history in bits, like `CTWContextTree`.
+
+		The KT estimator spreads a lot of probability over symbols never seen when the alphabet is large,
+		so the 'sparse' prior, with a pseudo-count of `1/M`, predicts much better for percepts of many bits
+		of which only a few values ever occur. (See `ctw_benchmark.py`'s `symbol` benchmark.)
+
+		Symbols of other widths than `symbol_bits`, such as actions, aren't predicted by the tree:
+		`predict()` gives them uniform probabilities, and `generate_random_symbols()` draws them uniformly.
+
+		Unlike `CTWContextTree`, predictions are calculated along the context path without changing
+		the tree, as in `CTWContextTree.predict()`. A symbol never seen at the root has the same
+		probability as every other unseen symbol, so `predict_distribution()` and the sampling methods
+		evaluate the path once for each symbol seen at the root, and once for all the others.
+	"""
+
+	def __init__(self, depth, symbol_bits = 1, prior = 'kt'):
+		""" Create a context tree of specified maximum depth, over symbols of the given number of bits.
+			Nodes are created as needed.
+
+			- `depth`: the maximum depth of the context tree, in symbols.
+			- `symbol_bits`: the number of bits of each symbol the tree predicts.
+			- `prior`: the pseudo-count of each symbol in the estimators of the nodes, or one of `symbol_priors`.
+		"""
+
+		# The maximum depth of the context tree.
+		assert depth >= 0, "The given tree depth must be greater than zero."
+		self.depth = depth
+
+		# The number of bits of each symbol, the size of the alphabet, and its logarithm.
+		assert symbol_bits > 0, "The given symbol size must be greater than zero."
+		self.symbol_bits = symbol_bits
+		self.alphabet_size = 1 << symbol_bits
+		self.log_alphabet_size = math.log(self.alphabet_size)
+
+		# The pseudo-count of each symbol, and of the whole alphabet.
+		if prior == 'kt':
+			prior = 1 / 2
+		elif prior == 'sparse':
+			prior = 1 / self.alphabet_size
+		# end if
+		assert prior > 0, "The given prior must be 'kt', 'sparse' or a pseudo-count greater than zero."
+		self.prior = prior
+		self.alphabet_prior = prior * self.alphabet_size
+
+		# Create the root node and an empty history.
+		self.clear()
+	# end def
+
+	def checkpoint(self):
+		""" Returns a token for the current state of the tree, which `rollback()` can restore.
+
+			The token is the length of the history: rolling back reverts the symbols added since.
+		"""
+
+		return len(self.history)
+	# end def
+
+	def clear(self):
+		""" Clears the entire context tree including all nodes and history.
+		"""
+
+		# The values of the symbols of the history, the number of bits of each, and whether each was
+		# used to update the tree.
+		self.history = []
+		self.history_widths = []
+		self.history_updates = []
+
+		# The length of the history in bits.
+		self.history_bits = 0
+
+		# The root node of the context tree, and the size of the tree.
+		self.root = CTWSymbolContextTreeNode()
+		self.tree_size = 1
+	# end def
+
+	def context_path(self, create = False):
+		""" Returns the nodes of the current context, from the root to the deepest node, where the node at
+			depth `d` is the child of the node above it for the `d`th most recent symbol of the history.
+
+			- `create`: whether to create the nodes that don't exist. Otherwise the path stops at the
+			            deepest node of the context in the tree.
+		"""
+
+		history = self.history
+		node = self.root
+		path = [node]
+		for d in xrange(1, min(self.depth, len(history)) + 1):
+			child = node.children.get(history[-d])
+			if child is None:
+				if not create:
+					break
+				# end if
+				child = CTWSymbolContextTreeNode()
+				node.children[history[-d]] = child
+				self.tree_size += 1
+			# end if
+			path.append(child)
+			node = child
+		# end for
+		return path
+	# end def
+
+	def generate_random_symbols(self, symbol_count, single_draw = False):
+		""" Returns a symbol string of a specified length by sampling from the context tree.
+			The tree isn't changed.
+
+			- `symbol_count`: the number of bits to generate.
+			- `single_draw`: unused, since a whole symbol is always drawn with one random number.
+		"""
+
+		if symbol_count != self.symbol_bits:
+			return [random.randrange(2) for i in xrange(0, symbol_count)]
+		# end if
+
+		return util.encode(self.sample_symbol(), symbol_count)
+	# end def
+
+	def generate_random_symbols_and_update(self, symbol_count, single_draw = False):
+		""" Returns a specified number of random symbols distributed according to
+			the context tree statistics and update the context tree with the newly
+			generated symbols.
+
+			- `symbol_count`: the number of bits to generate.
+			- `single_draw`: unused, since a whole symbol is always drawn with one random number.
+		"""
+
+		symbol_list = self.generate_random_symbols(symbol_count, single_draw)
+		self.update(symbol_list)
+		return symbol_list
+	# end def
+
+	def history_size(self):
+		""" Returns the length of the history, in bits.
+		"""
+
+		return self.history_bits
+	# end def
+
+	def log_kt_multiplier(self, node, symbol):
+		""" Returns the logarithm of the KT-estimator update multiplier of the given node for the given symbol.
+		"""
+
+		return math.log((node.symbol_count.get(symbol, 0) + self.prior) / (node.visit_count + self.alphabet_prior))
+	# end def
+
+	def log_symbol_probability(self, symbol):
+		""" Returns `log(rho(x | h))` for the symbol value `x`, by calculating the weighted log probability
+			each node of the current context would have after an update with it, from the deepest up.
+			The tree isn't changed.
+
+			- `symbol`: the value of the symbol.
+		"""
+
+		path = self.context_path()
+
+		# A context missing from the tree would be created as a chain of nodes which each see the symbol
+		# for the first time, with the weighted log probability `-log(M)`.
+		if len(path) <= min(self.depth, len(self.history)):
+			change = -self.log_alphabet_size
+			missing_child = True
+		else:
+			change = 0.0
+			missing_child = False
+		# end if
+
+		for node in reversed(path):
+			log_kt = node.log_kt * log_unit + self.log_kt_multiplier(node, symbol)
+			if node.children or missing_child:
+				log_probability = log_half + log_add(log_kt, node.log_children * log_unit + change)
+			else:
+				log_probability = log_kt
+			# end if
+			change = log_probability - node.log_probability * log_unit
+			missing_child = False
+		# end for
+
+		return change
+	# end def
+
+	def predict(self, symbol_list):
+		""" Returns the conditional probability of a symbol, or a list of bits of several symbols,
+			considering the history.
+
+			Given a history sequence `h` and a symbol `x`, the estimated probability is given by
+
+			  rho(x | h) = rho(hx)/rho(h)
+
+			A list of bits that isn't a whole number of symbols gets the uniform probability `2^-k`.
+
+			- `symbol_list`: the bits of the symbols to estimate the conditional probability of.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		if len(symbol_list) == self.symbol_bits:
+			return math.exp(self.log_symbol_probability(symbol_value(symbol_list)))
+		elif len(symbol_list) == 0 or len(symbol_list) % self.symbol_bits != 0:
+			return 0.5 ** len(symbol_list)
+		# end if
+
+		# Several symbols: each is conditioned on the ones before it, so the tree is updated with them in turn.
+		checkpoint = self.checkpoint()
+		log_conditional = 0.0
+		for i in xrange(0, len(symbol_list), self.symbol_bits):
+			symbol = symbol_list[i:i + self.symbol_bits]
+			log_conditional += self.log_symbol_probability(symbol_value(symbol))
+			self.update(symbol)
+		# end for
+		self.rollback(checkpoint)
+
+		return math.exp(log_conditional)
+	# end def
+
+	def predict_distribution(self, symbol_count):
+		""" Returns the conditional probabilities of every sequence of `symbol_count` bits, considering the history.
+
+			As with `CTWContextTree.predict_distribution()`, the probability of a sequence is at the index given
+			by reading it as a binary number with the first bit as the most significant. A sequence that isn't
+			a single symbol gets the uniform probability `2^-symbol_count`.
+
+			- `symbol_count`: the number of bits in each sequence.
+		"""
+
+		if symbol_count != self.symbol_bits:
+			return [0.5 ** symbol_count] * (1 << symbol_count)
+		# end if
+
+		seen_probabilities, unseen_probability = self.symbol_probabilities()
+		distribution = [unseen_probability] * self.alphabet_size
+		for symbol, probability in seen_probabilities:
+			distribution[symbol] = probability
+		# end for
+		return distribution
+	# end def
+
+	def release_checkpoint(self, token):
+		""" Releases the checkpoint with the given token. Checkpoints keep no state, so this does nothing.
+		"""
+
+		pass
+	# end def
+
+	def revert(self, symbol_count = 1):
+		""" Restores the context tree to its state prior to the updates with the given number of bits.
+			(Symbols added with `update_history()` are removed from the history too.)
+
+			- `symbol_count`: the number of bits to revert. (Default of 1.)
+		"""
+
+		reverted_bits = 0
+		while reverted_bits < symbol_count:
+			reverted_bits += self.revert_symbol()
+		# end while
+	# end def
+
+	def revert_history(self, symbol_count = 1):
+		""" Shrinks the history by the given number of bits, in whole symbols, without affecting the context tree.
+		"""
+
+		assert symbol_count > 0, "The given symbol count should be greater than 0."
+		assert self.history_bits >= symbol_count, "The given symbol count must be greater than the history length."
+
+		reverted_bits = 0
+		while reverted_bits < symbol_count:
+			reverted_bits += self.history_widths.pop()
+			self.history.pop()
+			self.history_updates.pop()
+		# end while
+		self.history_bits -= reverted_bits
+	# end def
+
+	def revert_symbol(self):
+		""" Removes the last symbol from the history, reverting the update of the tree with it if there was one,
+			and returns its number of bits.
+		"""
+
+		symbol = self.history.pop()
+		width = self.history_widths.pop()
+		updated = self.history_updates.pop()
+		self.history_bits -= width
+
+		if not updated:
+			return width
+		# end if
+
+		path = self.context_path()
+		history = self.history
+		change = 0
+		for d in xrange(len(path) - 1, -1, -1):
+			node = path[d]
+			node.log_children += change
+			old_log_probability = node.log_probability
+
+			node.visit_count -= 1
+			if node.symbol_count[symbol] == 1:
+				del node.symbol_count[symbol]
+			else:
+				node.symbol_count[symbol] -= 1
+			# end if
+			node.log_kt -= fixed_log(self.log_kt_multiplier(node, symbol))
+
+			if node.visit_count == 0 and d > 0:
+				# the context is no longer seen, so the node leaves the tree (and no longer counts in its parent)
+				del path[d - 1].children[history[-d]]
+				self.tree_size -= 1
+				change = -old_log_probability
+				continue
+			# end if
+
+			if not node.children:
+				node.log_children = 0
+				node.log_probability = node.log_kt
+			else:
+				node.log_probability = self.weighted_log_probability(node)
+			# end if
+			change = node.log_probability - old_log_probability
+		# end for
+
+		return width
+	# end def
+
+	def rollback(self, token):
+		""" Restores the tree to its state when `checkpoint()` returned the given token, by reverting
+			the symbols added to the history since.
+		"""
+
+		while len(self.history) > token:
+			self.revert_symbol()
+		# end while
+	# end def
+
+	def sample_symbol(self):
+		""" Returns the value of a symbol drawn from the tree's conditional distribution of the next symbol.
+		"""
+
+		seen_probabilities, unseen_probability = self.symbol_probabilities()
+
+		uniform = random.random()
+		for symbol, probability in seen_probabilities:
+			if uniform < probability:
+				return symbol
+			# end if
+			uniform -= probability
+		# end for
+
+		# An unseen symbol, or a rounding error: draw one of the unseen symbols uniformly.
+		seen = set([symbol for symbol, probability in seen_probabilities])
+		if len(seen) == self.alphabet_size:
+			return seen_probabilities[-1][0]
+		elif 2 * len(seen) < self.alphabet_size:
+			while True:
+				symbol = random.randrange(self.alphabet_size)
+				if symbol not in seen:
+					return symbol
+				# end if
+			# end while
+		# end if
+		return random.choice([symbol for symbol in xrange(0, self.alphabet_size) if symbol not in seen])
+	# end def
+
+	def size(self):
+		""" Returns the number of nodes in the context tree.
+		"""
+
+		return self.tree_size
+	# end def
+
+	def symbol_probabilities(self):
+		""" Returns the conditional probabilities of the next symbol, as a list of (value, probability) pairs
+			for the symbols seen at the root, and the probability of each of the other symbols.
+		"""
+
+		seen_probabilities = [(symbol, math.exp(self.log_symbol_probability(symbol)))
+		                      for symbol in sorted(self.root.symbol_count.keys())]
+
+		unseen_count = self.alphabet_size - len(seen_probabilities)
+		if unseen_count == 0:
+			return (seen_probabilities, 0.0)
+		# end if
+
+		# Every unseen symbol has the same counts at every node, so any of them will do.
+		unseen_symbol = 0
+		while unseen_symbol in self.root.symbol_count:
+			unseen_symbol += 1
+		# end while
+		return (seen_probabilities, math.exp(self.log_symbol_probability(unseen_symbol)))
+	# end def
+
+	def update(self, symbol_list):
+		""" Updates the context tree with the symbols in the given list of bits, `symbol_bits` at a time.
+			Recalculates the log weighted probabilities and log KT estimates for each affected node.
+
+			- `symbol_list`: the bits of the symbols with which to update the tree.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		assert len(symbol_list) % self.symbol_bits == 0, \
+			"The tree can only be updated with whole symbols of %d bits." % self.symbol_bits
+
+		for i in xrange(0, len(symbol_list), self.symbol_bits):
+			symbol = symbol_value(symbol_list[i:i + self.symbol_bits])
+
+			# the first `depth` symbols have no complete context, so they only extend the history
+			updated = len(self.history) >= self.depth
+			if updated:
+				self.update_symbol(symbol)
+			# end if
+
+			self.history.append(symbol)
+			self.history_widths.append(self.symbol_bits)
+			self.history_updates.append(updated)
+			self.history_bits += self.symbol_bits
+		# end for
+	# end def
+
+	def update_history(self, symbol_list):
+		""" Appends a symbol, given as a list of bits of any number, to the tree's history without updating the tree.
+
+			- `symbol_list`: the bits of the symbol to add to the history.
+		"""
+
+		# Ensure that we have a list, by making this a list if it's a single symbol.
+		if type(symbol_list) != list:
+			symbol_list = [symbol_list]
+		# end if
+
+		self.history.append(symbol_value(symbol_list))
+		self.history_widths.append(len(symbol_list))
+		self.history_updates.append(False)
+		self.history_bits += len(symbol_list)
+	# end def
+
+	def update_symbol(self, symbol):
+		""" Updates the nodes of the current context with the given symbol value, creating any that don't
+			exist, from the deepest up.
+		"""
+
+		change = 0
+		for node in reversed(self.context_path(True)):
+			node.log_children += change
+			old_log_probability = node.log_probability
+
+			node.log_kt += fixed_log(self.log_kt_multiplier(node, symbol))
+			node.symbol_count[symbol] = node.symbol_count.get(symbol, 0) + 1
+			node.visit_count += 1
+
+			if not node.children:
+				node.log_probability = node.log_kt
+			else:
+				node.log_probability = self.weighted_log_probability(node)
+			# end if
+			change = node.log_probability - old_log_probability
+		# end for
+	# end def
+
+	def weighted_log_probability(self, node):
+		""" Returns the weighted log probability, in fixed point, of the given node with children, from its
+			log KT estimate and the sum of the weighted log probabilities of its children.
+		"""
+
+		return fixed_log(log_half + log_add(node.log_kt * log_unit, node.log_children * log_unit))
+	# end def
+# end class
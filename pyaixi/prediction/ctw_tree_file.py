@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Define a compact binary file format for saving and loading trained context trees.
+
+A tree file is made up of:
+
+ - a header (see `header_format`): the magic number and version of the format, the depth of the tree,
+   the number of node records, the size of the tree, the id of the first released record (or -1), the
+   number of history symbols saved, and flags.
+
+ - the last `depth` symbols of the history, packed eight to a byte, least significant bit first
+   (as in `ctw_history.BitPackedHistory`), padded to a multiple of 8 bytes.
+
+ - the node records, each of six 8-byte fields: the counts of zeros and ones, the log KT estimate,
+   the weighted log probability, and the ids of the children for a zero and a one (0 for none).
+   The root is record 0. `save_tree()` writes the nodes in preorder.
+
+ - if the `flag_pruned` flag is set, the `pruned_log_probability` of each node, as 8-byte floats.
+
+The header is little-endian, while the node records are in the byte order of the machine that wrote them.
+
+The node records have the layout of `ctw_mmap_context_tree.CTWMmapContextTree`'s node file, which is a
+tree file with room for more records, so a saved tree can also be opened by that class without reading it.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import struct
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_array_context_tree, ctw_beta_context_tree, ctw_context_tree
+from pyaixi.prediction import ctw_hashed_context_tree, ctw_suffix_context_tree, ctw_symbol_context_tree
+from pyaixi.prediction.ctw_array_context_tree import child_typecode, count_typecode, log_typecode, no_child
+
+# The header at the start of a tree file (see above).
+header_format = struct.Struct(str('<8sQQQQqQQ'))
+file_magic = b'CTWTREE\0'
+file_version = 1
+
+# The flag set when the file holds the log probabilities of pruned subtrees.
+flag_pruned = 1
+
+# Each node is a record of six 8-byte fields (see above). Records are in the byte order of the machine,
+# so that they can be viewed in place.
+record_format = struct.Struct(str('=QQddqq'))
+record_fields = 6
+record_size = record_format.size
+
+def header_size(depth):
+	""" Returns the size of the header and history of a tree file for a tree of the given depth.
+	"""
+
+	return header_format.size + ((((depth + 7) >> 3) + 7) & ~7)
+# end def
+
+def pack_history(history, depth):
+	""" Returns the last `depth` symbols of the given history packed eight to a byte, and their number.
+	"""
+
+	symbols = history[max(0, len(history) - depth):]
+	packed = bytearray((len(symbols) + 7) >> 3)
+	for index, symbol in enumerate(symbols):
+		packed[index >> 3] |= symbol << (index & 7)
+	# end for
+	return (bytes(packed), len(symbols))
+# end def
+
+def read_header(data):
+	""" Returns the depth, number of node records, tree size, first released record, packed history symbols
+		and flags from the given header of a tree file, as a tuple.
+
+		- `data`: the first `header_size(depth)` bytes of the file, or more.
+	"""
+
+	assert len(data) >= header_format.size, "The tree file is too short to have a header."
+	magic, version, depth, node_count, tree_size, free_head, history_length, flags = \
+		header_format.unpack(bytes(data[0:header_format.size]))
+	assert magic == file_magic, "The file isn't a context tree file."
+	assert version == file_version, "The tree file's version (%d) isn't supported." % version
+
+	packed = bytearray(data[header_format.size:header_format.size + ((history_length + 7) >> 3)])
+	history = [(packed[index >> 3] >> (index & 7)) & 1 for index in xrange(0, history_length)]
+	return (depth, node_count, tree_size, free_head, history, flags)
+# end def
+
+def write_header(buffer, depth, node_count, tree_size, free_head, history, flags = 0):
+	""" Writes the header of a tree file, with the end of the given history, to the start of the given buffer.
+	"""
+
+	packed, history_length = pack_history(history, depth)
+	buffer[0:header_format.size] = header_format.pack(file_magic, file_version, depth, node_count, tree_size,
+	                                                  free_head, history_length, flags)
+	buffer[header_format.size:header_format.size + len(packed)] = packed
+# end def
+
+def load_tree(path, tree_class = ctw_context_tree.CTWContextTree, **arguments):
+	""" Returns a context tree of the given class loaded from the tree file at the given path.
+
+		The file is read with a single read, and the node records are unpacked from strided views of it.
+
+		- `path`: the path of the tree file.
+		- `tree_class`: the context tree class to load the tree into: `CTWContextTree`,
+		  `CTWSuffixContextTree` or `CTWArrayContextTree`. (A `CTWMmapContextTree` can map a tree file
+		  without loading it, see its `copy_on_write` argument.)
+		- `arguments`: any further arguments to create the tree with, after its depth,
+		  e.g. `precision` for a `CTWArrayContextTree`.
+	"""
+
+	with open(path, 'rb') as tree_file:
+		data = tree_file.read()
+	# end with
+
+	depth, node_count, tree_size, free_head, history, flags = read_header(data)
+	offset = header_size(depth)
+	assert len(data) >= offset + node_count * (record_size + (8 if flags & flag_pruned else 0)), \
+		"The tree file is too short for its %d nodes." % node_count
+
+	records = memoryview(data)[offset:offset + node_count * record_size]
+	counts = records.cast(count_typecode)
+	logs = records.cast(log_typecode)
+	children = records.cast(child_typecode)
+
+	tree = tree_class(depth, **arguments)
+	if issubclass(tree_class, ctw_array_context_tree.CTWArrayContextTree):
+		assert not flags & flag_pruned, "An array-backed context tree can't hold a pruned tree."
+
+		tree.symbol_count = [array.array(tree.count_typecode, counts[field::record_fields])
+		                     for field in (0, 1)]
+		tree.log_kt = array.array(tree.log_typecode, logs[2::record_fields])
+		tree.log_probability = array.array(tree.log_typecode, logs[3::record_fields])
+		tree.child = [array.array(tree.child_typecode, children[field::record_fields])
+		              for field in (4, 5)]
+
+		# Follow the chain of released records through their zero child.
+		tree.free_nodes = []
+		index = free_head
+		while index != -1:
+			tree.free_nodes.append(index)
+			index = tree.child[0][index]
+		# end while
+		tree.free_nodes.reverse()
+		tree.tree_size = node_count - len(tree.free_nodes)
+	else:
+		assert not issubclass(tree_class, (ctw_beta_context_tree.CTWBetaContextTree,
+		                                   ctw_hashed_context_tree.CTWHashedContextTree,
+		                                   ctw_symbol_context_tree.CTWSymbolContextTree)), \
+			"A %s can't be loaded from a tree file." % tree_class.__name__
+
+		if flags & flag_pruned:
+			pruned = memoryview(data)[offset + node_count * record_size:
+			                          offset + node_count * (record_size + 8)].cast(log_typecode)
+		# end if
+
+		# Create the node of each record reachable from the root, and link it to its parent.
+		counts_0, counts_1 = counts[0::record_fields], counts[1::record_fields]
+		log_kt, log_probability = logs[2::record_fields], logs[3::record_fields]
+		child = (children[4::record_fields], children[5::record_fields])
+		stack = [(tree.root, 0)]
+		size = 0
+		while len(stack) > 0:
+			node, index = stack.pop()
+			node.symbol_count[0] = counts_0[index]
+			node.symbol_count[1] = counts_1[index]
+			node.log_kt = log_kt[index]
+			node.log_probability = log_probability[index]
+			if flags & flag_pruned:
+				node.pruned_log_probability = pruned[index]
+			# end if
+			size += 1
+
+			for symbol in (0, 1):
+				child_index = child[symbol][index]
+				if child_index != no_child:
+					node.children[symbol] = tree.create_node()
+					stack.append((node.children[symbol], child_index))
+				# end if
+			# end for
+		# end while
+
+		# Nodes without visits are ghosts left by reverts with deferred pruning (see `CTWContextTree.compact()`).
+		tree.tree_size = min(tree_size, size)
+		tree.ghost_nodes = size - tree.tree_size
+		tree.ghost_parents = None if tree.ghost_nodes > 0 else []
+
+		if isinstance(tree, ctw_suffix_context_tree.CTWSuffixContextTree):
+			tree.update_nodes()
+		# end if
+	# end if
+
+	tree.update_history(history)
+	return tree
+# end def
+
+def save_tree(tree, path):
+	""" Saves the given context tree to a tree file at the given path.
+
+		The nodes are packed into a buffer in preorder, which is written with a single write.
+		The tree can't be saved while there is a checkpoint.
+
+		- `tree`: a `CTWContextTree`, `CTWSuffixContextTree`, `CTWArrayContextTree` or `CTWMmapContextTree`.
+		- `path`: the path of the tree file to write.
+	"""
+
+	assert not isinstance(tree, (ctw_beta_context_tree.CTWBetaContextTree,
+	                             ctw_hashed_context_tree.CTWHashedContextTree,
+	                             ctw_symbol_context_tree.CTWSymbolContextTree)), \
+		"A %s can't be saved to a tree file." % type(tree).__name__
+	assert tree.journal is None, "The tree can't be saved while there is a checkpoint."
+
+	array_backed = isinstance(tree, ctw_array_context_tree.CTWArrayContextTree)
+
+	# List the nodes in preorder, with the position of each node's parent and the symbol leading to it.
+	nodes = []
+	stack = [(0 if array_backed else tree.root, -1, 0)]
+	while len(stack) > 0:
+		node, parent, symbol = stack.pop()
+		nodes.append((node, parent, symbol))
+		position = len(nodes) - 1
+		for child_symbol in (1, 0):
+			if array_backed:
+				child = tree.child[child_symbol][node]
+				if child != no_child:
+					stack.append((child, position, child_symbol))
+				# end if
+			elif child_symbol in node.children:
+				stack.append((node.children[child_symbol], position, child_symbol))
+			# end if
+		# end for
+	# end while
+	node_count = len(nodes)
+
+	# The ids of each node's children, in preorder.
+	child = ([no_child] * node_count, [no_child] * node_count)
+	for position, (node, parent, symbol) in enumerate(nodes):
+		if parent >= 0:
+			child[symbol][parent] = position
+		# end if
+	# end for
+
+	pruned = not array_backed and any([node.pruned_log_probability != 0.0 for node, parent, symbol in nodes])
+	offset = header_size(tree.depth)
+	buffer = bytearray(offset + node_count * (record_size + (8 if pruned else 0)))
+	write_header(buffer, tree.depth, node_count, tree.tree_size, -1, tree.history, flag_pruned if pruned else 0)
+
+	for position, (node, parent, symbol) in enumerate(nodes):
+		if array_backed:
+			statistics = (tree.symbol_count[0][node], tree.symbol_count[1][node], tree.log_kt[node],
+			              tree.log_probability[node])
+		else:
+			statistics = (node.symbol_count[0], node.symbol_count[1], node.log_kt, node.log_probability)
+		# end if
+		record_format.pack_into(buffer, offset + position * record_size,
+		                        *(statistics + (child[0][position], child[1][position])))
+	# end for
+
+	if pruned:
+		pruned_offset = offset + node_count * record_size
+		struct.pack_into(str('=%dd' % node_count), buffer, pruned_offset,
+		                 *[node.pruned_log_probability for node, parent, symbol in nodes])
+	# end if
+
+	with open(path, 'wb') as tree_file:
+		tree_file.write(buffer)
+	# end with
+# end def
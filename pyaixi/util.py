@@ -43,21 +43,21 @@ def decode(symbol_list, bit_count):
         Each symbol is a bit in the binary representation of the value, with more significant
         bits at the end of the list.
 
-        - `symbol_list` - the list of symbols to decode from.
+        - `symbol_list` - the list (or other sequence, such as a `BitPackedHistory`) of symbols to decode from.
         - `bit_count` - the number of bits from the end of the symbol list to decode.
     """
     assert bit_count > 0, "The given number of bits (%d) is invalid." % bit_count
     assert bit_count <= len(symbol_list), "The given number of bits (%d) is greater than the length of the symbol list. (%d)" % (bit_count, len(symbol_list))
 
-    # Take the last `bit_count` number of symbols from the end of the given symbol list.
-    bits = symbol_list[-bit_count:]
-
-    # Reverse the list of bits, and make a string out of them.
-    bits.reverse()
-    bit_string = ''.join(map(str, bits))
+    # Shift in the last `bit_count` symbols, starting from the most significant one at the end of the list.
+    # This indexes the sequence directly, rather than copying, reversing and parsing a slice of it.
+    value = 0
+    length = len(symbol_list)
+    for i in xrange(length - 1, length - 1 - bit_count, -1):
+        value = (value << 1) | symbol_list[i]
+    # end for
 
-    # Return the bit string as an integer via the built-in int command, telling it that the number in the string is binary/base 2.
-    return int(bit_string, 2)
+    return value
 # end def
 
 def encode(integer_symbol, bit_count):
@@ -0,0 +1 @@
+__all__ = ["test_ctw_adaptive_depth", "test_ctw_beta_context_tree", "test_ctw_checkpoint", "test_ctw_factored_context_tree", "test_ctw_frozen_context_tree", "test_ctw_hashed_context_tree", "test_ctw_history", "test_ctw_kt_table", "test_ctw_mmap_context_tree", "test_ctw_node_budget", "test_ctw_overlay", "test_ctw_precision", "test_ctw_prediction_cache", "test_ctw_stream", "test_ctw_suffix_context_tree", "test_ctw_symbol_context_tree", "test_ctw_tree_file", "util"]
\ No newline at end of file
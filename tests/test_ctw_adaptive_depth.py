@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that reverting updates restores a context tree with an adaptive depth.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree
+
+from tests.util import random_symbols, tree_states
+
+# The difference allowed between log probabilities calculated in different orders.
+tolerance = 1e-9
+
+class AdaptiveDepthTest(unittest.TestCase):
+	""" Reverting an update must undo any extension of the contexts it made, leaving the nodes, their counts
+		and the log probabilities kept for their first symbols as they were before the update.
+	"""
+
+	def assert_same_states(self, states, expected_states):
+		""" Checks that the given node states have the same counts and the same extended contexts exactly,
+			and the same log probabilities within the tolerance.
+		"""
+
+		self.assertEqual(len(states), len(expected_states))
+		for state, expected_state in zip(states, expected_states):
+			self.assertEqual(state[0:2], expected_state[0:2])
+			self.assertEqual(state[-1] == 0.0, expected_state[-1] == 0.0)
+			for value, expected_value in zip(state[2:], expected_state[2:]):
+				self.assertAlmostEqual(value, expected_value, delta = tolerance)
+			# end for
+		# end for
+	# end def
+
+	def test_revert(self):
+		""" Updates and reverts of a trained tree, for several thresholds.
+		"""
+
+		for threshold in (1, 4, ctw_context_tree.adaptive_depth_threshold):
+			random.seed(1)
+			tree = ctw_context_tree.CTWContextTree(12)
+			tree.set_adaptive_depth(threshold)
+			tree.update(random_symbols(300))
+			states = tree_states(tree)
+			history = list(tree.history)
+			size = tree.size()
+
+			for i in xrange(0, 50):
+				count = random.randint(1, 40)
+				tree.update(random_symbols(count))
+				tree.revert(count)
+
+				self.assert_same_states(tree_states(tree), states)
+				self.assertEqual(list(tree.history), history)
+				self.assertEqual(tree.size(), size)
+			# end for
+		# end for
+	# end def
+
+	def test_revert_extension(self):
+		""" Reverting the update that makes a context's children usable removes them again.
+		"""
+
+		tree = ctw_context_tree.CTWContextTree(12)
+		tree.set_adaptive_depth(4)
+		tree.update_history([0] * 12)
+		tree.update([0] * 4)
+		states = tree_states(tree)
+		size = tree.size()
+
+		# The context has seen four symbols, so the next one extends it.
+		tree.update([0])
+		self.assertTrue(tree.size() > size)
+		self.assertNotEqual(tree.query_pruned_log_probability(tree.query_root()), 0.0)
+
+		tree.revert(1)
+		self.assert_same_states(tree_states(tree), states)
+		self.assertEqual(tree.size(), size)
+		self.assertEqual(tree.query_pruned_log_probability(tree.query_root()), 0.0)
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
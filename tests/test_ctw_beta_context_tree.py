@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check the ratio-based context tree against the log-domain context tree.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_beta_context_tree, ctw_context_tree
+
+# The relative difference allowed between the predictions of the two engines.
+tolerance = 1e-9
+
+def beta_nodes(tree):
+	""" Returns the (zero count, one count, ratio, ratio exponent) of every node of a ratio-based tree,
+		in preorder.
+	"""
+
+	states = []
+	stack = [tree.root]
+	while len(stack) > 0:
+		node = stack.pop()
+		states.append((node.symbol_count[0], node.symbol_count[1], node.beta, node.beta_exponent))
+		stack.extend([node.children[symbol] for symbol in (1, 0) if symbol in node.children])
+	# end while
+
+	return states
+# end def
+
+class CTWBetaContextTreeTest(unittest.TestCase):
+	""" The ratio-based engine must give the predictions of the log-domain engine, to within `tolerance`.
+	"""
+
+	def assert_same_predictions(self, beta_tree, log_tree):
+		""" Checks that both trees give the same probabilities to every sequence of up to three symbols.
+		"""
+
+		for symbol_list in ([0], [1], [0, 1], [1, 1], [1, 0, 1]):
+			expected = log_tree.predict(symbol_list)
+			self.assertAlmostEqual(beta_tree.predict(symbol_list) / expected, 1.0, delta = tolerance)
+		# end for
+		self.assertAlmostEqual(beta_tree.log_probability, log_tree.root.log_probability,
+		                       delta = tolerance * max(1.0, abs(log_tree.root.log_probability)))
+	# end def
+
+	def assert_same_ratios(self, states, expected_states):
+		""" Checks that two lists of node states returned by `beta_nodes()` match, to within `tolerance`.
+		"""
+
+		self.assertEqual(len(states), len(expected_states))
+		for (a, b, beta, exponent), (expected_a, expected_b, expected_beta, expected_exponent) in \
+		    zip(states, expected_states):
+			self.assertEqual((a, b, exponent), (expected_a, expected_b, expected_exponent))
+			self.assertAlmostEqual(beta / expected_beta, 1.0, delta = tolerance)
+		# end for
+	# end def
+
+	def test_update(self):
+		""" Updates with a random sequence give the same predictions.
+		"""
+
+		random.seed(1)
+		beta_tree = ctw_beta_context_tree.CTWBetaContextTree(6)
+		log_tree = ctw_context_tree.CTWContextTree(6)
+		for i in xrange(0, 20):
+			symbol_list = [1 if random.random() < 0.7 else 0 for j in xrange(0, 50)]
+			beta_tree.update(symbol_list)
+			log_tree.update(symbol_list)
+			self.assert_same_predictions(beta_tree, log_tree)
+		# end for
+		self.assertEqual(beta_tree.size(), log_tree.size())
+	# end def
+
+	def test_revert(self):
+		""" Reverting updates gives the same predictions, and restores the ratios.
+		"""
+
+		random.seed(2)
+		beta_tree = ctw_beta_context_tree.CTWBetaContextTree(5)
+		log_tree = ctw_context_tree.CTWContextTree(5)
+		symbol_list = [random.randint(0, 1) for i in xrange(0, 300)]
+		beta_tree.update(symbol_list)
+		log_tree.update(symbol_list)
+		states = beta_nodes(beta_tree)
+
+		for count in (1, 7, 40):
+			symbol_list = [random.randint(0, 1) for i in xrange(0, count)]
+			beta_tree.update(symbol_list)
+			log_tree.update(symbol_list)
+			beta_tree.revert(count)
+			log_tree.revert(count)
+			self.assert_same_predictions(beta_tree, log_tree)
+			self.assert_same_ratios(beta_nodes(beta_tree), states)
+		# end for
+		self.assertEqual(beta_tree.size(), log_tree.size())
+	# end def
+
+	def test_generate_random_symbols(self):
+		""" Sampling gives the same symbols, and leaves the same predictions.
+		"""
+
+		beta_tree = ctw_beta_context_tree.CTWBetaContextTree(4)
+		log_tree = ctw_context_tree.CTWContextTree(4)
+		random.seed(3)
+		symbol_list = [random.randint(0, 1) for i in xrange(0, 200)]
+		beta_tree.update(symbol_list)
+		log_tree.update(symbol_list)
+
+		random.seed(4)
+		beta_symbols = beta_tree.generate_random_symbols_and_update(100)
+		random.seed(4)
+		log_symbols = log_tree.generate_random_symbols_and_update(100)
+		self.assertEqual(beta_symbols, log_symbols)
+		self.assert_same_predictions(beta_tree, log_tree)
+	# end def
+
+	def test_clamped_ratio(self):
+		""" An alternating sequence drives the root's ratio far below `beta_minimum`, as the children predict
+			it almost perfectly. Predictions still match, and reverting the updates restores the ratios exactly.
+		"""
+
+		beta_tree = ctw_beta_context_tree.CTWBetaContextTree(1)
+		log_tree = ctw_context_tree.CTWContextTree(1)
+		beta_tree.update([0, 1])
+		log_tree.update([0, 1])
+		states = beta_nodes(beta_tree)
+
+		symbol_list = [i % 2 for i in xrange(0, 600)]
+		beta_tree.update(symbol_list)
+		log_tree.update(symbol_list)
+		self.assertTrue(beta_tree.root.beta_exponent < 0)
+		self.assertTrue(ctw_beta_context_tree.beta_minimum <= beta_tree.root.beta <= ctw_beta_context_tree.beta_maximum)
+		self.assert_same_predictions(beta_tree, log_tree)
+
+		beta_tree.revert(len(symbol_list))
+		log_tree.revert(len(symbol_list))
+		self.assertEqual(beta_tree.root.beta_exponent, 0)
+		self.assert_same_ratios(beta_nodes(beta_tree), states)
+		self.assert_same_predictions(beta_tree, log_tree)
+	# end def
+
+	def test_scale_ratio(self):
+		""" Scaling keeps the ratio, and only uses the exponent outside the clamped range.
+		"""
+
+		for beta in (1.0, 3.5, 2.0 ** 64, 2.0 ** 65, 2.0 ** 300, 2.0 ** -64, 2.0 ** -65, 7.0 * 2.0 ** -500):
+			scaled, exponent = ctw_beta_context_tree.scale_ratio(beta, 0)
+			self.assertEqual(scaled * 2.0 ** exponent, beta)
+			self.assertEqual(exponent == 0, 2.0 ** -64 <= beta <= 2.0 ** 64)
+		# end for
+
+		# A ratio moved back into range loses its exponent.
+		self.assertEqual(ctw_beta_context_tree.scale_ratio(0.5, 64), (2.0 ** 63, 0))
+		self.assertEqual(ctw_beta_context_tree.scale_ratio(2.0, -64), (2.0 ** -63, 0))
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that rolling back to a checkpoint restores each kind of context tree exactly.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_array_context_tree, ctw_beta_context_tree, ctw_context_tree
+from pyaixi.prediction import ctw_hashed_context_tree, ctw_mmap_context_tree, ctw_suffix_context_tree
+
+from tests.util import random_symbols, tree_states
+
+def tree_state(tree):
+	""" Returns the size, history and node states of the given tree. (See `tests.util.tree_states()`.)
+	"""
+
+	return (tree.size(), list(tree.history), tree_states(tree))
+# end def
+
+class CheckpointTest(unittest.TestCase):
+	""" Rolling back must restore the nodes, the history and the size exactly, not just closely,
+		for every tree class, through nested checkpoints.
+	"""
+
+	def check_rollback(self, tree):
+		""" Updates, reverts and rolls back the given tree under nested checkpoints, checking that each
+			rollback restores the state at its checkpoint, and that released checkpoints leave the tree usable.
+		"""
+
+		random.seed(1)
+		tree.update(random_symbols(500))
+		outer_state = tree_state(tree)
+		outer_token = tree.checkpoint()
+
+		for search in xrange(0, 20):
+			count = random.randint(1, 30)
+			tree.update(random_symbols(count))
+			tree.revert(random.randint(0, count))
+			inner_state = tree_state(tree)
+			inner_token = tree.checkpoint()
+
+			for simulation in xrange(0, 5):
+				count = random.randint(1, 30)
+				tree.update(random_symbols(count))
+				tree.revert(random.randint(0, count))
+				tree.update_history(random_symbols(random.randint(0, 3)))
+				tree.rollback(inner_token)
+				self.assertEqual(tree_state(tree), inner_state)
+			# end for
+
+			tree.release_checkpoint(inner_token)
+			tree.rollback(outer_token)
+			self.assertEqual(tree_state(tree), outer_state)
+		# end for
+		tree.release_checkpoint(outer_token)
+
+		# Continue with the symbols `test_continued_updates()` gives a tree that was never rolled back.
+		random.seed(2)
+		tree.update(random_symbols(100))
+		return tree_state(tree)
+	# end def
+
+	def test_context_tree(self):
+		""" The pointer-linked tree.
+		"""
+
+		self.check_rollback(ctw_context_tree.CTWContextTree(8))
+	# end def
+
+	def test_suffix_context_tree(self):
+		""" The suffix-addressed tree.
+		"""
+
+		self.check_rollback(ctw_suffix_context_tree.CTWSuffixContextTree(8))
+	# end def
+
+	def test_array_context_tree(self):
+		""" The array-backed tree, which recycles the slots of nodes created since the checkpoint.
+		"""
+
+		for precision in ('single', 'double'):
+			self.check_rollback(ctw_array_context_tree.CTWArrayContextTree(8, precision))
+		# end for
+	# end def
+
+	def test_mmap_context_tree(self):
+		""" The memory-mapped tree, which grows its file as it goes.
+		"""
+
+		tree = ctw_mmap_context_tree.CTWMmapContextTree(8)
+		try:
+			self.check_rollback(tree)
+		finally:
+			tree.close()
+		# end try
+	# end def
+
+	def test_beta_context_tree(self):
+		""" The ratio-based tree, with the exponents of its scaled ratios.
+		"""
+
+		self.check_rollback(ctw_beta_context_tree.CTWBetaContextTree(8))
+	# end def
+
+	def test_hashed_context_tree(self):
+		""" The hashed tree, in a table small enough to evict nodes during the searches.
+		"""
+
+		for collision_policy in ('replace', 'share'):
+			tree = ctw_hashed_context_tree.CTWHashedContextTree(8, 8 * 1024, collision_policy)
+			self.check_rollback(tree)
+		# end for
+	# end def
+
+	def test_nested_before_journal(self):
+		""" Releasing a checkpoint taken inside another before anything was journaled keeps the outer one.
+		"""
+
+		for tree in (ctw_context_tree.CTWContextTree(8), ctw_beta_context_tree.CTWBetaContextTree(8)):
+			random.seed(3)
+			tree.update(random_symbols(100))
+			state = tree_state(tree)
+			outer_token = tree.checkpoint()
+			inner_token = tree.checkpoint()
+			tree.update(random_symbols(10))
+			tree.rollback(inner_token)
+			tree.release_checkpoint(inner_token)
+
+			tree.update(random_symbols(10))
+			tree.rollback(outer_token)
+			tree.release_checkpoint(outer_token)
+			self.assertEqual(tree_state(tree), state)
+			self.assertEqual(tree.journal, None)
+
+			# Releasing the first checkpoint ends those nested in it, even if they weren't released.
+			outer_token = tree.checkpoint()
+			tree.checkpoint()
+			tree.update(random_symbols(10))
+			tree.release_checkpoint(outer_token)
+			self.assertEqual(tree.journal, None)
+		# end for
+	# end def
+
+	def test_continued_updates(self):
+		""" After the searches are rolled back, a tree gives the same states as one that only saw the real updates.
+		"""
+
+		tree = ctw_context_tree.CTWContextTree(8)
+		state = self.check_rollback(tree)
+
+		expected_tree = ctw_context_tree.CTWContextTree(8)
+		random.seed(1)
+		expected_tree.update(random_symbols(500))
+		random.seed(2)
+		expected_tree.update(random_symbols(100))
+
+		self.assertEqual(state, tree_state(expected_tree))
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that a factored context tree model predicts percepts as the product of its per-bit trees.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi import util
+from pyaixi.prediction import ctw_context_tree, ctw_factored_context_tree
+
+from tests.util import random_symbols, tree_states
+
+# The difference allowed between probabilities calculated in different orders.
+tolerance = 1e-12
+
+# The number of bits of the actions and the percepts the models are given.
+action_bits = 2
+percept_bits = 3
+
+class FactoredContextTreeTest(unittest.TestCase):
+	""" The probability of a percept must be the product of the probabilities of its bits given by the trees
+		of their positions, and every tree must keep the same history through reverts and rollbacks.
+	"""
+
+	def assert_in_step(self, model, expected_history, position):
+		""" Checks that every tree of the model has the given history, and the model is at the given position.
+		"""
+
+		for tree in model.trees:
+			self.assertEqual(list(tree.history), expected_history)
+		# end for
+		self.assertEqual(model.history_size(), len(expected_history))
+		self.assertEqual(model.position, position)
+	# end def
+
+	def test_percept_probability(self):
+		""" The model predicts each percept as separate trees updated with the bits of their positions do.
+		"""
+
+		random.seed(1)
+		model = ctw_factored_context_tree.CTWFactoredContextTree(6, percept_bits)
+		trees = [ctw_context_tree.CTWContextTree(6) for i in xrange(0, percept_bits)]
+		for cycle in xrange(0, 100):
+			action = random_symbols(action_bits)
+			model.update_history(action)
+			for tree in trees:
+				tree.update_history(action)
+			# end for
+
+			distribution = model.predict_distribution(percept_bits)
+			self.assertAlmostEqual(sum(distribution), 1.0, delta = tolerance)
+			for percept_value in xrange(0, 1 << percept_bits):
+				percept = util.encode(percept_value, percept_bits)
+
+				# The product of the probability of each bit given by the tree of its position, after the earlier bits.
+				expected_probability = 1.0
+				for position, symbol in enumerate(percept):
+					expected_probability *= trees[position].predict([symbol])
+					for tree in trees:
+						tree.update_history([symbol])
+					# end for
+				# end for
+				for tree in trees:
+					tree.revert_history(percept_bits)
+				# end for
+
+				self.assertAlmostEqual(model.predict(percept), expected_probability, delta = tolerance)
+				self.assertAlmostEqual(distribution[percept_value], expected_probability, delta = tolerance)
+			# end for
+
+			percept = random_symbols(percept_bits)
+			model.update(percept)
+			for position, symbol in enumerate(percept):
+				for other_position, tree in enumerate(trees):
+					if other_position == position:
+						tree.update([symbol])
+					else:
+						tree.update_history([symbol])
+					# end if
+				# end for
+			# end for
+		# end for
+
+		for tree, expected_tree in zip(model.trees, trees):
+			self.assertEqual(tree_states(tree), tree_states(expected_tree))
+		# end for
+	# end def
+
+	def test_history_in_step(self):
+		""" Searches that update, sample, revert and roll back the model keep the histories of the trees the same,
+			and rollbacks restore each tree exactly.
+		"""
+
+		random.seed(2)
+		model = ctw_factored_context_tree.CTWFactoredContextTree(6, percept_bits)
+		expected_history = []
+		for cycle in xrange(0, 50):
+			action = random_symbols(action_bits)
+			percept = random_symbols(percept_bits)
+			model.update_history(action)
+			model.update(percept)
+			expected_history += action + percept
+		# end for
+		self.assert_in_step(model, expected_history, 0)
+
+		for search in xrange(0, 20):
+			states = [tree_states(tree) for tree in model.trees]
+			token = model.checkpoint()
+			for simulation in xrange(0, 3):
+				model.update_history(random_symbols(action_bits))
+				model.generate_random_symbols_and_update(percept_bits, single_draw = simulation % 2 == 0)
+				model.update_history(random_symbols(action_bits))
+				model.update(random_symbols(random.randint(1, percept_bits)))
+				model.rollback(token)
+				self.assert_in_step(model, expected_history, 0)
+				self.assertEqual([tree_states(tree) for tree in model.trees], states)
+			# end for
+			model.release_checkpoint(token)
+
+			for simulation in xrange(0, 3):
+				model.update_history(random_symbols(action_bits))
+				count = random.randint(1, 2 * percept_bits)
+				model.update(random_symbols(count))
+				model.revert(count)
+				model.revert_history(action_bits)
+				self.assert_in_step(model, expected_history, 0)
+			# end for
+
+			# A percept part way through, reverted bit by bit.
+			model.update(random_symbols(2))
+			self.assertEqual(model.position, 2)
+			self.assertEqual(len(model.generate_random_symbols(percept_bits)), percept_bits)
+			self.assertEqual(model.position, 2)
+			model.revert(1)
+			model.revert(1)
+			self.assert_in_step(model, expected_history, 0)
+		# end for
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that a frozen context tree predicts as the tree it was compiled from would.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_beta_context_tree, ctw_context_tree, ctw_frozen_context_tree
+from pyaixi.prediction import ctw_hashed_context_tree
+
+from tests.util import random_symbols
+
+# The difference allowed between probabilities calculated in different orders.
+tolerance = 1e-9
+
+def trained_trees(learning):
+	""" Returns a frozen tree compiled from a trained tree, and another tree trained on the same symbols.
+	"""
+
+	random.seed(1)
+	tree = ctw_context_tree.CTWContextTree(8)
+	tree.update(random_symbols(1000))
+	expected_tree = ctw_context_tree.CTWContextTree(8)
+	expected_tree.update(list(tree.history))
+
+	return (ctw_frozen_context_tree.CTWFrozenContextTree(tree, learning), expected_tree)
+# end def
+
+class FrozenContextTreeTest(unittest.TestCase):
+	""" A learning frozen tree must predict as a tree given the same updates, and one that isn't learning
+		as a tree whose history is given the same symbols. Reverts and rollbacks must remove the deltas exactly.
+	"""
+
+	def expected_prediction(self, expected_tree, symbol_list, learning):
+		""" Returns the prediction of the given symbols a frozen tree should make, from the given tree
+			trained on the same symbols.
+		"""
+
+		if learning:
+			return expected_tree.predict(symbol_list)
+		# end if
+
+		# Later symbols are predicted after the earlier ones are added to the history, without learning from them.
+		probability = 1.0
+		for symbol in symbol_list:
+			probability *= expected_tree.predict([symbol])
+			expected_tree.update_history([symbol])
+		# end for
+		expected_tree.revert_history(len(symbol_list))
+		return probability
+	# end def
+
+	def assert_same_predictions(self, tree, expected_tree, learning):
+		""" Checks the predictions and the distribution of the frozen tree against those of the given tree.
+		"""
+
+		self.assertEqual(list(tree.history), list(expected_tree.history))
+		for symbol_list in ([0], [1], [1, 0, 1], [0, 0, 1, 1]):
+			self.assertAlmostEqual(tree.predict(symbol_list),
+			                       self.expected_prediction(expected_tree, symbol_list, learning), delta = tolerance)
+		# end for
+
+		distribution = tree.predict_distribution(3)
+		self.assertEqual(len(distribution), 8)
+		for i, probability in enumerate(distribution):
+			symbol_list = [(i >> (2 - j)) & 1 for j in xrange(0, 3)]
+			self.assertAlmostEqual(probability, tree.predict(symbol_list), delta = tolerance)
+			self.assertAlmostEqual(probability, self.expected_prediction(expected_tree, symbol_list, learning),
+			                       delta = tolerance)
+		# end for
+	# end def
+
+	def check_searches(self, learning):
+		""" Runs searches like the agent's on a frozen tree and on a tree trained on the same symbols, that learns
+			from the simulations if `learning` is True, checking their predictions and the symbols they draw.
+		"""
+
+		tree, expected_tree = trained_trees(learning)
+		for search in xrange(0, 10):
+			self.assert_same_predictions(tree, expected_tree, learning)
+
+			changes = dict(tree.changes)
+			token = tree.checkpoint()
+			expected_token = expected_tree.checkpoint()
+			for simulation in xrange(0, 5):
+				symbol_list = random_symbols(random.randint(1, 4))
+				tree.update(symbol_list)
+				if learning:
+					expected_tree.update(symbol_list)
+				else:
+					expected_tree.update_history(symbol_list)
+				# end if
+
+				for i in xrange(0, random.randint(1, 6)):
+					uniform = random.random()
+					symbol, rescaled_uniform = tree.draw_and_update(uniform)
+					if learning:
+						expected_symbol, expected_uniform = expected_tree.draw_and_update(uniform)
+					else:
+						expected_symbol, expected_uniform = \
+							ctw_context_tree.draw_symbol(uniform, expected_tree.predict([1]))
+						expected_tree.update_history([expected_symbol])
+					# end if
+					self.assertEqual(symbol, expected_symbol)
+					self.assertAlmostEqual(rescaled_uniform, expected_uniform, delta = tolerance)
+				# end for
+				self.assert_same_predictions(tree, expected_tree, learning)
+				if learning:
+					self.assertEqual(tree.size(), expected_tree.size())
+				# end if
+
+				tree.rollback(token)
+				expected_tree.rollback(expected_token)
+			# end for
+			tree.release_checkpoint(token)
+			expected_tree.release_checkpoint(expected_token)
+			self.assertEqual(tree.changes, changes)
+			self.assertEqual(len(tree.changes) > 0, learning and search > 0)
+
+			# The real update, which the frozen tree keeps as deltas too.
+			symbol_list = random_symbols(random.randint(1, 10))
+			tree.update(symbol_list)
+			if learning:
+				expected_tree.update(symbol_list)
+			else:
+				expected_tree.update_history(symbol_list)
+			# end if
+		# end for
+		self.assert_same_predictions(tree, expected_tree, learning)
+	# end def
+
+	def test_learning(self):
+		""" A frozen tree keeping updates as deltas predicts as a tree that learns from them.
+		"""
+
+		self.check_searches(True)
+	# end def
+
+	def test_not_learning(self):
+		""" A frozen tree that doesn't learn predicts as a tree that only adds the symbols to its history,
+			taking its predictions from those it keeps.
+		"""
+
+		self.check_searches(False)
+	# end def
+
+	def test_revert(self):
+		""" Reverts and rollbacks restore the deltas, their journal and the history exactly.
+		"""
+
+		tree = trained_trees(True)[0]
+		tree.update(random_symbols(50))
+
+		def state():
+			""" Returns copies of the deltas, their journal and the history.
+			"""
+
+			return (dict(tree.changes), list(tree.delta_journal), list(tree.update_marks), list(tree.history))
+		# end def
+		initial_state = state()
+		self.assertTrue(len(tree.changes) > 0)
+
+		for count in (1, 5, 20):
+			tree.update(random_symbols(count))
+			tree.revert(count)
+			self.assertEqual(state(), initial_state)
+
+			token = tree.checkpoint()
+			tree.update(random_symbols(count))
+			for i in xrange(0, count):
+				tree.draw_and_update(random.random())
+			# end for
+			tree.revert(count)
+			tree.update_history(random_symbols(3))
+			tree.rollback(token)
+			tree.release_checkpoint(token)
+			self.assertEqual(state(), initial_state)
+		# end for
+	# end def
+
+	def test_unsupported_trees(self):
+		""" Trees that can't be compiled are refused.
+		"""
+
+		frozen_tree = ctw_frozen_context_tree.CTWFrozenContextTree
+		self.assertRaises(AssertionError, frozen_tree, ctw_beta_context_tree.CTWBetaContextTree(8))
+		self.assertRaises(AssertionError, frozen_tree, ctw_hashed_context_tree.CTWHashedContextTree(8))
+
+		tree = ctw_context_tree.CTWContextTree(8)
+		tree.set_adaptive_depth(2)
+		self.assertRaises(AssertionError, frozen_tree, tree)
+
+		tree = ctw_context_tree.CTWContextTree(8)
+		tree.update(random_symbols(100))
+		token = tree.checkpoint()
+		self.assertRaises(AssertionError, frozen_tree, tree)
+		tree.release_checkpoint(token)
+		frozen_tree(tree)
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
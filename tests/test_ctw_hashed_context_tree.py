@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that the hashed context tree predicts as the object tree while its table has room.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree, ctw_hashed_context_tree
+
+from tests.util import random_symbols
+
+# The difference allowed between probabilities calculated in different orders.
+tolerance = 1e-9
+
+class HashedContextTreeTest(unittest.TestCase):
+	""" Without evictions, the hashed tree must give the predictions and the size of `CTWContextTree`.
+	"""
+
+	def test_no_evictions(self):
+		""" Updates, reverts and samples of deep trees, in a table with room for every context.
+		"""
+
+		for depth in (8, 32):
+			for collision_policy in ctw_hashed_context_tree.collision_policies:
+				random.seed(1)
+				tree = ctw_hashed_context_tree.CTWHashedContextTree(depth, 8 * 1024 * 1024, collision_policy)
+				expected_tree = ctw_context_tree.CTWContextTree(depth)
+				for i in xrange(0, 50):
+					symbol_list = random_symbols(random.randint(1, 100))
+					tree.update(symbol_list)
+					expected_tree.update(symbol_list)
+
+					count = random.randint(0, len(symbol_list))
+					tree.revert(count)
+					expected_tree.revert(count)
+
+					uniform = random.random()
+					symbol = tree.draw_and_update(uniform)[0]
+					self.assertEqual(symbol, expected_tree.draw_and_update(uniform)[0])
+
+					self.assertEqual(tree.size(), expected_tree.size())
+					self.assertEqual(list(tree.history), list(expected_tree.history))
+					for prediction in ([0], [1], [1, 0, 1, 1]):
+						self.assertAlmostEqual(tree.predict(prediction), expected_tree.predict(prediction),
+						                       delta = tolerance)
+					# end for
+				# end for
+
+				self.assertEqual(tree.evictions, 0)
+				self.assertEqual(tree.collided_lookups, 0)
+			# end for
+		# end for
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check the compact history stores against the list a context tree normally keeps its history in.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi import util
+from pyaixi.prediction import ctw_context_tree, ctw_history, ctw_suffix_context_tree
+
+from tests.util import random_symbols, tree_states
+
+class BitPackedHistoryTest(unittest.TestCase):
+	""" A bit-packed history must behave as a list of its symbols, and give trees the same predictions.
+	"""
+
+	def assert_same_history(self, history, expected_history):
+		""" Checks the length, symbols, slices and suffixes of a history against a list of its symbols.
+		"""
+
+		length = len(expected_history)
+		self.assertEqual(len(history), length)
+		self.assertEqual(list(history), expected_history)
+		self.assertEqual(history[:], expected_history)
+		if length > 0:
+			for index in (0, length // 2, length - 1, -1, -length):
+				self.assertEqual(history[index], expected_history[index])
+			# end for
+		# end if
+		for start, stop in ((0, 5), (3, 17), (length - 9, None), (-12, -2)):
+			self.assertEqual(history[start:stop], expected_history[start:stop])
+		# end for
+		self.assertEqual(history[1::3], expected_history[1::3])
+
+		for suffix_length in (0, 1, 7, 8, 16, 40):
+			expected_suffix = 0
+			for symbol in expected_history[max(0, length - suffix_length):]:
+				expected_suffix = (expected_suffix << 1) | symbol
+			# end for
+			self.assertEqual(history.suffix(suffix_length), expected_suffix)
+		# end for
+
+		if length >= 8:
+			self.assertEqual(util.decode(history, 8), util.decode(expected_history, 8))
+		# end if
+	# end def
+
+	def test_list_operations(self):
+		""" Random appends, extensions and truncations, some past the symbols kept in the tail.
+		"""
+
+		random.seed(1)
+		history = ctw_history.BitPackedHistory(16)
+		expected_history = []
+		for i in xrange(0, 300):
+			operation = random.randint(0, 3)
+			if operation == 0:
+				symbol = random.randint(0, 1)
+				history.append(symbol)
+				expected_history.append(symbol)
+			elif operation == 1:
+				symbol_list = random_symbols(random.randint(0, 40))
+				history.extend(symbol_list)
+				expected_history.extend(symbol_list)
+			elif operation == 2:
+				symbol_list = random_symbols(random.randint(0, 10))
+				history += symbol_list
+				expected_history += symbol_list
+			else:
+				length = random.randint(max(0, len(expected_history) - 50), len(expected_history))
+				del history[length:]
+				del expected_history[length:]
+			# end if
+			self.assert_same_history(history, expected_history)
+		# end for
+
+		copy = history + [1, 0, 1]
+		self.assert_same_history(copy, expected_history + [1, 0, 1])
+		self.assert_same_history(history, expected_history)
+
+		self.assertRaises(IndexError, lambda: history[len(expected_history)])
+	# end def
+
+	def test_trees(self):
+		""" Trees keeping their history bit-packed predict as those keeping it in a list,
+			through updates, reverts and rollbacks.
+		"""
+
+		for tree_class in (ctw_context_tree.CTWContextTree, ctw_suffix_context_tree.CTWSuffixContextTree):
+			random.seed(2)
+			tree = tree_class(8)
+			tree.set_history(ctw_history.BitPackedHistory(8))
+			expected_tree = tree_class(8)
+			for i in xrange(0, 30):
+				symbol_list = random_symbols(random.randint(1, 60))
+				tree.update(symbol_list)
+				expected_tree.update(symbol_list)
+
+				count = random.randint(0, len(symbol_list))
+				tree.revert(count)
+				expected_tree.revert(count)
+
+				token = tree.checkpoint()
+				tree.update(random_symbols(10))
+				tree.rollback(token)
+				tree.release_checkpoint(token)
+
+				self.assertEqual(list(tree.history), list(expected_tree.history))
+				for prediction in ([0], [1], [1, 1, 0]):
+					self.assertEqual(tree.predict(prediction), expected_tree.predict(prediction))
+				# end for
+			# end for
+			self.assertEqual(tree_states(tree), tree_states(expected_tree))
+		# end for
+	# end def
+# end class
+
+class CTWHistoryTest(unittest.TestCase):
+	""" A ring-buffer history must behave as a list of the symbols it keeps, or of all its symbols
+		if it has an archive, and give trees the same predictions.
+	"""
+
+	def setUp(self):
+		""" Makes a directory for the archives.
+		"""
+
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'history.bin')
+	# end def
+
+	def tearDown(self):
+		""" Removes the archives.
+		"""
+
+		shutil.rmtree(self.directory)
+	# end def
+
+	def assert_same_history(self, history, expected_history):
+		""" Checks the length and the symbols of a history against a list of its symbols, only
+			from the oldest symbol kept in the buffer on if the history has no archive.
+		"""
+
+		length = len(expected_history)
+		self.assertEqual(len(history), length)
+		self.assertTrue(length - history.start <= history.capacity)
+
+		start = 0 if history.archive is not None else history.start
+		self.assertEqual(history[start:], expected_history[start:])
+		for index in (start, (start + length) // 2, length - 1):
+			if start <= index < length:
+				self.assertEqual(history[index], expected_history[index])
+				self.assertEqual(history[index - length], expected_history[index])
+			# end if
+		# end for
+
+		if history.archive is not None:
+			self.assertEqual(list(history), expected_history)
+		elif start > 0:
+			self.assertRaises(IndexError, lambda: history[start - 1])
+			self.assertRaises(IndexError, lambda: history[-length])
+		# end if
+		self.assertRaises(IndexError, lambda: history[length])
+	# end def
+
+	def check_list_operations(self, history):
+		""" Random appends, extensions and truncations of the given history with a capacity of 16,
+			truncating only to the symbols kept unless it has an archive.
+		"""
+
+		random.seed(1)
+		expected_history = []
+		for i in xrange(0, 300):
+			operation = random.randint(0, 3)
+			if operation == 0:
+				symbol = random.randint(0, 1)
+				history.append(symbol)
+				expected_history.append(symbol)
+			elif operation == 1:
+				symbol_list = random_symbols(random.randint(0, 40))
+				history.extend(symbol_list)
+				expected_history.extend(symbol_list)
+			elif operation == 2:
+				symbol_list = random_symbols(random.randint(0, 10))
+				history += symbol_list
+				expected_history += symbol_list
+			else:
+				lowest_length = history.start if history.archive is None else max(0, len(expected_history) - 50)
+				length = random.randint(lowest_length, len(expected_history))
+				del history[length:]
+				del expected_history[length:]
+			# end if
+			self.assert_same_history(history, expected_history)
+		# end for
+
+		copy = history + [1, 0, 1]
+		self.assertEqual(copy[copy.start:], (expected_history + [1, 0, 1])[copy.start:])
+		self.assert_same_history(history, expected_history)
+		return expected_history
+	# end def
+
+	def test_list_operations(self):
+		""" Without an archive, the symbols pushed out of the buffer are lost, and can't be truncated to.
+		"""
+
+		history = ctw_history.CTWHistory(16)
+		expected_history = self.check_list_operations(history)
+		self.assertTrue(history.start > 0)
+
+		self.assertRaises(AssertionError, lambda: history.truncate(history.start - 1))
+		self.assert_same_history(history, expected_history)
+
+		# Truncating the whole history needs none of its symbols.
+		del history[0:]
+		self.assert_same_history(history, [])
+		history.extend([1, 0])
+		self.assert_same_history(history, [1, 0])
+	# end def
+
+	def test_archive(self):
+		""" With an archive, the symbols pushed out of the buffer are read back from it,
+			and truncating below the buffer reads the symbols left back into it.
+		"""
+
+		history = ctw_history.CTWHistory(16, self.path)
+		try:
+			expected_history = self.check_list_operations(history)
+			self.assertTrue(history.start > 0)
+
+			length = history.start - 1
+			del history[length:]
+			del expected_history[length:]
+			self.assertEqual(history.start, max(0, length - 16))
+			self.assert_same_history(history, expected_history)
+
+			symbol_list = random_symbols(40)
+			history.extend(symbol_list)
+			expected_history.extend(symbol_list)
+			self.assert_same_history(history, expected_history)
+		finally:
+			history.close()
+		# end try
+	# end def
+
+	def test_trees(self):
+		""" Trees keeping their history in a buffer with room for their depth and the symbols of a search
+			predict as those keeping it in a list, through updates, reverts and rollbacks.
+		"""
+
+		for tree_class in (ctw_context_tree.CTWContextTree, ctw_suffix_context_tree.CTWSuffixContextTree):
+			random.seed(2)
+			tree = tree_class(8)
+			tree.set_history(ctw_history.CTWHistory(8 + 60))
+			expected_tree = tree_class(8)
+			for i in xrange(0, 30):
+				symbol_list = random_symbols(random.randint(1, 60))
+				tree.update(symbol_list)
+				expected_tree.update(symbol_list)
+
+				count = random.randint(0, len(symbol_list))
+				tree.revert(count)
+				expected_tree.revert(count)
+
+				token = tree.checkpoint()
+				tree.update(random_symbols(60))
+				tree.rollback(token)
+				tree.release_checkpoint(token)
+
+				self.assertEqual(len(tree.history), len(expected_tree.history))
+				self.assertEqual(tree.history[-8:], expected_tree.history[-8:])
+				for prediction in ([0], [1], [1, 1, 0]):
+					self.assertEqual(tree.predict(prediction), expected_tree.predict(prediction))
+				# end for
+			# end for
+			self.assertEqual(tree_states(tree), tree_states(expected_tree))
+		# end for
+	# end def
+
+	def test_revert_past_buffer(self):
+		""" Reverting more symbols than the buffer keeps beyond the tree's depth needs symbols no longer kept,
+			which fails without an archive, and reads them back from the archive if there is one.
+		"""
+
+		random.seed(3)
+		symbol_list = random_symbols(200)
+		expected_tree = ctw_context_tree.CTWContextTree(8)
+		expected_tree.update(symbol_list)
+		expected_tree.update(random_symbols(100))
+
+		tree = ctw_context_tree.CTWContextTree(8)
+		tree.set_history(ctw_history.CTWHistory(16))
+		tree.update(symbol_list)
+		tree.update(expected_tree.history[200:])
+		self.assertRaises((AssertionError, IndexError), lambda: tree.revert(100))
+
+		tree = ctw_context_tree.CTWContextTree(8)
+		tree.set_history(ctw_history.CTWHistory(16, self.path))
+		try:
+			tree.update(symbol_list)
+			tree.update(expected_tree.history[200:])
+			tree.revert(100)
+			self.assertEqual(list(tree.history), symbol_list)
+
+			expected_tree.revert(100)
+			self.assertEqual(tree_states(tree), tree_states(expected_tree))
+			for prediction in ([0], [1], [1, 1, 0]):
+				self.assertEqual(tree.predict(prediction), expected_tree.predict(prediction))
+			# end for
+		finally:
+			tree.history.close()
+		# end try
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check the cached log KT multipliers against the multipliers calculated directly.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import math
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_array_context_tree, ctw_context_tree
+
+from tests.util import random_symbols, tree_states
+
+class LogKTTableTest(unittest.TestCase):
+	""" The table must give exactly the multipliers calculated without it, within and beyond its rows.
+	"""
+
+	def setUp(self):
+		""" Keeps the table limit, which each test may change.
+		"""
+
+		self.limit = ctw_context_tree.log_kt_table_limit
+	# end def
+
+	def tearDown(self):
+		""" Restores the table limit.
+		"""
+
+		ctw_context_tree.set_log_kt_table_limit(self.limit)
+	# end def
+
+	def test_multipliers(self):
+		""" Multipliers are the same in the table, past its last row and with it disabled.
+		"""
+
+		# Room for 100 rows.
+		ctw_context_tree.set_log_kt_table_limit(8 * 100 * 101 // 2)
+		self.assertEqual(ctw_context_tree.log_kt_table_maximum_rows, 100)
+
+		for a, b in ((0, 0), (3, 4), (63, 0), (64, 1), (0, 99), (150, 20)):
+			for symbol in (0, 1):
+				expected = math.log(((b if symbol else a) + 1 / 2) / (a + b + 1))
+				self.assertEqual(ctw_context_tree.log_kt_multiplier(a, b, symbol), expected)
+			# end for
+		# end for
+		self.assertTrue(len(ctw_context_tree.log_kt_table) <= 100)
+
+		ctw_context_tree.set_log_kt_table_limit(0)
+		self.assertEqual(len(ctw_context_tree.log_kt_table), 0)
+		self.assertEqual(ctw_context_tree.log_kt_multiplier(3, 4, 1), math.log((4 + 1 / 2) / 8))
+	# end def
+
+	def test_trees(self):
+		""" Trees updated and reverted with and without the table are identical.
+		"""
+
+		random.seed(1)
+		symbol_list = random_symbols(3000)
+		for tree_class in (ctw_context_tree.CTWContextTree, ctw_array_context_tree.CTWArrayContextTree):
+			states = []
+			for limit in (0, 1024, 16 * 1024 * 1024):
+				ctw_context_tree.set_log_kt_table_limit(limit)
+				tree = tree_class(8)
+				tree.update(symbol_list)
+				tree.revert(500)
+				states.append(tree_states(tree))
+			# end for
+
+			self.assertEqual(states[1], states[0])
+			self.assertEqual(states[2], states[0])
+		# end for
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that a context tree kept in a memory-mapped file predicts as the object tree, before and after reopening it.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree, ctw_mmap_context_tree
+
+from tests.util import random_symbols, tree_states
+
+class MmapContextTreeTest(unittest.TestCase):
+	""" A reopened node file must give the tree that was closed, which goes on learning as the object tree does.
+	"""
+
+	def setUp(self):
+		""" Makes a directory for the node file.
+		"""
+
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'nodes.ctw')
+	# end def
+
+	def tearDown(self):
+		""" Removes the node file.
+		"""
+
+		shutil.rmtree(self.directory)
+	# end def
+
+	def assert_same_tree(self, tree, expected_tree):
+		""" Checks that the given trees have the same nodes, the same end of the history and the same predictions.
+		"""
+
+		self.assertEqual(tree.size(), expected_tree.size())
+		self.assertEqual(list(tree.history)[-tree.depth:], list(expected_tree.history)[-tree.depth:])
+		self.assertEqual(tree_states(tree), tree_states(expected_tree))
+		for symbol_list in ([0], [1], [1, 0, 1]):
+			self.assertEqual(tree.predict(symbol_list), expected_tree.predict(symbol_list))
+		# end for
+	# end def
+
+	def test_reopen(self):
+		""" Updates and reverts, which release records, across several reopenings of the file.
+		"""
+
+		random.seed(1)
+		expected_tree = ctw_context_tree.CTWContextTree(12)
+		for session in xrange(0, 3):
+			tree = ctw_mmap_context_tree.CTWMmapContextTree(12, self.path)
+			try:
+				self.assert_same_tree(tree, expected_tree)
+				for i in xrange(0, 20):
+					symbol_list = random_symbols(random.randint(1, 200))
+					tree.update(symbol_list)
+					expected_tree.update(symbol_list)
+
+					count = random.randint(0, len(symbol_list))
+					tree.revert(count)
+					expected_tree.revert(count)
+				# end for
+				self.assert_same_tree(tree, expected_tree)
+			finally:
+				tree.close()
+			# end try
+		# end for
+
+		self.assertTrue(expected_tree.size() > ctw_mmap_context_tree.initial_capacity)
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
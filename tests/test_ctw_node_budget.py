@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that pruning a context tree to its node budget keeps its probabilities consistent.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree, ctw_suffix_context_tree
+
+from tests.util import random_symbols
+
+# The difference allowed between log probabilities summed in different orders.
+tolerance = 1e-9
+
+class NodeBudgetTest(unittest.TestCase):
+	""" A pruned tree must stay within its budget, with each node's weighted probability that of its
+		KT estimate, its children and its pruned children, and normalised predictions.
+	"""
+
+	def assert_consistent(self, tree):
+		""" Checks that every node's weighted log probability is the one recalculated from its statistics,
+			its children and the children pruned from it, and that the tree's size counts its nodes.
+		"""
+
+		node_count = 0
+		stack = [tree.root]
+		while len(stack) > 0:
+			node = stack.pop()
+			node_count += 1
+			stack.extend(node.children.values())
+
+			# The 'lru' policy relies on no node having been visited after its parent.
+			for child in node.children.values():
+				self.assertTrue(child.last_visit <= node.last_visit)
+			# end for
+
+			log_probability = node.log_probability
+			node.update_log_probability()
+			self.assertAlmostEqual(node.log_probability, log_probability, delta = tolerance)
+			if len(node.children) == 0 and node.pruned_log_probability == 0:
+				self.assertEqual(log_probability, node.log_kt)
+			# end if
+		# end while
+
+		self.assertEqual(node_count, tree.size() + tree.ghost_nodes)
+	# end def
+
+	def check_budget(self, policy):
+		""" Updates a tree kept to a node budget with the given policy, checking it after each update.
+		"""
+
+		random.seed(1)
+		tree = ctw_context_tree.CTWContextTree(12)
+		tree.set_node_budget(max_nodes = 300, policy = policy)
+		for i in xrange(0, 100):
+			tree.update(random_symbols(random.randint(1, 50)))
+			self.assertTrue(tree.size() <= 300)
+			self.assert_consistent(tree)
+			self.assertAlmostEqual(tree.predict([0]) + tree.predict([1]), 1.0, delta = tolerance)
+		# end for
+		self.assertTrue(tree.pruned_nodes > 0)
+
+		# Searches may exceed the budget, until their checkpoint is released.
+		token = tree.checkpoint()
+		tree.update(random_symbols(200))
+		self.assert_consistent(tree)
+		tree.rollback(token)
+		tree.release_checkpoint(token)
+		self.assertTrue(tree.size() <= 300)
+		self.assert_consistent(tree)
+	# end def
+
+	def check_search(self, tree, policy):
+		""" Runs searches like the agent's on a tree kept to a node budget with the given policy, each simulating
+			updates and samples under a checkpoint or with reverts, followed by a real update that prunes the tree.
+		"""
+
+		random.seed(2)
+		tree.set_node_budget(max_nodes = 200, policy = policy)
+		tree.update(random_symbols(500))
+		for search in xrange(0, 40):
+			if search % 2 == 0:
+				token = tree.checkpoint()
+				for simulation in xrange(0, 10):
+					tree.update(random_symbols(random.randint(1, 4)))
+					tree.generate_random_symbols_and_update(random.randint(1, 8))
+					tree.rollback(token)
+				# end for
+				tree.release_checkpoint(token)
+			else:
+				for simulation in xrange(0, 10):
+					count = random.randint(1, 12)
+					tree.update(random_symbols(count))
+					tree.revert(count)
+				# end for
+			# end if
+
+			tree.update(random_symbols(random.randint(1, 20)))
+			self.assertTrue(tree.size() <= 200)
+			self.assert_consistent(tree)
+			self.assertAlmostEqual(tree.predict([0]) + tree.predict([1]), 1.0, delta = tolerance)
+		# end for
+		self.assertTrue(tree.pruned_nodes > 0)
+	# end def
+
+	def test_search(self):
+		""" Searches that revert or roll back the tree between the updates that prune it.
+		"""
+
+		for policy in ctw_context_tree.pruning_policies:
+			self.check_search(ctw_context_tree.CTWContextTree(10), policy)
+			self.check_search(ctw_suffix_context_tree.CTWSuffixContextTree(10), policy)
+		# end for
+	# end def
+
+	def test_sampling(self):
+		""" Updates with sampled symbols keep to the budget, as other updates do.
+		"""
+
+		random.seed(3)
+		for policy in ctw_context_tree.pruning_policies:
+			tree = ctw_context_tree.CTWContextTree(12)
+			tree.set_node_budget(max_nodes = 200, policy = policy)
+			tree.update(random_symbols(100))
+			for i in xrange(0, 50):
+				tree.generate_random_symbols_and_update(random.randint(1, 30), single_draw = i % 2 == 0)
+				self.assertTrue(tree.size() <= 200)
+				self.assert_consistent(tree)
+			# end for
+			self.assertTrue(tree.pruned_nodes > 0)
+		# end for
+	# end def
+
+	def test_lru_policy(self):
+		""" Pruning the least recently seen contexts.
+		"""
+
+		self.check_budget('lru')
+	# end def
+
+	def test_visits_policy(self):
+		""" Pruning the contexts seen fewest times.
+		"""
+
+		self.check_budget('visits')
+	# end def
+
+	def test_prune(self):
+		""" Pruning keeps the probability of the history, and the tree then learns as before.
+		"""
+
+		random.seed(2)
+		symbol_list = random_symbols(2000)
+		for policy in ctw_context_tree.pruning_policies:
+			tree = ctw_context_tree.CTWContextTree(10)
+			tree.update(symbol_list)
+			log_probability = tree.root.log_probability
+			tree.set_node_budget(policy = policy)
+
+			size = tree.size()
+			self.assertEqual(tree.prune(size // 4), size - tree.size())
+			self.assertTrue(tree.size() <= size // 4)
+			self.assertAlmostEqual(tree.root.log_probability, log_probability, delta = tolerance * abs(log_probability))
+			self.assert_consistent(tree)
+
+			tree.update(random_symbols(500))
+			self.assert_consistent(tree)
+			self.assertAlmostEqual(tree.predict([0]) + tree.predict([1]), 1.0, delta = tolerance)
+		# end for
+	# end def
+
+	def test_max_bytes(self):
+		""" A budget in bytes is one in nodes of the estimated size, and measuring it changes nothing.
+		"""
+
+		tree = ctw_context_tree.CTWContextTree(8)
+		tree.update(random_symbols(100))
+		token = tree.checkpoint()
+		allocated_nodes = tree.allocated_nodes
+		free_nodes = len(tree.free_nodes)
+		journal_length = len(tree.journal)
+
+		node_bytes = tree.estimated_node_bytes()
+		self.assertTrue(node_bytes > 0)
+		self.assertEqual(tree.allocated_nodes, allocated_nodes)
+		self.assertEqual(len(tree.free_nodes), free_nodes)
+		self.assertEqual(len(tree.journal), journal_length)
+		tree.release_checkpoint(token)
+
+		tree.set_node_budget(max_bytes = 200 * node_bytes)
+		self.assertEqual(tree.max_nodes, 200)
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
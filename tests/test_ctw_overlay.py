@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that a context tree overlay simulates updates without changing the tree it overlays.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_array_context_tree, ctw_context_tree, ctw_suffix_context_tree
+
+from tests.util import random_symbols, tree_states
+
+# The difference allowed between probabilities calculated in different orders.
+tolerance = 1e-9
+
+class OverlayTest(unittest.TestCase):
+	""" An overlay must leave the base tree unchanged, and predict as the base tree would after the same updates.
+	"""
+
+	def test_overlay(self):
+		""" Simulations against overlays of each tree class, compared with a copy of the tree that learns from them.
+		"""
+
+		for tree_class in (ctw_context_tree.CTWContextTree, ctw_suffix_context_tree.CTWSuffixContextTree,
+		                   ctw_array_context_tree.CTWArrayContextTree):
+			random.seed(1)
+			tree = tree_class(8)
+			tree.update(random_symbols(1000))
+			states = tree_states(tree)
+			history = list(tree.history)
+			size = tree.size()
+
+			for simulation in xrange(0, 20):
+				overlay = ctw_context_tree.CTWContextTreeOverlay(tree)
+				expected_tree = tree_class(8)
+				expected_tree.update(history)
+				for step in xrange(0, 5):
+					symbol_list = random_symbols(2)
+					overlay.update_history(symbol_list)
+					expected_tree.update_history(symbol_list)
+
+					symbol_list = random_symbols(random.randint(1, 4))
+					overlay.update(symbol_list)
+					expected_tree.update(symbol_list)
+
+					uniform = random.random()
+					symbol, rescaled_uniform = overlay.draw_and_update(uniform)
+					expected_symbol, expected_uniform = expected_tree.draw_and_update(uniform)
+					self.assertEqual(symbol, expected_symbol)
+					self.assertAlmostEqual(rescaled_uniform, expected_uniform, delta = tolerance)
+
+					self.assertEqual(list(overlay.history), list(expected_tree.history))
+					self.assertEqual(overlay.size(), expected_tree.size())
+					for prediction in ([0], [1], [1, 0, 1]):
+						self.assertAlmostEqual(overlay.predict(prediction), expected_tree.predict(prediction),
+						                       delta = tolerance)
+					# end for
+				# end for
+
+				self.assertEqual(tree_states(tree), states)
+				self.assertEqual(list(tree.history), history)
+				self.assertEqual(tree.size(), size)
+			# end for
+		# end for
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check the drift of the array-backed context tree's predictions in single precision from those in double precision.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import math
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_array_context_tree
+
+from tests.util import random_symbols, tree_states
+
+# The largest and the mean difference allowed between the predictions in single and double precision.
+max_drift = 1e-6
+mean_drift = 1e-7
+
+class PrecisionTest(unittest.TestCase):
+	""" In single precision, the predictions must stay within `max_drift` of those in double precision,
+		however many updates the tree has seen, and reverts must restore the rounded statistics exactly.
+	"""
+
+	def test_drift(self):
+		""" The predictions of a tree of depth 16 stay close over a million updates.
+		"""
+
+		random.seed(1)
+		symbol_list = random_symbols(1000000)
+		reference = ctw_array_context_tree.CTWArrayContextTree(16)
+		tree = ctw_array_context_tree.CTWArrayContextTree(16, 'single')
+
+		drifts = []
+		for start in xrange(0, len(symbol_list), 1000):
+			reference.update(symbol_list[start:start + 1000])
+			tree.update(symbol_list[start:start + 1000])
+			drifts.append(abs(tree.predict([1]) - reference.predict([1])))
+		# end for
+
+		self.assertTrue(max(drifts) < max_drift, "The largest drift is %g." % max(drifts))
+		self.assertTrue(sum(drifts) / len(drifts) < mean_drift, "The mean drift is %g." % (sum(drifts) / len(drifts)))
+	# end def
+
+	def test_log_kt_estimate(self):
+		""" The log KT estimates calculated from the counts are those accumulated from the multipliers.
+		"""
+
+		log_kt = 0.0
+		a = b = 0
+		random.seed(2)
+		for i in xrange(0, 1000):
+			self.assertAlmostEqual(ctw_array_context_tree.log_kt_estimate(a, b), log_kt, delta = 1e-9 * max(1.0, -log_kt))
+			if random.random() < 0.3:
+				log_kt += math.log((b + 1 / 2) / (a + b + 1))
+				b += 1
+			else:
+				log_kt += math.log((a + 1 / 2) / (a + b + 1))
+				a += 1
+			# end if
+		# end for
+	# end def
+
+	def test_revert(self):
+		""" Reverting updates restores the rounded statistics exactly.
+		"""
+
+		random.seed(3)
+		tree = ctw_array_context_tree.CTWArrayContextTree(8, 'single')
+		tree.update(random_symbols(5000))
+		states = tree_states(tree)
+		for count in (1, 10, 300):
+			tree.update(random_symbols(count))
+			tree.revert(count)
+			self.assertEqual(tree_states(tree), states)
+		# end for
+	# end def
+
+	def test_sampling(self):
+		""" Sampling from the tree draws the symbols the tree in double precision does.
+		"""
+
+		random.seed(4)
+		symbol_list = random_symbols(20000)
+		reference = ctw_array_context_tree.CTWArrayContextTree(8)
+		tree = ctw_array_context_tree.CTWArrayContextTree(8, 'single')
+		reference.update(symbol_list)
+		tree.update(symbol_list)
+
+		random.seed(5)
+		expected_symbols = reference.generate_random_symbols_and_update(1000)
+		random.seed(5)
+		self.assertEqual(tree.generate_random_symbols_and_update(1000), expected_symbols)
+		self.assertAlmostEqual(tree.predict([1]), reference.predict([1]), delta = max_drift)
+	# end def
+
+	@unittest.skipIf(ctw_array_context_tree.numpy is None, "The vectorized update needs NumPy.")
+	def test_vectorized(self):
+		""" The vectorized update also calculates the stored estimates from the counts.
+		"""
+
+		random.seed(6)
+		symbol_list = random_symbols(20000)
+		reference = ctw_array_context_tree.CTWArrayContextTree(8)
+		tree = ctw_array_context_tree.CTWArrayContextTree(8, 'single')
+		tree.set_vectorized(True)
+		reference.update(symbol_list)
+		tree.update(symbol_list)
+
+		for node_state, expected_state in zip(tree_states(tree), tree_states(reference)):
+			self.assertEqual(node_state[0:2], expected_state[0:2])
+			self.assertAlmostEqual(node_state[2], expected_state[2], delta = 1e-6 * max(1.0, -expected_state[2]))
+		# end for
+		self.assertAlmostEqual(tree.predict([1]), reference.predict([1]), delta = max_drift)
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
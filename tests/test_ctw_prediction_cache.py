@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that a context tree with a prediction cache predicts as one without it.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_array_context_tree, ctw_beta_context_tree, ctw_context_tree
+from pyaixi.prediction import ctw_hashed_context_tree, ctw_suffix_context_tree
+
+from tests.util import random_symbols
+
+class PredictionCacheTest(unittest.TestCase):
+	""" A cached prediction must be the prediction the tree would calculate, however the tree got to its state:
+		by updates, reverts, changes to the history alone or rollbacks to a checkpoint.
+	"""
+
+	def assert_same_predictions(self, tree, expected_tree):
+		""" Checks that the given trees give the same predictions, several of them twice.
+		"""
+
+		for symbol_list in ([0], [1], [1, 0], [0, 1, 1], [1], [1, 0]):
+			self.assertEqual(tree.predict(symbol_list), expected_tree.predict(symbol_list))
+		# end for
+	# end def
+
+	def check_cache(self, tree_class):
+		""" Searches a tree of the given class with a small cache, and an identical tree without one,
+			then makes the same real updates and reverts to both, comparing their predictions throughout.
+		"""
+
+		random.seed(1)
+		tree = tree_class(8)
+		tree.set_prediction_cache(64)
+		expected_tree = tree_class(8)
+		symbol_list = random_symbols(300)
+		tree.update(symbol_list)
+		expected_tree.update(symbol_list)
+
+		for cycle in xrange(0, 10):
+			token = tree.checkpoint()
+			expected_token = expected_tree.checkpoint()
+			for simulation in xrange(0, 10):
+				self.assert_same_predictions(tree, expected_tree)
+				for step in xrange(0, 3):
+					symbol_list = random_symbols(2)
+					tree.update_history(symbol_list)
+					expected_tree.update_history(symbol_list)
+					self.assert_same_predictions(tree, expected_tree)
+
+					symbol_list = random_symbols(random.randint(1, 3))
+					tree.update(symbol_list)
+					expected_tree.update(symbol_list)
+					self.assert_same_predictions(tree, expected_tree)
+				# end for
+				tree.rollback(token)
+				expected_tree.rollback(expected_token)
+			# end for
+			tree.release_checkpoint(token)
+			expected_tree.release_checkpoint(expected_token)
+			self.assert_same_predictions(tree, expected_tree)
+
+			symbol_list = random_symbols(random.randint(1, 20))
+			tree.update(symbol_list)
+			expected_tree.update(symbol_list)
+			self.assert_same_predictions(tree, expected_tree)
+
+			count = random.randint(0, len(symbol_list))
+			tree.revert(count)
+			expected_tree.revert(count)
+			self.assert_same_predictions(tree, expected_tree)
+		# end for
+
+		# The searches start from the same state, so their first predictions come from the cache.
+		self.assertTrue(tree.cache_hits > 0)
+		self.assertTrue(tree.cache_evictions > 0)
+	# end def
+
+	def test_context_tree(self):
+		""" The pointer-linked tree.
+		"""
+
+		self.check_cache(ctw_context_tree.CTWContextTree)
+	# end def
+
+	def test_suffix_context_tree(self):
+		""" The suffix-addressed tree.
+		"""
+
+		self.check_cache(ctw_suffix_context_tree.CTWSuffixContextTree)
+	# end def
+
+	def test_array_context_tree(self):
+		""" The array-backed tree.
+		"""
+
+		self.check_cache(ctw_array_context_tree.CTWArrayContextTree)
+	# end def
+
+	def test_beta_context_tree(self):
+		""" The ratio-based tree.
+		"""
+
+		self.check_cache(ctw_beta_context_tree.CTWBetaContextTree)
+	# end def
+
+	def test_hashed_context_tree(self):
+		""" The hashed tree.
+		"""
+
+		self.check_cache(ctw_hashed_context_tree.CTWHashedContextTree)
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
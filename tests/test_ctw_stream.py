@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that updating a context tree from a stream gives the tree updated with the whole sequence.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_array_context_tree, ctw_context_tree
+
+from tests.util import random_symbols, tree_states
+
+def packed_symbols(symbol_list):
+	""" Returns the given symbols packed eight to a byte, least significant bit first.
+	"""
+
+	data = bytearray((len(symbol_list) + 7) // 8)
+	for i, symbol in enumerate(symbol_list):
+		data[i // 8] |= symbol << (i % 8)
+	# end for
+
+	return bytes(data)
+# end def
+
+class StreamTest(unittest.TestCase):
+	""" `update_stream()` must leave the tree `update()` does, whatever the source and the chunk size.
+	"""
+
+	def setUp(self):
+		""" Makes a sequence of whole bytes of symbols, and the tree updated with it at once.
+		"""
+
+		random.seed(1)
+		self.symbol_list = random_symbols(8 * 625)
+		self.expected_tree = ctw_context_tree.CTWContextTree(8)
+		self.expected_tree.update(self.symbol_list)
+		self.expected_states = tree_states(self.expected_tree)
+	# end def
+
+	def check_stream(self, make_source, tree_class = ctw_context_tree.CTWContextTree):
+		""" Streams the sources made by the given function into trees of the given class, with several
+			chunk sizes, checking each tree against the one updated at once.
+		"""
+
+		for chunk_size in (1, 7, 64, 1000, 10000):
+			tree = tree_class(8)
+			self.assertEqual(tree.update_stream(make_source(), chunk_size), len(self.symbol_list))
+			self.assertEqual(list(tree.history), self.symbol_list)
+			self.assertEqual(tree_states(tree), self.expected_states)
+		# end for
+	# end def
+
+	def test_list(self):
+		""" A list of symbols.
+		"""
+
+		self.check_stream(lambda: self.symbol_list)
+	# end def
+
+	def test_generator(self):
+		""" A generator of symbols, which can only be read once.
+		"""
+
+		self.check_stream(lambda: (symbol for symbol in self.symbol_list))
+	# end def
+
+	def test_bytes(self):
+		""" Packed symbols in a bytes object.
+		"""
+
+		self.check_stream(lambda: packed_symbols(self.symbol_list))
+	# end def
+
+	def test_file(self):
+		""" Packed symbols read from a binary file.
+		"""
+
+		self.check_stream(lambda: io.BytesIO(packed_symbols(self.symbol_list)))
+	# end def
+
+	def test_array_context_tree(self):
+		""" An array-backed tree gives the statistics of the one updated at once, in double precision.
+		"""
+
+		self.check_stream(lambda: self.symbol_list, ctw_array_context_tree.CTWArrayContextTree)
+	# end def
+
+	def test_callbacks(self):
+		""" Progress is reported after every chunk, and the checkpoint callback after every interval passed.
+		"""
+
+		reports = []
+		checkpoints = []
+		tree = ctw_context_tree.CTWContextTree(8)
+		tree.update_stream(self.symbol_list, 300, progress = lambda count, rate: reports.append(count),
+		                   checkpoint_interval = 1000,
+		                   checkpoint_callback = lambda tree, count: checkpoints.append((tree.history_size(), count)))
+
+		self.assertEqual(reports, [min(count, len(self.symbol_list)) for count in xrange(300, len(self.symbol_list) + 300, 300)])
+		self.assertEqual(checkpoints, [(count, count) for count in (1200, 2100, 3000, 4200, 5000)])
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check the suffix-addressed context tree against the pointer-linked context tree.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_context_tree, ctw_suffix_context_tree
+
+# The difference allowed between predictions, as updates followed by reverts round the log probabilities.
+tolerance = 1e-9
+
+class CTWSuffixContextTreeTest(unittest.TestCase):
+	""" The suffix-addressed tree must give the predictions of `CTWContextTree`, and its map of nodes
+		must stay in proportion to the tree.
+	"""
+
+	def assert_map_bounded(self, tree):
+		""" Checks that the map of nodes holds at most about twice as many nodes as the tree.
+		"""
+
+		self.assertTrue(len(tree.nodes) <= 2 * (tree.size() + tree.ghost_nodes) + tree.depth + 1)
+	# end def
+
+	def test_simulations(self):
+		""" Many simulated updates, each reverted, leave the same tree, without the map growing with them.
+		"""
+
+		random.seed(1)
+		tree = ctw_suffix_context_tree.CTWSuffixContextTree(12)
+		expected_tree = ctw_context_tree.CTWContextTree(12)
+		symbol_list = [random.randint(0, 1) for i in xrange(0, 400)]
+		tree.update(symbol_list)
+		expected_tree.update(symbol_list)
+
+		for i in xrange(0, 2000):
+			count = random.randint(1, 20)
+			tree.update([random.randint(0, 1) for j in xrange(0, count)])
+			tree.revert(count)
+			self.assert_map_bounded(tree)
+		# end for
+
+		self.assertEqual(tree.size(), expected_tree.size())
+		for symbol_list in ([0], [1], [1, 0, 1]):
+			self.assertAlmostEqual(tree.predict(symbol_list), expected_tree.predict(symbol_list), delta = tolerance)
+		# end for
+	# end def
+
+	def test_rollback(self):
+		""" Rolling back a search restores the tree, and the map is bounded again once the checkpoint is released.
+		"""
+
+		random.seed(2)
+		tree = ctw_suffix_context_tree.CTWSuffixContextTree(10)
+		expected_tree = ctw_context_tree.CTWContextTree(10)
+		symbol_list = [random.randint(0, 1) for i in xrange(0, 300)]
+		tree.update(symbol_list)
+		expected_tree.update(symbol_list)
+
+		for search in xrange(0, 5):
+			token = tree.checkpoint()
+			for i in xrange(0, 200):
+				count = random.randint(1, 15)
+				tree.update([random.randint(0, 1) for j in xrange(0, count)])
+				tree.revert(random.randint(0, count))
+				tree.rollback(token)
+			# end for
+			tree.release_checkpoint(token)
+
+			symbol_list = [random.randint(0, 1) for i in xrange(0, 10)]
+			tree.update(symbol_list)
+			expected_tree.update(symbol_list)
+			self.assert_map_bounded(tree)
+		# end for
+
+		self.assertEqual(tree.size(), expected_tree.size())
+		self.assertAlmostEqual(tree.predict([1]), expected_tree.predict([1]), delta = tolerance)
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
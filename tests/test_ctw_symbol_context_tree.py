@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that a context tree over whole symbols predicts a distribution over its alphabet, and reverts exactly.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi import util
+from pyaixi.prediction import ctw_symbol_context_tree
+
+from tests.util import random_symbols
+
+# The difference allowed between a sum of probabilities and one.
+tolerance = 1e-9
+
+def symbol_tree_states(tree):
+	""" Returns the statistics of every node of the given symbol tree, in preorder, with the context symbol
+		leading to each node.
+	"""
+
+	states = []
+	stack = [(None, tree.root)]
+	while len(stack) > 0:
+		symbol, node = stack.pop()
+		states.append((symbol, sorted(node.symbol_count.items()), node.visit_count, node.log_kt,
+		               node.log_probability, node.log_children))
+		stack.extend(sorted(node.children.items()))
+	# end while
+
+	return states
+# end def
+
+def random_percepts(count, symbol_bits):
+	""" Returns the bits of the given number of percepts of the given number of bits, of which only a few
+		values occur, as with the agent's percepts.
+	"""
+
+	values = [random.randrange(1 << symbol_bits) for i in xrange(0, 4)]
+	symbol_list = []
+	for i in xrange(0, count):
+		symbol_list.extend(util.encode(random.choice(values), symbol_bits))
+	# end for
+	return symbol_list
+# end def
+
+class SymbolContextTreeTest(unittest.TestCase):
+	""" With either prior, the predictions over the alphabet must sum to one, and updates followed by
+		reverts or rollbacks must leave the tree exactly as it was.
+	"""
+
+	def assert_normalised(self, tree):
+		""" Checks that the predictions of every symbol of the alphabet sum to one, and are those of the distribution.
+		"""
+
+		distribution = tree.predict_distribution(tree.symbol_bits)
+		self.assertEqual(len(distribution), tree.alphabet_size)
+		self.assertAlmostEqual(sum(distribution), 1.0, delta = tolerance)
+		for symbol in xrange(0, tree.alphabet_size):
+			self.assertAlmostEqual(tree.predict(util.encode(symbol, tree.symbol_bits)), distribution[symbol],
+			                       delta = tolerance)
+		# end for
+	# end def
+
+	def check_prior(self, prior):
+		""" Updates trees with the given prior with percepts and actions, checking their predictions, and that
+			updates followed by reverts, or rolled back, restore each tree.
+		"""
+
+		for symbol_bits in (1, 3):
+			random.seed(1)
+			tree = ctw_symbol_context_tree.CTWSymbolContextTree(4, symbol_bits, prior)
+			self.assert_normalised(tree)
+			for cycle in xrange(0, 40):
+				tree.update_history(random_symbols(2))
+				tree.update(random_percepts(random.randint(1, 3), symbol_bits))
+				self.assert_normalised(tree)
+
+				states = symbol_tree_states(tree)
+				history = (list(tree.history), list(tree.history_widths), list(tree.history_updates))
+				size = tree.size()
+				history_size = tree.history_size()
+
+				symbol_list = random_percepts(random.randint(1, 5), symbol_bits)
+				tree.update(symbol_list)
+				tree.revert(len(symbol_list))
+				self.assertEqual(symbol_tree_states(tree), states)
+				self.assertEqual(tree.size(), size)
+
+				token = tree.checkpoint()
+				for simulation in xrange(0, 3):
+					tree.update_history(random_symbols(2))
+					tree.generate_random_symbols_and_update(symbol_bits)
+				# end for
+				tree.rollback(token)
+				tree.release_checkpoint(token)
+				self.assertEqual(symbol_tree_states(tree), states)
+				self.assertEqual((list(tree.history), list(tree.history_widths), list(tree.history_updates)), history)
+				self.assertEqual(tree.size(), size)
+				self.assertEqual(tree.history_size(), history_size)
+			# end for
+			self.assertEqual(tree.size(), tree.root.size())
+		# end for
+	# end def
+
+	def test_kt_prior(self):
+		""" The multi-alphabet KT estimator.
+		"""
+
+		self.check_prior('kt')
+	# end def
+
+	def test_sparse_prior(self):
+		""" The estimator with a pseudo-count of one over the size of the alphabet.
+		"""
+
+		self.check_prior('sparse')
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
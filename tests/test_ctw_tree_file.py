@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that context trees saved to tree files load back unchanged.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+from pyaixi.prediction import ctw_array_context_tree, ctw_context_tree, ctw_mmap_context_tree
+from pyaixi.prediction import ctw_suffix_context_tree, ctw_tree_file
+
+from tests.util import random_symbols, tree_states
+
+class TreeFileTest(unittest.TestCase):
+	""" A loaded tree must have the saved tree's nodes, the end of its history and its predictions,
+		and go on learning as the saved tree does.
+	"""
+
+	def setUp(self):
+		""" Makes a directory for the tree files.
+		"""
+
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'tree.ctw')
+	# end def
+
+	def tearDown(self):
+		""" Removes the tree files.
+		"""
+
+		shutil.rmtree(self.directory)
+	# end def
+
+	def assert_same_tree(self, tree, expected_tree):
+		""" Checks that the given trees have the same nodes, the same end of the history and the same predictions.
+		"""
+
+		self.assertEqual(tree.depth, expected_tree.depth)
+		self.assertEqual(tree.size(), expected_tree.size())
+		self.assertEqual(list(tree.history)[-tree.depth:], list(expected_tree.history)[-tree.depth:])
+		self.assertEqual(tree_states(tree), tree_states(expected_tree))
+		for symbol_list in ([0], [1], [1, 0, 1]):
+			self.assertEqual(tree.predict(symbol_list), expected_tree.predict(symbol_list))
+		# end for
+	# end def
+
+	def check_round_trip(self, expected_tree, tree_classes):
+		""" Saves the given tree, and checks the trees of each of the given classes loaded from the file,
+			before and after they and the saved tree are updated with the same symbols.
+		"""
+
+		ctw_tree_file.save_tree(expected_tree, self.path)
+		trees = [ctw_tree_file.load_tree(self.path, tree_class) for tree_class in tree_classes]
+		for tree in trees:
+			self.assert_same_tree(tree, expected_tree)
+		# end for
+
+		symbol_list = random_symbols(300)
+		expected_tree.update(symbol_list)
+		for tree in trees:
+			tree.update(symbol_list)
+			self.assert_same_tree(tree, expected_tree)
+		# end for
+	# end def
+
+	def test_context_tree(self):
+		""" A pointer-linked tree, after reverts, loaded by each class that can load it.
+		"""
+
+		random.seed(1)
+		tree = ctw_context_tree.CTWContextTree(8)
+		tree.update(random_symbols(2000))
+		tree.revert(100)
+		self.check_round_trip(tree, (ctw_context_tree.CTWContextTree, ctw_suffix_context_tree.CTWSuffixContextTree,
+		                             ctw_array_context_tree.CTWArrayContextTree))
+	# end def
+
+	def test_suffix_context_tree(self):
+		""" A suffix-addressed tree.
+		"""
+
+		random.seed(2)
+		tree = ctw_suffix_context_tree.CTWSuffixContextTree(8)
+		tree.update(random_symbols(2000))
+		self.check_round_trip(tree, (ctw_suffix_context_tree.CTWSuffixContextTree, ctw_context_tree.CTWContextTree))
+	# end def
+
+	def test_array_context_tree(self):
+		""" An array-backed tree, whose released records aren't saved.
+		"""
+
+		random.seed(3)
+		tree = ctw_array_context_tree.CTWArrayContextTree(8)
+		tree.update(random_symbols(2000))
+		tree.revert(100)
+		self.assertTrue(len(tree.free_nodes) > 0)
+		self.check_round_trip(tree, (ctw_array_context_tree.CTWArrayContextTree, ctw_context_tree.CTWContextTree))
+	# end def
+
+	def test_pruned_tree(self):
+		""" A tree kept to a node budget, with the log probabilities of its pruned subtrees.
+		"""
+
+		random.seed(4)
+		tree = ctw_context_tree.CTWContextTree(10)
+		tree.set_node_budget(max_nodes = 200)
+		tree.update(random_symbols(2000))
+		self.assertTrue(tree.pruned_nodes > 0)
+
+		# The budget isn't saved, so the loaded trees grow without it.
+		tree.set_node_budget()
+		self.check_round_trip(tree, (ctw_context_tree.CTWContextTree, ctw_suffix_context_tree.CTWSuffixContextTree))
+	# end def
+
+	def test_copy_on_write(self):
+		""" A memory-mapped tree opened on a saved tree with `copy_on_write` has its nodes, and learns
+			without changing the file.
+		"""
+
+		random.seed(5)
+		expected_tree = ctw_context_tree.CTWContextTree(8)
+		expected_tree.update(random_symbols(2000))
+		ctw_tree_file.save_tree(expected_tree, self.path)
+		with open(self.path, 'rb') as tree_file:
+			data = tree_file.read()
+		# end with
+
+		tree = ctw_mmap_context_tree.CTWMmapContextTree(8, self.path, copy_on_write = True)
+		try:
+			self.assert_same_tree(tree, expected_tree)
+
+			symbol_list = random_symbols(300)
+			tree.update(symbol_list)
+			expected_tree.update(symbol_list)
+			self.assert_same_tree(tree, expected_tree)
+		finally:
+			tree.close()
+		# end try
+
+		with open(self.path, 'rb') as tree_file:
+			self.assertEqual(tree_file.read(), data)
+		# end with
+	# end def
+# end class
+
+if __name__ == "__main__":
+	unittest.main()
+# end if
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Helper functions for the context tree tests.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+
+# Ensure xrange is defined on Python 3.
+from six.moves import xrange
+
+def random_symbols(count, probability = 0.3):
+	""" Returns a list of `count` random symbols, each 1 with the given probability,
+		and otherwise the symbol before it, so that longer contexts are worth learning.
+	"""
+
+	symbol_list = []
+	previous = 0
+	for i in xrange(0, count):
+		previous = 1 if random.random() < probability else previous ^ (random.random() < 0.2)
+		symbol_list.append(int(previous))
+	# end for
+
+	return symbol_list
+# end def
+
+def tree_states(tree):
+	""" Returns the statistics of every node of the given context tree, with the weighted log probability
+		of any children pruned from it, in preorder, found through the tree's `predict()` keys.
+		(See `CTWContextTree.query_state()`.)
+	"""
+
+	states = []
+	stack = [tree.query_root()]
+	while len(stack) > 0:
+		key = stack.pop()
+		states.append(tuple(tree.query_state(key)) + (tree.query_pruned_log_probability(key),))
+		for symbol in (1, 0):
+			child_key = tree.query_child_key(key, symbol)
+			if type(child_key) != tuple:
+				stack.append(child_key)
+			# end if
+		# end for
+	# end while
+
+	return states
+# end def